@@ -4,25 +4,110 @@ except Exception as e:
 result['error'] = f'Failed to open workbook: {e}'
 return result
 """
+import math
 import zipfile
 import re
+from concurrent.futures import ProcessPoolExecutor
 from collections import Counter
-from typing import Dict, Any, List
-import openpyxl
+from typing import Dict, Any, List, Tuple
 
+from formula_graph import analyze_formula_graph
+from package_sizes import size_attribution
+from part_cache import PartCache
+from pivot_caches import analyze_pivot_caches
+from profiling import NULL_PROFILER, profiled_call
+from progress import Cancelled, notify
+from quick_scan import ScanBudget, sample_sheet_part
+from result_index import ResultIndex, options_key
+from shared_strings import analyze_shared_strings
+from styles_analysis import analyze_styles
+from sheet_scanner import (SCANNER_VERSION, VOLATILE_FUNCS, VOLATILE_REGEX, merge_bitmaps,
+                           scan_sheet_part)
+from xlsx_package import workbook_sheets
 
-VOLATILE_FUNCS = {'NOW', 'TODAY', 'INDIRECT', 'OFFSET', 'RAND', 'RANDBETWEEN'}
-VOLATILE_REGEX = re.compile(r"\b(" + "|".join(VOLATILE_FUNCS) + r")\b", re.IGNORECASE)
 FORMULA_REGEX = re.compile(r"^=.*")
 
-def analyze_xlsx(path: str) -> Dict[str, Any]:
-    result: Dict[str, Any] = {'path': path}
+# 'stream' reads the sheet XML incrementally (constant memory);
+# 'openpyxl' loads the full object model and is kept as a fallback.
+ENGINES = ('stream', 'openpyxl')
+
+# per-sheet estimated field -> workbook total it adds up to
+ESTIMATE_TOTALS = {
+    'cells': 'total_cells_scanned_estimate',
+    'formulas': 'total_formulas',
+    'volatile_formulas': 'total_volatile_formulas',
+}
+# per-sheet conditional formatting / data validation count -> workbook total
+RULE_TOTALS = {
+    'cf_rules': 'total_cf_rules',
+    'cf_ranges': 'total_cf_ranges',
+    'cf_duplicate_rules': 'total_cf_duplicate_rules',
+    'data_validations': 'total_data_validations',
+    'dv_ranges': 'total_dv_ranges',
+}
+
+
+def analyze_xlsx(path: str, engine: str = 'stream', workers: int = 1,
+                 cache_path: str = None, formula_graph: bool = False,
+                 profiler=None, progress=None, time_budget: float = None,
+                 cell_budget: int = None, index_path: str = None,
+                 column_profile: bool = False) -> Dict[str, Any]:
+    """
+    workers > 1 scans the worksheet parts in a process pool (stream engine
+    only); the merged result is identical to a serial run.
+    cache_path points at a PartCache database: worksheet parts whose zip
+    CRC/size are already cached are not re-parsed (stream engine only);
+    pivot record counts are kept there too.
+    result['pivot_caches'] lists every pivot cache with the size of its
+    records part and a streamed record count (see pivot_caches.py; kept
+    in the part cache). Quick scans only report the declared count.
+    formula_graph adds result['formula_graph'] (see formula_graph.py):
+    volatile closure, longest dependency chain and hotspot cells.
+    column_profile adds info['columns'] to every worksheet (see
+    column_profile.py: per-column value types, numbers stored as text,
+    error values, long text) with sheet totals in info['column_issues'];
+    it needs NumPy, which is only imported then. The stream engine
+    profiles during its sheet scan (of a quick scan: the sampled rows).
+    profiler (profiling.Profiler) records every phase and per-sheet scan;
+    its summary is attached as result['profile'].
+    progress (see progress.py) receives 'start' {sheets_total, cached},
+    'chunk' {sheet, cells so far} while a sheet is parsed (serial scans
+    only), 'sheet' {sheet, cells} once it is done and 'phase' {phase};
+    raising progress.Cancelled from it stops the analysis.
+    time_budget (seconds) / cell_budget switch to a quick scan (stream
+    engine, serial, uncached; see quick_scan.py): large sheets are sampled
+    and their counts extrapolated. Extrapolated figures are listed in
+    result['error_bounds'] (95 % bound) and per sheet in
+    info['error_bounds'], with result['estimated'] = True; a sheet the
+    time budget cut short has no valid bound, and then
+    result['bounds_valid'] is False.
+    index_path points at a ResultIndex database (see result_index.py): a
+    byte-identical workbook analyzed before with the same engine /
+    formula_graph is answered from it (result['index']['hit'] = True)
+    without scanning; other results are added to it. Quick scans bypass it.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f'Unknown engine {engine!r}, expected one of {ENGINES}')
+    quick = time_budget is not None or cell_budget is not None
+    if quick and engine != 'stream':
+        raise ValueError('time_budget / cell_budget need the stream engine')
 
+    prof = profiler or NULL_PROFILER
+    options = options_key(engine, formula_graph, column_profile)
+    if index_path and not quick:
+        with prof.phase('index_lookup'), ResultIndex(index_path) as index:
+            hit = index.lookup(path, options)
+        if hit is not None:
+            if profiler:
+                hit['profile'] = profiler.summary()
+            return hit
+    result: Dict[str, Any] = {'path': path}
 
     # 1) Quick structure check
     try:
-        with zipfile.ZipFile(path, 'r') as z:
-            namelist = z.namelist()
+        with prof.phase('zip_listing'), zipfile.ZipFile(path, 'r') as z:
+            infos = z.infolist()
+            namelist = [i.filename for i in infos]
             result['zip_entry_count'] = len(namelist)
             # media files
             media = [n for n in namelist if n.startswith('xl/media/')]
@@ -30,14 +115,289 @@ def analyze_xlsx(path: str) -> Dict[str, Any]:
             # external links
             ext_links = [n for n in namelist if 'externalLinks' in n]
             result['external_links_count'] = len(ext_links)
+            # bytes per part / category, from the central directory only
+            result['package_sizes'] = size_attribution(infos)
     except zipfile.BadZipFile:
         result['error'] = 'BadZipFile: not a valid xlsx'
+        if profiler:
+            result['profile'] = profiler.summary()
+        return result
+
+    if engine == 'openpyxl':
+        result = _analyze_openpyxl(path, result, prof, progress)
+    else:
+        budget = ScanBudget(time_budget, cell_budget) if quick else None
+        result = _analyze_stream(path, result, workers, cache_path, prof, progress, budget,
+                                 column_profile)
+    if 'sheets' in result:
+        for field, total in RULE_TOTALS.items():
+            result[total] = sum(info.get(field, 0) for info in result['sheets'].values())
+
+    if 'error' not in result:
+        notify(progress, 'phase', phase='pivot_caches')
+        try:
+            with prof.phase('pivot_caches'), zipfile.ZipFile(path, 'r') as z:
+                if cache_path and not quick:
+                    with PartCache(cache_path) as cache:
+                        result['pivot_caches'] = analyze_pivot_caches(z, part_cache=cache)
+                else:
+                    result['pivot_caches'] = analyze_pivot_caches(z, count=not quick)
+            result['pivot_records_bytes'] = sum(c['records_bytes'] for c in result['pivot_caches'])
+        except Exception as e:
+            result['pivot_caches'] = {'error': f'Failed to read pivot caches: {e}'}
+
+    if formula_graph and 'error' not in result:
+        notify(progress, 'phase', phase='formula_graph')
+        try:
+            with prof.phase('formula_graph'):
+                result['formula_graph'] = analyze_formula_graph(path)
+        except Exception as e:
+            result['formula_graph'] = {'error': f'Failed to build formula graph: {e}'}
+    if column_profile and 'error' not in result and 'column_profile' not in result:
+        notify(progress, 'phase', phase='column_profile')
+        try:
+            with prof.phase('column_profile'):
+                _add_column_profiles(path, result)
+        except Cancelled:
+            raise
+        except Exception as e:
+            result['column_profile'] = {'error': f'Failed to profile columns: {e}'}
+    if index_path and not quick and 'error' not in result:
+        with prof.phase('index_store'), ResultIndex(index_path) as index:
+            index.put(path, result, options)
+    if profiler:
+        result['profile'] = profiler.summary()
+    return result
+
+
+def _add_column_profiles(path: str, result: Dict[str, Any]):
+    # NumPy is imported here so a plain analysis never loads it
+    from column_profile import column_issues, profile_columns
+    sheets = result.get('sheets') or {}
+    missing = [name for name, info in sheets.items() if 'columns' not in info]
+    if missing:
+        # not profiled by the scan (openpyxl engine): one more pass
+        for name, columns in profile_columns(path, missing).items():
+            sheets[name]['columns'] = columns
+    totals = Counter()
+    for info in sheets.values():
+        if 'columns' in info:
+            info['column_issues'] = column_issues(info['columns'])
+            totals.update(info['column_issues'])
+    result['column_issues'] = {key: totals[key] for key in column_issues({})}
+
+
+def _string_table(path: str):
+    """column_profile.shared_string_table() of `path`, for the sheet scans."""
+    from column_profile import shared_string_table
+    with zipfile.ZipFile(path, 'r') as z:
+        return shared_string_table(z)
+
+
+def _chunk_progress(progress, name: str):
+    if progress is None:
+        return None
+    return lambda scanner: notify(progress, 'chunk', sheet=name, cells=scanner.cells)
+
+
+def _scan_worksheets(path: str, worksheets: List[Dict[str, str]], workers: int,
+                     prof=NULL_PROFILER, progress=None, budget=None,
+                     string_table=None) -> List[Tuple[Dict[str, str], Any]]:
+    """
+    Returns [(sheet, (info, counters))] in tab order. The first sheet that
+    fails is returned with its exception in place of the results and
+    scanning stops there, exactly like a serial run. Cancelled raised by
+    `progress` is not a sheet failure and propagates. With a `budget`
+    (quick_scan.ScanBudget) sheets are sampled, always serially. A
+    string_table (column_profile.shared_string_table()) profiles the columns.
+    """
+    outcomes = []
+    if workers <= 1 or len(worksheets) <= 1 or budget is not None:
+        for sheet in worksheets:
+            on_chunk = _chunk_progress(progress, sheet['name'])
+            try:
+                with prof.phase('scan_sheet', sheet=sheet['name']):
+                    if budget is None:
+                        outcome = scan_sheet_part(path, sheet['part'], on_chunk, string_table)
+                    else:
+                        outcome = sample_sheet_part(path, sheet['part'], budget, on_chunk, string_table)
+            except Cancelled:
+                raise
+            except Exception as e:
+                outcomes.append((sheet, e))
+                break
+            outcomes.append((sheet, outcome))
+            notify(progress, 'sheet', sheet=sheet['name'], cells=outcome[1]['cells'])
+        return outcomes
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(worksheets))) as pool:
+        if prof.enabled:
+            # measured inside the worker; the parent only sees the wait
+            futures = [pool.submit(profiled_call, prof.memory, scan_sheet_part, path, sheet['part'],
+                                   None, string_table)
+                       for sheet in worksheets]
+        else:
+            futures = [pool.submit(scan_sheet_part, path, sheet['part'], None, string_table)
+                       for sheet in worksheets]
+        for sheet, future in zip(worksheets, futures):
+            try:
+                outcome = future.result()
+                if prof.enabled:
+                    outcome, record = outcome
+                    prof.add('scan_sheet', record, sheet=sheet['name'])
+                outcomes.append((sheet, outcome))
+                notify(progress, 'sheet', sheet=sheet['name'], cells=outcome[1]['cells'])
+            except Cancelled:
+                for pending in futures:
+                    pending.cancel()
+                raise
+            except Exception as e:
+                outcomes.append((sheet, e))
+                for pending in futures:
+                    pending.cancel()
+                break
+    return outcomes
+
+
+def _analyze_stream(path: str, result: Dict[str, Any], workers: int = 1,
+                    cache_path: str = None, prof=NULL_PROFILER, progress=None,
+                    budget=None, column_profile: bool = False) -> Dict[str, Any]:
+    """
+    Workbook-level analysis straight from the sheet XML.
+    'total_cells_scanned_estimate' counts the stored <c> elements.
+    """
+    try:
+        with prof.phase('read_workbook'), zipfile.ZipFile(path, 'r') as z:
+            declared = workbook_sheets(z)
+            members = {i.filename: (i.CRC, i.file_size) for i in z.infolist()}
+    except Exception as e:
+        result['error'] = f'Failed to open workbook: {e}'
         return result
 
+    worksheets = [s for s in declared if s['type'] == 'worksheet' and s['part'] in members]
+    if budget is not None:
+        budget.total_bytes = budget.bytes_left = sum(members[s['part']][1] for s in worksheets)
+        cache_path = None  # estimates must not end up in the cache
+
+    result['sheet_count'] = len(declared)
+    sheets = {}
+    total_cells = 0
+    total_formulas = 0
+    total_volatile = 0
+    merged_cells_count = 0
+    style_refs = Counter()
+    string_refs = []
+    string_cells = 0
+    squared_bounds = Counter()
+
+    string_table = None
+    if column_profile:
+        try:
+            with prof.phase('column_profile_strings'):
+                string_table = _string_table(path)
+        except Exception as e:
+            result['column_profile'] = {'error': f'Failed to profile columns: {e}'}
+    # profiled scans are cached apart from plain ones
+    version = SCANNER_VERSION + ('+column_profile' if string_table is not None else '')
+
+    outcomes = {}
+    cache = PartCache(cache_path) if cache_path else None
+    try:
+        if cache:
+            with prof.phase('cache_lookup'):
+                for sheet in worksheets:
+                    hit = cache.get(sheet['part'], *members[sheet['part']], version)
+                    if hit is not None:
+                        outcomes[sheet['part']] = tuple(hit)
+
+        to_scan = [s for s in worksheets if s['part'] not in outcomes]
+        notify(progress, 'start', sheets_total=len(worksheets), cached=len(worksheets) - len(to_scan))
+        for sheet, outcome in _scan_worksheets(path, to_scan, workers, prof, progress, budget, string_table):
+            outcomes[sheet['part']] = outcome
+            if cache and not isinstance(outcome, Exception):
+                cache.put(sheet['part'], *members[sheet['part']], version, outcome)
+    finally:
+        if cache:
+            result['cache'] = cache.summary()
+            cache.close()
+
+    for sheet in worksheets:
+        outcome = outcomes[sheet['part']]
+        if isinstance(outcome, Exception):
+            result['error'] = f"Failed to read sheet {sheet['name']}: {outcome}"
+            return result
+        info, counters = outcome
+
+        total_cells += counters['cells']
+        total_formulas += info['formulas']
+        total_volatile += info['volatile_formulas']
+        merged_cells_count += info['merged_cells']
+        style_refs.update(counters['styles'])
+        string_refs.append(counters['strings'])
+        string_cells += counters['string_cells']
+        sheets[sheet['name']] = info
+        for field, total in ESTIMATE_TOTALS.items():
+            squared_bounds[total] += info.get('error_bounds', {}).get(field, 0) ** 2
+
+    result.update({
+        'total_cells_scanned_estimate': total_cells,
+        'total_formulas': total_formulas,
+        'total_volatile_formulas': total_volatile,
+        'total_merged_cells': merged_cells_count,
+        'sheets': sheets,
+    })
+    estimated = any(info.get('estimated') for info in sheets.values())
+    if budget is not None:
+        result['estimated'] = estimated
+        result['budget'] = {'seconds': budget.seconds, 'cells': budget.cells,
+                            'elapsed_seconds': round(budget.elapsed(), 3)}
+    if estimated:
+        # independent per-sheet bounds add in quadrature
+        result['error_bounds'] = {total: math.ceil(math.sqrt(squared_bounds[total]))
+                                  for total in ESTIMATE_TOTALS.values()}
+        result['bounds_valid'] = all(info['sample']['bound_valid'] for info in sheets.values()
+                                     if info.get('estimated'))
+        if any(info['sample']['unavailable'] for info in sheets.values() if info.get('estimated')):
+            # sheets stopped before their tail add nothing to these
+            result['incomplete_totals'] = ['total_merged_cells'] + list(RULE_TOTALS.values())
+
+    notify(progress, 'phase', phase='styles')
+    try:
+        with prof.phase('styles'), zipfile.ZipFile(path, 'r') as z:
+            result['styles'] = analyze_styles(z, style_refs)
+        if estimated:
+            # referenced / unused formats come from the sampled cells only
+            result['styles']['estimated'] = True
+    except KeyError:
+        pass  # no styles part
+    except Exception as e:
+        result['styles'] = {'error': f'Failed to read styles: {e}'}
+
+    if budget is not None:
+        return result  # the sst is not sampled; quick scans leave it out
+
+    notify(progress, 'phase', phase='shared_strings')
+    try:
+        with prof.phase('shared_strings'), zipfile.ZipFile(path, 'r') as z:
+            sst = analyze_shared_strings(z, merge_bitmaps(string_refs), string_cells)
+        if sst is not None:
+            result['shared_strings'] = sst
+    except Exception as e:
+        result['shared_strings'] = {'error': f'Failed to read shared strings: {e}'}
+
+    return result
+
+
+def _analyze_openpyxl(path: str, result: Dict[str, Any], prof=NULL_PROFILER,
+                      progress=None) -> Dict[str, Any]:
+    with prof.phase('import_openpyxl'):
+        import openpyxl
 
-# 2) Workbook-level analysis with openpyxl
+    # 2) Workbook-level analysis with openpyxl
+    notify(progress, 'phase', phase='load_workbook')
     try:
-        wb = openpyxl.load_workbook(path, data_only=False, read_only=False)
+        with prof.phase('load_workbook'):
+            wb = openpyxl.load_workbook(path, data_only=False, read_only=False)
     except Exception as e:
         result['error'] = f'Failed to open workbook: {e}'
         return result
@@ -51,9 +411,10 @@ def analyze_xlsx(path: str) -> Dict[str, Any]:
     style_counter = Counter()
     merged_cells_count = 0
 
-
+    notify(progress, 'start', sheets_total=len(wb.sheetnames), cached=0)
     for sheetname in wb.sheetnames:
         ws = wb[sheetname]
+        cells_before = total_cells
         info = {
             'max_row': ws.max_row,
             'max_column': ws.max_column,
@@ -63,8 +424,26 @@ def analyze_xlsx(path: str) -> Dict[str, Any]:
             'hidden_rows': 0,
             'hidden_columns': 0,
             'unique_styles': 0,
+            'dimension': '',
+            'data_max_row': 0,
+            'data_max_column': 0,
+            'wasted_rows': 0,
+            'wasted_columns': 0,
         }
 
+        # conditional formatting / data validation (no duplicate detection here)
+        try:
+            formats = list(ws.conditional_formatting)
+            validations = ws.data_validations.dataValidation
+            info.update({
+                'conditional_formats': len(formats),
+                'cf_rules': sum(len(cf.rules) for cf in formats),
+                'cf_ranges': sum(len(cf.sqref.ranges) for cf in formats),
+                'data_validations': len(validations),
+                'dv_ranges': sum(len(dv.sqref.ranges) for dv in validations),
+            })
+        except Exception:
+            pass
 
         # hidden rows/cols
         try:
@@ -78,26 +457,37 @@ def analyze_xlsx(path: str) -> Dict[str, Any]:
 
 
     # iterate cells (careful: can be slow on huge files)
-        for row in ws.iter_rows():
-            for cell in row:
-                total_cells += 1
-                # style
-                try:
-                    if cell.has_style:
-                        styles_in_sheet.add((cell.font, cell.fill, cell.border, cell.number_format, cell.alignment))
-                except Exception:
-                    pass
-                # formula
-                if cell.data_type == 'f' or (isinstance(cell.value, str) and FORMULA_REGEX.match(cell.value)):
-                    info['formulas'] += 1
-                    total_formulas += 1
-                    val = cell.value if cell.value else ''
-                    if VOLATILE_REGEX.search(str(val)):
-                        info['volatile_formulas'] += 1
-                        total_volatile += 1
+        with prof.phase('cell_loop', sheet=sheetname):
+            for row in ws.iter_rows():
+                for cell in row:
+                    total_cells += 1
+                    if cell.value is not None:
+                        info['data_max_row'] = max(info['data_max_row'], cell.row)
+                        info['data_max_column'] = max(info['data_max_column'], cell.column)
+                    # style
+                    try:
+                        if cell.has_style:
+                            styles_in_sheet.add(cell.style_id)
+                    except Exception:
+                        pass
+                    # formula
+                    if cell.data_type == 'f' or (isinstance(cell.value, str) and FORMULA_REGEX.match(cell.value)):
+                        info['formulas'] += 1
+                        total_formulas += 1
+                        val = cell.value if cell.value else ''
+                        if VOLATILE_REGEX.search(str(val)):
+                            info['volatile_formulas'] += 1
+                            total_volatile += 1
 
 
+        notify(progress, 'sheet', sheet=sheetname, cells=total_cells - cells_before)
         info['unique_styles'] = len(styles_in_sheet)
+        # same definition as the stream engine: merged ranges are kept
+        merges = list(ws.merged_cells.ranges) if hasattr(ws, 'merged_cells') else []
+        keep_row = max([info['data_max_row']] + [m.max_row for m in merges])
+        keep_col = max([info['data_max_column']] + [m.max_col for m in merges])
+        info['wasted_rows'] = info['max_row'] - keep_row
+        info['wasted_columns'] = info['max_column'] - keep_col
         info['merged_cells'] = info['merged_cells']
         merged_cells_count += info['merged_cells']
         sheets[sheetname] = info
@@ -118,8 +508,9 @@ def analyze_xlsx(path: str) -> Dict[str, Any]:
 if __name__ == '__main__':
     import sys, json
     if len(sys.argv) < 2:
-        print('Usage: python analyzer.py <file.xlsx>')
+        print('Usage: python analyzer.py <file.xlsx> [stream|openpyxl]')
         sys.exit(1)
     path = sys.argv[1]
-    res = analyze_xlsx(path)
+    engine = sys.argv[2] if len(sys.argv) > 2 else 'stream'
+    res = analyze_xlsx(path, engine)
     print(json.dumps(res, indent=2))
\ No newline at end of file
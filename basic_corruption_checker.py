@@ -1,9 +1,26 @@
 """basic_corruption_checker.py
 Quick check whether an XLSX file is a valid ZIP container and verifies core parts exist.
+
+Checks come in three levels, each including the previous one:
+  quick - central directory readable, CORE_FILES present (no decompression)
+  crc   - CRC-32 of every member verified, spread over a thread pool
+          (zlib releases the GIL, so members really decompress in parallel)
+  deep  - every XML part streamed through a parser for well-formedness,
+          every internal relationship target checked for existence
+Every level stops at the first fatal finding.
 """
 
-import zipfile
+import os
 import sys
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+from xml.parsers import expat
+
+from profiling import NULL_PROFILER
+from xlsx_package import read_relationships, source_part_of
 
 CORE_FILES = [
     'xl/workbook.xml',
@@ -12,38 +29,196 @@ CORE_FILES = [
     'xl/styles.xml',
 ]
 
+CHECK_LEVELS = ('quick', 'crc', 'deep')
+XML_EXTENSIONS = ('.xml', '.rels', '.vml')
+CHUNK_SIZE = 1 << 20
+
+
+def _finding(severity: str, code: str, message: str, part: str = None) -> Dict[str, Any]:
+    return {'severity': severity, 'code': code, 'part': part, 'message': message}
+
+
+def _verify_member(path: str, name: str, parse_xml: bool, local: threading.local,
+                   abort: threading.Event, opened: list) -> Optional[Dict[str, Any]]:
+    """Decompress one member (CRC is checked by zipfile at EOF); optionally parse it."""
+    if abort.is_set():
+        return None
+    # one handle per thread so reads don't serialise on a shared file lock
+    z = getattr(local, 'zip', None)
+    if z is None:
+        z = local.zip = zipfile.ZipFile(path, 'r')
+        opened.append(z)
+
+    parser = None
+    if parse_xml and name.lower().endswith(XML_EXTENSIONS):
+        parser = expat.ParserCreate()
+    try:
+        with z.open(name) as f:
+            while True:
+                if abort.is_set():
+                    return None
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if parser is not None:
+                    parser.Parse(chunk, False)
+        if parser is not None:
+            parser.Parse(b'', True)
+    except expat.ExpatError as e:
+        return _finding('fatal', 'malformed_xml', f'XML not well-formed: {e}', name)
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, zlib.error, EOFError, OSError, RuntimeError) as e:
+        return _finding('fatal', 'bad_member', f'Bad file entry detected: {name} ({e})', name)
+    except NotImplementedError as e:
+        return _finding('fatal', 'unsupported_compression', str(e), name)
+    return None
+
 
-def check_excel_corruption(path: str) -> str:
+def _check_members(path: str, names: List[str], parse_xml: bool, workers: int) -> Tuple[Optional[Dict[str, Any]], int]:
     """
-    Returns a human-readable message only (string),
-    compatible with GUI output.
+    Returns (first fatal finding or None, number of members fully checked).
+    Results are taken as they complete, so a fatal member stops the rest
+    without waiting for slower members submitted before it.
     """
+    local = threading.local()
+    abort = threading.Event()
+    opened = []
+    checked = 0
+    fatal = None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_verify_member, path, n, parse_xml, local, abort, opened)
+                       for n in names]
+            for future in as_completed(futures):
+                finding = future.result()
+                if finding is not None:
+                    fatal = finding
+                    abort.set()
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                checked += 1
+    finally:
+        for z in opened:
+            z.close()
+    return fatal, checked
+
+
+def _check_relationships(z: zipfile.ZipFile, names: set) -> Optional[Dict[str, Any]]:
+    for rels_name in sorted(n for n in names if n.endswith('.rels')):
+        source = source_part_of(rels_name)
+        for rid, (rel_type, target) in read_relationships(z, source, internal_only=True).items():
+            if not target or target.startswith('#'):
+                continue
+            if target not in names and target + '/' not in names:
+                return _finding('fatal', 'missing_rel_target',
+                                f'{rels_name} {rid} points at missing part {target}', rels_name)
+    return None
+
+
+def check_excel_integrity(path: str, level: str = 'quick', workers: int = None,
+                          profiler=None) -> Dict[str, Any]:
+    """
+    Structured integrity check.
+
+    Returns {'path', 'level', 'status': OK|WARNING|CORRUPT|ERROR, 'ok',
+             'members', 'members_checked', 'findings': [...]} where each
+    finding has 'severity' (fatal / warning), 'code', 'part', 'message'.
+    With a profiler (profiling.Profiler) its summary is added as 'profile'.
+    """
+    if level not in CHECK_LEVELS:
+        raise ValueError(f'Unknown check level {level!r}, expected one of {CHECK_LEVELS}')
+
+    result: Dict[str, Any] = {'path': path, 'level': level, 'members': 0,
+                              'members_checked': 0, 'findings': []}
+    findings = result['findings']
+    prof = profiler or NULL_PROFILER
+
     try:
         with zipfile.ZipFile(path, 'r') as z:
-            bad = z.testzip()
-            if bad is not None:
-                return f"[CORRUPT] Bad file entry detected: {bad}"
+            with prof.phase('zip_listing'):
+                infos = [i for i in z.infolist() if not i.is_dir()]
+                names = {i.filename for i in z.infolist()}
+            result['members'] = len(infos)
 
-            names = set(z.namelist())
             missing = [f for f in CORE_FILES if f not in names]
             if missing:
-                return f"[WARNING] Missing core components: {missing}"
+                findings.append(_finding('warning', 'missing_core',
+                                         f'Missing core components: {missing}'))
 
-            return "[OK] Excel structure looks valid."
+            if level in ('crc', 'deep'):
+                # largest first keeps the pool busy until the end
+                ordered = [i.filename for i in sorted(infos, key=lambda i: -i.file_size)]
+                with prof.phase('verify_members'):
+                    fatal, checked = _check_members(path, ordered, level == 'deep',
+                                                    workers or min(8, os.cpu_count() or 1))
+                result['members_checked'] = checked
+                if fatal is not None:
+                    findings.append(fatal)
+
+            if level == 'deep' and not any(f['severity'] == 'fatal' for f in findings):
+                with prof.phase('relationships'):
+                    fatal = _check_relationships(z, names)
+                if fatal is not None:
+                    findings.append(fatal)
 
     except zipfile.BadZipFile:
-        return "[ERROR] Not a valid ZIP file (Excel XLSX required)."
+        findings.append(_finding('fatal', 'not_zip', 'Not a valid ZIP file (Excel XLSX required).'))
+        result['status'] = 'ERROR'
     except Exception as e:
-        return f"[ERROR] Exception occurred: {e}"
+        findings.append(_finding('fatal', 'exception', f'Exception occurred: {e}'))
+        result['status'] = 'ERROR'
+
+    if 'status' not in result:
+        if any(f['severity'] == 'fatal' for f in findings):
+            result['status'] = 'CORRUPT'
+        elif findings:
+            result['status'] = 'WARNING'
+        else:
+            result['status'] = 'OK'
+    result['ok'] = result['status'] == 'OK'
+    if profiler:
+        result['profile'] = profiler.summary()
+    return result
+
+
+def format_integrity(result: Dict[str, Any]) -> str:
+    """One-line, human-readable summary of a check_excel_integrity result."""
+    status = result['status']
+    if status == 'OK':
+        return "[OK] Excel structure looks valid."
+    fatal = [f for f in result['findings'] if f['severity'] == 'fatal']
+    finding = fatal[0] if fatal else result['findings'][0]
+    if finding['code'] == 'bad_member':
+        return f"[CORRUPT] Bad file entry detected: {finding['part']}"
+    return f"[{status}] {finding['message']}"
+
+
+def check_excel_corruption(path: str, level: str = 'crc', profiler=None) -> str:
+    """
+    Returns a human-readable message only (string),
+    compatible with GUI output.
+    """
+    return format_integrity(check_excel_integrity(path, level, profiler=profiler))
+
+
+def check_xlsx_structure(path: str, level: str = 'quick', profiler=None) -> Tuple[bool, str]:
+    """(ok, message) pair used by cli.py --check."""
+    result = check_excel_integrity(path, level, profiler=profiler)
+    return result['ok'], format_integrity(result)
 
 
 # CLI execution
 if __name__ == '__main__':
     if len(sys.argv) < 2:
-        print("Usage: python basic_corruption_checker.py <file.xlsx>")
+        print("Usage: python basic_corruption_checker.py <file.xlsx> [quick|crc|deep] [--json]")
         sys.exit(1)
 
     path = sys.argv[1]
+    level = sys.argv[2] if len(sys.argv) > 2 and not sys.argv[2].startswith('-') else 'crc'
 
-    result = check_excel_corruption(path)
-    print(result)
+    if '--json' in sys.argv:
+        import json
+        print(json.dumps(check_excel_integrity(path, level), indent=2))
+    else:
+        result = check_excel_corruption(path, level)
+        print(result)
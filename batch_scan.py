@@ -0,0 +1,251 @@
+"""batch_scan.py
+Scan whole directories / globs of workbooks with a pool of warm worker
+processes and stream one JSON line per file to an output file.
+
+    python batch_scan.py D:/shares/finance "D:/exports/**/*.xlsx" -o scan.jsonl --workers 8
+
+Re-running with the same output file resumes: paths already recorded
+there are skipped (files that timed out too, unless --retry-timeouts).
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing.connection import wait
+from typing import Any, Dict, Iterable, Iterator, Optional, Set
+
+from basic_corruption_checker import check_excel_corruption
+from analyzer import analyze_xlsx
+
+EXTENSIONS = ('.xlsx', '.xlsm')
+DEFAULT_TIMEOUT = 300.0
+
+
+def iter_workbook_paths(targets: Iterable[str]) -> Iterator[str]:
+    """Expand files, directories (recursively) and glob patterns into absolute workbook paths."""
+    seen = set()
+    for target in targets:
+        if os.path.isdir(target):
+            candidates = (
+                os.path.join(folder, name)
+                for folder, _, names in os.walk(target)
+                for name in sorted(names)
+            )
+        elif os.path.isfile(target):
+            candidates = [target]
+        else:
+            candidates = sorted(glob.iglob(target, recursive=True))
+
+        for candidate in candidates:
+            name = os.path.basename(candidate)
+            # skip Excel lock files (~$Book1.xlsx)
+            if name.startswith('~$') or not name.lower().endswith(EXTENSIONS):
+                continue
+            path = os.path.abspath(candidate)
+            if path not in seen:
+                seen.add(path)
+                yield path
+
+
+def load_done_paths(output_path: str, retry_timeouts: bool = False) -> Set[str]:
+    """
+    Paths already present in an existing JSONL output (truncated last lines
+    are ignored). With retry_timeouts, paths only recorded as 'timeout' are
+    left out so they are scanned again.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if retry_timeouts and record.get('status') == 'timeout':
+                    continue
+                done.add(record['path'])
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+    return done
+
+
+def scan_file(path: str, engine: str = 'stream', cache_path: Optional[str] = None,
+              time_budget: Optional[float] = None, index_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Corruption check + analysis of one workbook, as a JSON-serialisable record.
+    time_budget makes it a quick scan (estimated counts for large sheets);
+    index_path answers copies of already indexed workbooks from the result index.
+    """
+    start = time.perf_counter()
+    record: Dict[str, Any] = {'path': path}
+    try:
+        record['check'] = check_excel_corruption(path)
+        record['analysis'] = analyze_xlsx(path, engine=engine, cache_path=cache_path,
+                                          time_budget=time_budget, index_path=index_path)
+        record['status'] = 'error' if 'error' in record['analysis'] else 'ok'
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = str(e)
+    record['seconds'] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def _worker_loop(conn, engine: str, cache_path: Optional[str], time_budget: Optional[float],
+                 index_path: Optional[str]):
+    while True:
+        path = conn.recv()
+        if path is None:
+            break
+        conn.send(scan_file(path, engine, cache_path, time_budget, index_path))
+
+
+class _Worker:
+    """One long-lived scan process; killed and replaced when a file times out."""
+
+    def __init__(self, ctx, engine: str, cache_path: Optional[str] = None,
+                 time_budget: Optional[float] = None, index_path: Optional[str] = None):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_loop,
+                                   args=(child_conn, engine, cache_path, time_budget, index_path),
+                                   daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.path: Optional[str] = None
+        self.started = 0.0
+
+    def submit(self, path: str):
+        self.path = path
+        self.started = time.monotonic()
+        self.conn.send(path)
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+def run_batch(targets: Iterable[str], output_path: str, workers: int = 4,
+              timeout: float = DEFAULT_TIMEOUT, engine: str = 'stream',
+              cache_path: Optional[str] = None,
+              time_budget: Optional[float] = None,
+              index_path: Optional[str] = None,
+              retry_timeouts: bool = False) -> Dict[str, int]:
+    """
+    Scan every workbook under `targets`, appending one JSON line per file to
+    `output_path` as soon as it finishes (completion order, not input order).
+    Files running longer than `timeout` seconds are recorded with
+    status 'timeout' and their worker is replaced. time_budget (seconds per
+    file) switches the analysis to a quick scan, see analyzer.analyze_xlsx.
+    index_path is a result index shared by all workers (result_index.py).
+    retry_timeouts scans files recorded earlier as 'timeout' again on resume
+    (the old line stays in the file, the new record is appended).
+    Returns a summary {'scanned', 'skipped', 'errors', 'timeouts', and with
+    an index 'index_hits'}.
+    """
+    done = load_done_paths(output_path, retry_timeouts)
+    pending = iter_workbook_paths(targets)
+    summary = {'scanned': 0, 'skipped': 0, 'errors': 0, 'timeouts': 0}
+    if index_path:
+        summary['index_hits'] = 0
+
+    ctx = multiprocessing.get_context()
+    pool = [_Worker(ctx, engine, cache_path, time_budget, index_path) for _ in range(max(1, workers))]
+
+    def next_path() -> Optional[str]:
+        for path in pending:
+            if path in done:
+                summary['skipped'] += 1
+                continue
+            return path
+        return None
+
+    with open(output_path, 'a', encoding='utf-8') as out:
+        def emit(record: Dict[str, Any]):
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            summary['scanned'] += 1
+            if record['status'] == 'error':
+                summary['errors'] += 1
+            elif record['status'] == 'timeout':
+                summary['timeouts'] += 1
+            elif index_path and record['analysis'].get('index', {}).get('hit'):
+                summary['index_hits'] += 1
+
+        try:
+            exhausted = False
+            while True:
+                for worker in pool:
+                    if worker.path is None and not exhausted:
+                        path = next_path()
+                        if path is None:
+                            exhausted = True
+                        else:
+                            worker.submit(path)
+
+                busy = [w for w in pool if w.path is not None]
+                if not busy:
+                    break
+
+                now = time.monotonic()
+                wait_for = max(0.0, min(w.started + timeout for w in busy) - now)
+                ready = wait([w.conn for w in busy], timeout=wait_for)
+
+                for worker in busy:
+                    if worker.conn in ready:
+                        try:
+                            record = worker.conn.recv()
+                        except EOFError:
+                            record = {'path': worker.path, 'status': 'error',
+                                      'error': 'worker process died'}
+                            worker.kill()
+                            pool[pool.index(worker)] = _Worker(ctx, engine, cache_path, time_budget, index_path)
+                        worker.path = None
+                        emit(record)
+                    elif time.monotonic() - worker.started >= timeout:
+                        worker.kill()
+                        emit({'path': worker.path, 'status': 'timeout',
+                              'seconds': round(time.monotonic() - worker.started, 3)})
+                        pool[pool.index(worker)] = _Worker(ctx, engine, cache_path, time_budget, index_path)
+        finally:
+            for worker in pool:
+                worker.stop()
+
+    return summary
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description='Batch scan workbooks into a JSONL file')
+    p.add_argument('targets', nargs='+', help='Files, directories or glob patterns')
+    p.add_argument('-o', '--output', required=True, help='JSONL output (existing entries are skipped)')
+    p.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    p.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='Per-file timeout in seconds')
+    p.add_argument('--engine', choices=['stream', 'openpyxl'], default='stream', help='Analyzer engine')
+    p.add_argument('--cache', help='Part cache database shared by all workers')
+    p.add_argument('--time-budget', type=float,
+                   help='Quick scan: seconds per file, large sheets are sampled')
+    p.add_argument('--index', help='Result index database: copies of indexed workbooks are not rescanned')
+    p.add_argument('--retry-timeouts', action='store_true',
+                   help='On resume, scan files that timed out in an earlier run again')
+    args = p.parse_args(argv)
+
+    summary = run_batch(args.targets, args.output, args.workers, args.timeout, args.engine, args.cache,
+                        args.time_budget, args.index, args.retry_timeouts)
+    print(json.dumps(summary), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
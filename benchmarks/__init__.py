@@ -0,0 +1,9 @@
+"""benchmarks
+Synthetic workbook generator and timing harness for the scan and
+cleanup paths. Run from the repository root:
+
+    python -m benchmarks --presets small medium -o bench.json
+
+The submodules are imported where they are used (benchmarks.generator,
+benchmarks.harness), so `python -m benchmarks.generator` runs cleanly.
+"""
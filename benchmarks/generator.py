@@ -0,0 +1,277 @@
+"""benchmarks/generator.py
+Deterministic synthetic workbooks for the benchmarks.
+
+The package is written part by part straight into the zip (sheet XML is
+streamed row by row), so even multi-million cell workbooks are produced
+quickly and without openpyxl. The same parameters and seed always give
+a byte-identical file.
+
+    python -m benchmarks.generator big.xlsx --rows 200000 --cols 20 --volatile-density 0.05
+"""
+import os
+import random
+import struct
+import zipfile
+import zlib
+from typing import Any, Dict, IO
+
+from sheet_scanner import column_letter
+
+PRESETS = {
+    'small': dict(rows=2000, cols=10, sheets=2, styles=20, formula_density=0.1,
+                  volatile_density=0.05, merges=10, media=1, external_links=1),
+    'medium': dict(rows=50000, cols=15, sheets=3, styles=200, formula_density=0.15,
+                   volatile_density=0.05, merges=100, media=4, external_links=2),
+    'large': dict(rows=200000, cols=20, sheets=4, styles=2000, formula_density=0.2,
+                  volatile_density=0.02, merges=500, media=10, external_links=3),
+}
+
+STRING_POOL = 500
+VOLATILE_TEMPLATES = ('NOW()', 'TODAY()', 'RAND()', 'OFFSET(A{r},0,1)', 'INDIRECT("B{r}")')
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_DOC_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+DRAWING_NS = 'http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing'
+A_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+CT_PREFIX = 'application/vnd.openxmlformats-officedocument.'
+DECL = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\r\n'
+
+
+def _png(width: int, height: int, seed: int) -> bytes:
+    """A small valid RGB PNG filled with a seed-dependent colour."""
+    rng = random.Random(seed)
+    pixel = bytes(rng.randrange(256) for _ in range(3))
+    raw = b''.join(b'\x00' + pixel * width for _ in range(height))
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+
+def _info(name: str, compress_type: int = zipfile.ZIP_DEFLATED) -> zipfile.ZipInfo:
+    """Fixed timestamps keep the generated files byte-identical between runs."""
+    info = zipfile.ZipInfo(name, date_time=(2020, 1, 1, 0, 0, 0))
+    info.compress_type = compress_type
+    return info
+
+
+def _rels(rels) -> str:
+    """rels: [(id, type suffix, target, external)]"""
+    items = []
+    for rid, kind, target, external in rels:
+        mode = ' TargetMode="External"' if external else ''
+        items.append(f'<Relationship Id="{rid}" Type="{REL_TYPE}{kind}" Target="{target}"{mode}/>')
+    return f'{DECL}<Relationships xmlns="{PKG_REL_NS}">{"".join(items)}</Relationships>'
+
+
+def _styles(count: int) -> str:
+    fonts = ['<font><sz val="11"/><name val="Calibri"/></font>']
+    xfs = ['<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>']
+    for i in range(1, count):
+        fonts.append(f'<font><b/><sz val="{9 + i % 8}"/><color rgb="FF{i * 2654435761 % 0xFFFFFF:06X}"/>'
+                     f'<name val="Calibri"/></font>')
+        xfs.append(f'<xf numFmtId="{(0, 2, 4, 10, 14)[i % 5]}" fontId="{i}" fillId="0" borderId="0" '
+                   f'xfId="0" applyFont="1" applyNumberFormat="1"/>')
+    return (f'{DECL}<styleSheet xmlns="{MAIN_NS}">'
+            f'<fonts count="{len(fonts)}">{"".join(fonts)}</fonts>'
+            '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+            '<fill><patternFill patternType="gray125"/></fill></fills>'
+            '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+            '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+            f'<cellXfs count="{len(xfs)}">{"".join(xfs)}</cellXfs>'
+            '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+            '</styleSheet>')
+
+
+def _shared_strings(rng: random.Random) -> str:
+    words = ('alpha', 'beta', 'gamma', 'delta', 'sales', 'region', 'total', 'north', 'south')
+    items = ''.join(f'<si><t>{rng.choice(words)} {i}</t></si>' for i in range(STRING_POOL))
+    return (f'{DECL}<sst xmlns="{MAIN_NS}" count="{STRING_POOL}" uniqueCount="{STRING_POOL}">'
+            f'{items}</sst>')
+
+
+def _write_sheet(out: IO[bytes], rng: random.Random, p: Dict[str, Any], has_drawing: bool):
+    rows, cols = p['rows'], p['cols']
+    last_col = column_letter(cols)
+    styles = max(p['styles'], 1)
+    buf = [f'{DECL}<worksheet xmlns="{MAIN_NS}" xmlns:r="{REL_DOC_NS}">'
+           f'<dimension ref="A1:{last_col}{rows}"/><sheetData>']
+
+    for r in range(1, rows + 1):
+        cells = [f'<c r="A{r}" t="s"><v>{rng.randrange(STRING_POOL)}</v></c>']
+        for c in range(2, cols + 1):
+            ref = f'{column_letter(c)}{r}'
+            s = (r * cols + c) % styles
+            style = f' s="{s}"' if s else ''
+            value = rng.randint(0, 100000)
+            if p['external_links'] and c == cols and r % 10 == 0:
+                link = r // 10 % p['external_links'] + 1
+                cells.append(f'<c r="{ref}"{style}><f>[{link}]Sheet1!A{r}</f><v>{value}</v></c>')
+            elif c > 2 and rng.random() < p['formula_density']:
+                if rng.random() < p['volatile_density']:
+                    formula = rng.choice(VOLATILE_TEMPLATES).format(r=r)
+                else:
+                    formula = f'{column_letter(c - 1)}{r}*2+B{r}'
+                cells.append(f'<c r="{ref}"{style}><f>{formula}</f><v>{value}</v></c>')
+            else:
+                cells.append(f'<c r="{ref}"{style}><v>{value}</v></c>')
+        buf.append(f'<row r="{r}" spans="1:{cols}">{"".join(cells)}</row>')
+        if len(buf) >= 1000:
+            out.write(''.join(buf).encode('utf-8'))
+            buf = []
+    buf.append('</sheetData>')
+
+    merges = min(p['merges'], rows) if cols >= 3 else 0
+    if merges:
+        step = max(rows // merges, 1)
+        refs = ''.join(f'<mergeCell ref="B{1 + i * step}:C{1 + i * step}"/>' for i in range(merges))
+        buf.append(f'<mergeCells count="{merges}">{refs}</mergeCells>')
+    if has_drawing:
+        buf.append('<drawing r:id="rId1"/>')
+    buf.append('</worksheet>')
+    out.write(''.join(buf).encode('utf-8'))
+
+
+def _drawing(first_image: int, count: int) -> str:
+    anchors = []
+    for i in range(count):
+        row = i * 6
+        anchors.append(
+            f'<xdr:twoCellAnchor><xdr:from><xdr:col>3</xdr:col><xdr:colOff>0</xdr:colOff>'
+            f'<xdr:row>{row}</xdr:row><xdr:rowOff>0</xdr:rowOff></xdr:from>'
+            f'<xdr:to><xdr:col>6</xdr:col><xdr:colOff>0</xdr:colOff><xdr:row>{row + 5}</xdr:row>'
+            f'<xdr:rowOff>0</xdr:rowOff></xdr:to>'
+            f'<xdr:pic><xdr:nvPicPr><xdr:cNvPr id="{i + 2}" name="Picture {first_image + i}"/>'
+            f'<xdr:cNvPicPr/></xdr:nvPicPr>'
+            f'<xdr:blipFill><a:blip r:embed="rId{i + 1}"/><a:stretch><a:fillRect/></a:stretch></xdr:blipFill>'
+            f'<xdr:spPr><a:prstGeom prst="rect"><a:avLst/></a:prstGeom></xdr:spPr></xdr:pic>'
+            f'<xdr:clientData/></xdr:twoCellAnchor>')
+    return (f'{DECL}<xdr:wsDr xmlns:xdr="{DRAWING_NS}" xmlns:a="{A_NS}" xmlns:r="{REL_DOC_NS}">'
+            f'{"".join(anchors)}</xdr:wsDr>')
+
+
+def _external_link() -> str:
+    return (f'{DECL}<externalLink xmlns="{MAIN_NS}" xmlns:r="{REL_DOC_NS}">'
+            f'<externalBook r:id="rId1"><sheetNames><sheetName val="Sheet1"/></sheetNames>'
+            f'</externalBook></externalLink>')
+
+
+def generate_workbook(path: str, rows: int = 1000, cols: int = 10, sheets: int = 1,
+                      styles: int = 10, formula_density: float = 0.1,
+                      volatile_density: float = 0.05, merges: int = 0, media: int = 0,
+                      external_links: int = 0, seed: int = 0) -> Dict[str, Any]:
+    """
+    Write a synthetic workbook to `path`.
+
+    rows x cols cells per sheet; column A holds shared strings, the rest
+    numbers, a `formula_density` share of them formulas of which a
+    `volatile_density` share are volatile. `styles` distinct cell formats
+    are assigned round robin, `merges` merged ranges and `media` pictures
+    are added per sheet, and `external_links` linked workbooks are
+    referenced from every tenth row.
+
+    Returns the parameters plus 'path', 'cells' and 'bytes'.
+    """
+    params = dict(rows=rows, cols=cols, sheets=sheets, styles=styles,
+                  formula_density=formula_density, volatile_density=volatile_density,
+                  merges=merges, media=media, external_links=external_links, seed=seed)
+    rng = random.Random(seed)
+
+    overrides = [('/xl/workbook.xml', 'spreadsheetml.sheet.main+xml'),
+                 ('/xl/styles.xml', 'spreadsheetml.styles+xml'),
+                 ('/xl/sharedStrings.xml', 'spreadsheetml.sharedStrings+xml')]
+    wb_rels = []
+    sheet_entries = []
+    for i in range(1, sheets + 1):
+        wb_rels.append((f'rId{i}', 'worksheet', f'worksheets/sheet{i}.xml', False))
+        sheet_entries.append(f'<sheet name="Sheet{i}" sheetId="{i}" r:id="rId{i}"/>')
+        overrides.append((f'/xl/worksheets/sheet{i}.xml', 'spreadsheetml.worksheet+xml'))
+    wb_rels.append((f'rId{sheets + 1}', 'styles', 'styles.xml', False))
+    wb_rels.append((f'rId{sheets + 2}', 'sharedStrings', 'sharedStrings.xml', False))
+
+    link_refs = []
+    for n in range(1, external_links + 1):
+        rid = f'rId{sheets + 2 + n}'
+        wb_rels.append((rid, 'externalLink', f'externalLinks/externalLink{n}.xml', False))
+        link_refs.append(f'<externalReference r:id="{rid}"/>')
+        overrides.append((f'/xl/externalLinks/externalLink{n}.xml', 'spreadsheetml.externalLink+xml'))
+    externals = f'<externalReferences>{"".join(link_refs)}</externalReferences>' if link_refs else ''
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr(_info('_rels/.rels'), _rels([('rId1', 'officeDocument', 'xl/workbook.xml', False)]))
+        z.writestr(_info('xl/workbook.xml'),
+                   f'{DECL}<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_DOC_NS}">'
+                   f'<sheets>{"".join(sheet_entries)}</sheets>{externals}'
+                   f'<calcPr calcId="191029"/></workbook>')
+        z.writestr(_info('xl/_rels/workbook.xml.rels'), _rels(wb_rels))
+        z.writestr(_info('xl/styles.xml'), _styles(styles))
+        z.writestr(_info('xl/sharedStrings.xml'), _shared_strings(rng))
+
+        for n in range(1, external_links + 1):
+            z.writestr(_info(f'xl/externalLinks/externalLink{n}.xml'), _external_link())
+            z.writestr(_info(f'xl/externalLinks/_rels/externalLink{n}.xml.rels'),
+                       _rels([('rId1', 'externalLinkPath', f'file:///C:/data/source{n}.xlsx', True)]))
+
+        image = 1
+        for i in range(1, sheets + 1):
+            with z.open(_info(f'xl/worksheets/sheet{i}.xml'), 'w') as out:
+                _write_sheet(out, rng, params, media > 0)
+            if not media:
+                continue
+            z.writestr(_info(f'xl/worksheets/_rels/sheet{i}.xml.rels'),
+                       _rels([('rId1', 'drawing', f'../drawings/drawing{i}.xml', False)]))
+            z.writestr(_info(f'xl/drawings/drawing{i}.xml'), _drawing(image, media))
+            z.writestr(_info(f'xl/drawings/_rels/drawing{i}.xml.rels'),
+                       _rels([(f'rId{k + 1}', 'image', f'../media/image{image + k}.png', False)
+                              for k in range(media)]))
+            overrides.append((f'/xl/drawings/drawing{i}.xml', 'drawing+xml'))
+            for k in range(media):
+                z.writestr(_info(f'xl/media/image{image + k}.png', zipfile.ZIP_STORED),
+                           _png(64, 48, seed * 1000 + image + k))
+            image += media
+
+        types = ''.join(f'<Override PartName="{name}" ContentType="{CT_PREFIX}{kind}"/>'
+                        for name, kind in overrides)
+        z.writestr(_info('[Content_Types].xml'),
+                   f'{DECL}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                   '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                   '<Default Extension="xml" ContentType="application/xml"/>'
+                   '<Default Extension="png" ContentType="image/png"/>'
+                   f'{types}</Types>')
+
+    params.update(path=path, cells=rows * cols * sheets, bytes=os.path.getsize(path))
+    return params
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic benchmark workbook")
+    parser.add_argument("output", help="Path of the .xlsx to write")
+    parser.add_argument("--preset", choices=sorted(PRESETS), help="Start from a preset")
+    parser.add_argument("--rows", type=int)
+    parser.add_argument("--cols", type=int)
+    parser.add_argument("--sheets", type=int)
+    parser.add_argument("--styles", type=int)
+    parser.add_argument("--formula-density", type=float)
+    parser.add_argument("--volatile-density", type=float)
+    parser.add_argument("--merges", type=int)
+    parser.add_argument("--media", type=int)
+    parser.add_argument("--external-links", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    options = dict(PRESETS[args.preset]) if args.preset else {}
+    for key in ('rows', 'cols', 'sheets', 'styles', 'formula_density', 'volatile_density',
+                'merges', 'media', 'external_links'):
+        value = getattr(args, key)
+        if value is not None:
+            options[key] = value
+    print(json.dumps(generate_workbook(args.output, seed=args.seed, **options), indent=2))
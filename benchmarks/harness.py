@@ -0,0 +1,244 @@
+"""benchmarks/harness.py
+Time the scan and cleanup paths on generated workbooks.
+
+Every (workbook, operation) pair runs in a fresh spawned process so peak
+RSS belongs to that operation alone and imports are not shared between
+measurements. Results are written as JSON; with --baseline the run is
+compared against an earlier result file and exits non-zero on regressions.
+
+    python -m benchmarks --presets small medium -o bench.json
+    python -m benchmarks --presets small --baseline bench.json --threshold 0.2
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from benchmarks.generator import PRESETS, generate_workbook
+
+DEFAULT_THRESHOLD = 0.25
+# timings this short are mostly noise; they never count as a regression
+MIN_SECONDS = 0.05
+
+
+def _analyze(path, workdir):
+    from analyzer import analyze_xlsx
+    analyze_xlsx(path)
+
+
+def _check(path, workdir):
+    from basic_corruption_checker import check_excel_corruption
+    check_excel_corruption(path, 'crc')
+
+
+def _check_deep(path, workdir):
+    from basic_corruption_checker import check_excel_corruption
+    check_excel_corruption(path, 'deep')
+
+
+def _cleanup(path, workdir):
+    from cleanup_styles import cleanup_excel_file
+    cleanup_excel_file(path, os.path.join(workdir, 'cleanup.xlsx'))
+
+
+def _consolidate_styles(path, workdir):
+    from style_consolidation import consolidate_styles
+    consolidate_styles(path, os.path.join(workdir, 'consolidated.xlsx'))
+
+
+def _remove_objects(path, workdir):
+    from object_removal import remove_objects
+    remove_objects(path, os.path.join(workdir, 'objects.xlsx'))
+
+
+def _strip_links(path, workdir):
+    from external_links import strip_external_links
+    strip_external_links(path, os.path.join(workdir, 'nolinks.xlsx'))
+
+
+OPERATIONS: Dict[str, Callable[[str, str], None]] = {
+    'analyze': _analyze,
+    'check': _check,
+    'check_deep': _check_deep,
+    'cleanup': _cleanup,
+    'consolidate_styles': _consolidate_styles,
+    'remove_objects': _remove_objects,
+    'strip_links': _strip_links,
+}
+DEFAULT_OPERATIONS = ('analyze', 'check', 'cleanup')
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (None if unavailable)."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, kilobytes elsewhere
+        return round(peak / (1 << 20 if sys.platform == 'darwin' else 1 << 10), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / (1 << 20), 1)
+    except ImportError:
+        return None
+
+
+def _measure(operation: str, path: str, workdir: str, conn):
+    try:
+        start = time.perf_counter()
+        OPERATIONS[operation](path, workdir)
+        conn.send({'seconds': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb()})
+    except Exception as e:
+        conn.send({'error': f'{type(e).__name__}: {e}'})
+    finally:
+        conn.close()
+
+
+def measure(operation: str, path: str, workdir: str) -> Dict[str, Any]:
+    """Run one operation once in a fresh process; returns seconds / peak_rss_mb or error."""
+    ctx = multiprocessing.get_context('spawn')
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_measure, args=(operation, path, workdir, child), daemon=True)
+    proc.start()
+    child.close()
+    try:
+        outcome = parent.recv()
+    except EOFError:
+        outcome = {'error': f'worker exited with code {proc.exitcode}'}
+    proc.join()
+    return outcome
+
+
+def run_benchmarks(presets: List[str], operations: List[str], repeat: int = 3,
+                   workdir: str = None, seed: int = 0) -> Dict[str, Any]:
+    """
+    Generate each preset workbook and time every operation on it.
+
+    Returns {'meta': {...}, 'results': [{'workbook', 'operation', 'cells',
+             'bytes', 'seconds' (best of `repeat`), 'seconds_median',
+             'peak_rss_mb', 'cells_per_sec'} or {..., 'error'}]}
+    """
+    own_dir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='xlsx_bench_')
+    results = []
+    try:
+        for preset in presets:
+            path = os.path.join(workdir, f'{preset}.xlsx')
+            workbook = generate_workbook(path, seed=seed, **PRESETS[preset])
+            for operation in operations:
+                runs = [measure(operation, path, workdir) for _ in range(repeat)]
+                entry = {'workbook': preset, 'operation': operation,
+                         'cells': workbook['cells'], 'bytes': workbook['bytes']}
+                errors = [r['error'] for r in runs if 'error' in r]
+                if errors:
+                    entry['error'] = errors[0]
+                else:
+                    seconds = [r['seconds'] for r in runs]
+                    rss = [r['peak_rss_mb'] for r in runs if r['peak_rss_mb'] is not None]
+                    entry.update({
+                        'seconds': round(min(seconds), 4),
+                        'seconds_median': round(statistics.median(seconds), 4),
+                        'peak_rss_mb': max(rss) if rss else None,
+                        'cells_per_sec': round(workbook['cells'] / max(min(seconds), 1e-9)),
+                    })
+                results.append(entry)
+                print(_format_entry(entry), file=sys.stderr)
+    finally:
+        if own_dir:
+            for name in os.listdir(workdir):
+                os.remove(os.path.join(workdir, name))
+            os.rmdir(workdir)
+
+    meta = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'seed': seed,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    return {'meta': meta, 'results': results}
+
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any],
+                    threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    Regressions of `current` against `baseline`: every (workbook, operation)
+    whose best time or peak RSS grew by more than `threshold` (0.25 = 25 %),
+    or that fails now but did not before.
+    """
+    previous = {(r['workbook'], r['operation']): r for r in baseline.get('results', [])}
+    regressions = []
+    for entry in current['results']:
+        old = previous.get((entry['workbook'], entry['operation']))
+        if old is None or 'error' in old:
+            continue
+        key = {'workbook': entry['workbook'], 'operation': entry['operation']}
+        if 'error' in entry:
+            regressions.append(dict(key, metric='error', message=entry['error']))
+            continue
+        if old['seconds'] >= MIN_SECONDS and entry['seconds'] > old['seconds'] * (1 + threshold):
+            regressions.append(dict(key, metric='seconds', baseline=old['seconds'],
+                                    current=entry['seconds'],
+                                    change=round(entry['seconds'] / old['seconds'] - 1, 3)))
+        if (old.get('peak_rss_mb') and entry.get('peak_rss_mb')
+                and entry['peak_rss_mb'] > old['peak_rss_mb'] * (1 + threshold)):
+            regressions.append(dict(key, metric='peak_rss_mb', baseline=old['peak_rss_mb'],
+                                    current=entry['peak_rss_mb'],
+                                    change=round(entry['peak_rss_mb'] / old['peak_rss_mb'] - 1, 3)))
+    return regressions
+
+
+def _format_entry(entry: Dict[str, Any]) -> str:
+    name = f"{entry['workbook']:<8} {entry['operation']:<20}"
+    if 'error' in entry:
+        return f"{name} ERROR {entry['error']}"
+    return (f"{name} {entry['seconds']:>9.3f}s  {entry['peak_rss_mb'] or 0:>8.1f} MB  "
+            f"{entry['cells_per_sec']:>12,} cells/s")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark scan and cleanup operations")
+    parser.add_argument("--presets", nargs='+', choices=sorted(PRESETS), default=['small'],
+                        help="Workbook sizes to generate")
+    parser.add_argument("--ops", nargs='+', choices=sorted(OPERATIONS), default=list(DEFAULT_OPERATIONS),
+                        help="Operations to time")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per operation (best time is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Keep generated workbooks and outputs here")
+    parser.add_argument("-o", "--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown / memory growth before failing (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+    results = run_benchmarks(args.presets, args.ops, args.repeat, args.workdir, args.seed)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['workbook']} {r['operation']} {r['metric']}: "
+                  f"{r.get('baseline')} -> {r.get('current', r.get('message'))}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("No regressions against baseline.", file=sys.stderr)
+    return 0
@@ -0,0 +1,101 @@
+"""benchmarks/startup.py
+Startup cost of the main.py commands.
+
+Each command runs in a fresh interpreter (best of --repeat) and reports
+its wall time and which heavy modules ended up imported. Commands listed
+in MUST_NOT_IMPORT fail the run when they pull in one of those modules,
+e.g. `check` loading openpyxl or tkinter.
+
+    python -m benchmarks.startup --file 99.xlsx
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('openpyxl', 'tkinter', 'win32com', 'jinja2', 'numpy')
+MUST_NOT_IMPORT = {
+    'check': ('openpyxl', 'tkinter', 'win32com', 'jinja2'),
+    'analyze': ('openpyxl', 'tkinter', 'win32com', 'jinja2'),
+}
+
+# runs main.main() and reports the heavy modules that were imported
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import main
+try:
+    code = main.main({argv!r})
+except SystemExit as e:  # --help
+    code = e.code
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{'seconds': time.perf_counter() - start, 'exit_code': code,
+                  'heavy_modules': heavy, 'modules': len(sys.modules)}}))
+"""
+
+
+def probe(argv: List[str]) -> Dict[str, Any]:
+    """Run one command in a fresh interpreter."""
+    code = _PROBE.format(root=REPO_ROOT, argv=argv, heavy=HEAVY_MODULES)
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=REPO_ROOT)
+    wall = time.perf_counter() - start
+    last = proc.stdout.strip().splitlines()[-1] if proc.stdout.strip() else ''
+    try:
+        outcome = json.loads(last)
+    except ValueError:
+        return {'error': (proc.stderr.strip().splitlines() or ['no output'])[-1], 'process_seconds': wall}
+    outcome['process_seconds'] = wall
+    return outcome
+
+
+def run_startup(path: str, repeat: int = 5) -> Dict[str, Any]:
+    commands = {
+        'check': ['check', path, '--level', 'quick'],
+        'analyze': ['analyze', path, '-o', os.devnull],
+        'help': ['--help'],
+    }
+    results = []
+    for name, argv in commands.items():
+        runs = [probe(argv) for _ in range(repeat)]
+        errors = [r['error'] for r in runs if 'error' in r]
+        entry: Dict[str, Any] = {'command': name}
+        if errors:
+            entry['error'] = errors[0]
+        else:
+            best = min(runs, key=lambda r: r['process_seconds'])
+            entry.update({
+                'process_seconds': round(best['process_seconds'], 4),
+                'in_process_seconds': round(best['seconds'], 4),
+                'modules': best['modules'],
+                'heavy_modules': best['heavy_modules'],
+            })
+            forbidden = sorted(set(best['heavy_modules']) & set(MUST_NOT_IMPORT.get(name, ())))
+            if forbidden:
+                entry['error'] = f"imports {', '.join(forbidden)}"
+        results.append(entry)
+    return {'python': sys.version.split()[0], 'results': results}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure main.py command startup")
+    parser.add_argument("--file", default=os.path.join(REPO_ROOT, '99.xlsx'),
+                        help="Workbook passed to the commands")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    report = run_startup(os.path.abspath(args.file), args.repeat)
+    print(json.dumps(report, indent=2))
+    failed = [r for r in report['results'] if 'error' in r]
+    for r in failed:
+        print(f"FAIL {r['command']}: {r['error']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,31 @@
-import win32com.client as win32
 import os
 
+from object_removal import remove_objects
+from profiling import NULL_PROFILER
+
+
 def remove_excel_objects(input_file, output_file=None):
+    """
+    Removes drawings (shapes, pictures), charts, OLE objects and form /
+    ActiveX controls from all worksheets, working on the XLSX package
+    directly. Runs on any OS; Excel is not needed.
+    """
+    report = remove_objects(input_file, output_file)
+
+    for category, entry in sorted(report['removed'].items()):
+        print(f"  Removed {entry['parts']} {category} parts ({entry['bytes']} bytes)")
+    print(f"\nCleanup completed. Saved as: {report['output']}")
+
+    return report['output']
+
+
+def remove_excel_objects_com(input_file, output_file=None):
     """
     Removes shapes, charts, OLE objects, and form controls
     from all worksheets in an Excel workbook.
     Requires Windows + Excel installed.
     """
+    import win32com.client as win32
 
     excel = win32.Dispatch("Excel.Application")
     excel.DisplayAlerts = False
@@ -62,15 +81,17 @@ def remove_excel_objects(input_file, output_file=None):
     finally:
         excel.Quit()
 
-def remove_excessive_styles(wb):
+def remove_excessive_styles(wb, profiler=None):
     """
     Reset all cell styles to Normal.
     This reduces excessive styles and prevents Excel file bloat.
     """
+    prof = profiler or NULL_PROFILER
     for ws in wb.worksheets:
-        for row in ws.iter_rows():
-            for cell in row:
-                cell.style = "Normal"
+        with prof.phase('reset_styles', sheet=ws.title):
+            for row in ws.iter_rows():
+                for cell in row:
+                    cell.style = "Normal"
 
 
 if __name__ == "__main__":
@@ -3,65 +3,45 @@
 
 from openpyxl import load_workbook
 from cleanup import remove_excessive_styles
-from cleanup import remove_excel_objects
+from object_removal import remove_objects
+from external_links import strip_external_links
+from pivot_caches import strip_pivot_records
+from profiling import NULL_PROFILER
+from progress import notify
 
-# ------------------------------------------------------
-# REMOVE EXTERNAL LINKS
-# ------------------------------------------------------
-def remove_external_links(wb):
-    """
-    Remove external links stored in:
-      - external_links
-      - defined names
-      - formulas referring to other files
-    """
-
-    # Remove external link objects
-    if hasattr(wb, "external_links"):
-        wb.external_links = []
-    if hasattr(wb, "_external_links"):
-        wb._external_links = []
-
-    # Remove external references in defined names
-    to_delete = []
-
-    for name in wb.defined_names:
-        if name.attr_text and "[" in name.attr_text and "]" in name.attr_text:
-            to_delete.append(name.name)
-
-    for key in to_delete:
-        del wb.defined_names[key]
 
-
-
-# ------------------------------------------------------
-# REMOVE PIVOT CACHES
-# ------------------------------------------------------
-def remove_pivot_caches(wb):
-    if hasattr(wb, "_pivots"):
-        wb._pivots = []
-
-    if hasattr(wb, "_pivot_caches"):
-        wb._pivot_caches = []
+def _step(prof, progress, name):
+    # announce the step (the callback may cancel here), then time it
+    notify(progress, 'step', step=name)
+    return prof.phase(name)
 
 
 # ------------------------------------------------------
 # MAIN PUBLIC FUNCTION (GUI & CLI CALL THIS)
 # ------------------------------------------------------
-def cleanup_styles_file(input_file, output_file=None):
+def cleanup_styles_file(input_file, output_file=None, profiler=None, progress=None):
     """
-    Lightweight cleanup: remove excessive styles, drawings, and pivot caches.
+    Lightweight cleanup: remove excessive styles, drawings, and pivot cache
+    records (the caches are kept and refresh on load).
+    `profiler` (profiling.Profiler) records each step; `progress` is told
+    about each step before it starts and may raise progress.Cancelled.
     """
     if output_file is None:
         output_file = input_file.replace(".xlsx", "_STYLES_CLEANED.xlsx")
+    prof = profiler or NULL_PROFILER
 
-    wb = load_workbook(input_file, data_only=False)
+    with _step(prof, progress, 'load_workbook'):
+        wb = load_workbook(input_file, data_only=False)
 
-    remove_excessive_styles(wb)
-    remove_excel_objects(wb)
-    remove_pivot_caches(wb)
+    with _step(prof, progress, 'remove_styles'):
+        remove_excessive_styles(wb, profiler)
 
-    wb.save(output_file)
+    with _step(prof, progress, 'save'):
+        wb.save(output_file)
+    with _step(prof, progress, 'remove_objects'):
+        remove_objects(output_file, output_file)
+    with _step(prof, progress, 'strip_pivot_records'):
+        strip_pivot_records(output_file, output_file)
     return output_file
 
 
@@ -69,25 +49,36 @@ def cleanup_styles_file(input_file, output_file=None):
 # FULL CLEANUP (EXTERNAL LINKS + STYLES + OBJECTS)
 # Used by main.py --cleanup
 # ------------------------------------------------------
-def cleanup_excel_file(input_file, output_file=None):
+def cleanup_excel_file(input_file, output_file=None, profiler=None, progress=None):
     """
     Full cleanup pipeline:
         - external links
         - styles
         - drawings
-        - pivot caches
+        - pivot cache records (caches kept, refreshed on load)
+    `profiler` (profiling.Profiler) records each step; `progress` is told
+    about each step before it starts and may raise progress.Cancelled.
     """
     if output_file is None:
         output_file = input_file.replace(".xlsx", "_CLEANED.xlsx")
-
-    wb = load_workbook(input_file, data_only=False)
-
-    remove_external_links(wb)
-    remove_excessive_styles(wb)
-    remove_excel_objects(wb)
-    remove_pivot_caches(wb)
-
-    wb.save(output_file)
+    prof = profiler or NULL_PROFILER
+
+    # links go first, at the package level, while the cached values that
+    # replace the external formulas are still in the file
+    with _step(prof, progress, 'strip_external_links'):
+        strip_external_links(input_file, output_file)
+    with _step(prof, progress, 'load_workbook'):
+        wb = load_workbook(output_file, data_only=False)
+
+    with _step(prof, progress, 'remove_styles'):
+        remove_excessive_styles(wb, profiler)
+
+    with _step(prof, progress, 'save'):
+        wb.save(output_file)
+    with _step(prof, progress, 'remove_objects'):
+        remove_objects(output_file, output_file)
+    with _step(prof, progress, 'strip_pivot_records'):
+        strip_pivot_records(output_file, output_file)
     return output_file
 
 
@@ -5,28 +5,54 @@ import argparse
 import json
 from basic_corruption_checker import check_xlsx_structure
 from analyzer import analyze_xlsx
-from report_generator import generate_report
+from report_generator import REPORT_FORMATS, generate_report, report_format
+from profiling import Profiler, format_profile
 
 def main():
     p = argparse.ArgumentParser(description='Excel scanner tools')
     p.add_argument('file', help='xlsx file to scan')
     p.add_argument('--check', action='store_true', help='Run quick corruption check')
+    p.add_argument('--level', choices=['quick', 'crc', 'deep'], default='quick',
+                   help='Check level: quick (directory only), crc (verify members), deep (XML + relationships)')
     p.add_argument('--analyze', action='store_true', help='Run deep analyzer')
-    p.add_argument('--report', help='Write HTML report path (run analyze first)')
+    p.add_argument('--report', help='Write report path, .html / .json / .csv (run analyze first)')
+    p.add_argument('--report-format', choices=REPORT_FORMATS,
+                   help='Report format (default: from the --report extension, else html)')
+    p.add_argument('--engine', choices=['stream', 'openpyxl'], default='stream',
+                   help='Analyzer engine (openpyxl loads the full workbook; slower fallback)')
+    p.add_argument('--workers', type=int, default=1,
+                   help='Scan worksheets in N worker processes (stream engine)')
+    p.add_argument('--cache', help='Part cache database; unchanged sheets are not re-parsed')
+    p.add_argument('--profile', action='store_true',
+                   help='Record wall / CPU time and memory peak per phase and sheet')
+    p.add_argument('--formula-graph', action='store_true',
+                   help='Add formula dependency analysis (volatile closure, chains, hotspots)')
     args = p.parse_args()
+    profiler = Profiler() if args.profile else None
+    # settle the report format before the (possibly long) analysis
+    fmt = args.report_format
+    if args.report and not fmt:
+        try:
+            fmt = report_format(args.report)
+        except ValueError:
+            fmt = 'html'
 
     if args.check:
-        ok, msg = check_xlsx_structure(args.file)
+        ok, msg = check_xlsx_structure(args.file, args.level, profiler=profiler)
         print('OK' if ok else 'PROBLEM', '-', msg)
+        if profiler and not args.analyze:
+            print(format_profile(profiler.summary()))
 
     if args.analyze:
-        res = analyze_xlsx(args.file)
+        res = analyze_xlsx(args.file, engine=args.engine, workers=args.workers,
+                           cache_path=args.cache, formula_graph=args.formula_graph,
+                           profiler=profiler)
         print(json.dumps(res, indent=2))
         # save analyzer result to file for report if requested
         if args.report:
             with open(args.report + '.json', 'w', encoding='utf-8') as f:
                 json.dump(res, f, indent=2)
-            generate_report(res, args.report)
+            generate_report(res, args.report, fmt)
             print('Report generated at', args.report)
 
 if __name__ == '__main__':
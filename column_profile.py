@@ -0,0 +1,307 @@
+"""column_profile.py
+Per-column data profile of the worksheets: numbers stored as text,
+columns mixing value types, error values and very long text.
+
+The cells come from the analyzer's own pass over the sheet: a
+sheet_scanner.WorksheetScanner given a ColumnProfiler hands it every
+cell, so profiling adds no second parse. No per-cell objects are built:
+every cell appends its column, a type code, a text length, a numeric
+value and a shared-string / error index to flat typed buffers.
+Every BATCH_SIZE cells the buffers become NumPy arrays and are folded
+into per-column totals with vectorized operations (bincount,
+minimum.at / maximum.at). Shared strings are read once into two arrays
+(length, looks-like-a-number) that the batches index into.
+
+A column whose first value is text is taken to have a header: that cell
+does not make it a mixed-type column.
+
+    python column_profile.py book.xlsx
+"""
+import math
+import re
+import zipfile
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from sheet_scanner import WorksheetScanner, column_letter
+from shared_strings import SstScanner, sst_part
+from xlsx_package import workbook_sheets
+
+BATCH_SIZE = 1 << 16
+# text at least this long counts as long text (Excel's cell limit is 32767)
+LONG_TEXT = 1024
+
+TYPE_NAMES = ('blank', 'number', 'text', 'boolean', 'error', 'date')
+BLANK, NUMBER, TEXT, BOOLEAN, ERROR, DATE = range(len(TYPE_NAMES))
+# kinds of values that make a column "mixed" when more than one occurs
+VALUE_TYPES = (NUMBER, TEXT, BOOLEAN, DATE)
+ERROR_VALUES = ('#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A',
+                '#GETTING_DATA', '#SPILL!', '#CALC!', '#FIELD!', '#BLOCKED!', '#UNKNOWN!', 'other')
+_ERROR_CODES = {value: i for i, value in enumerate(ERROR_VALUES)}
+
+# text Excel would take for a number: 1234, -1,234.50, 1e5, 12%
+_NUMERIC_TEXT = re.compile(r'\s*[-+]?(?:\d{1,3}(?:,\d{3})+|\d+)?(?:\.\d+)?(?:[eE][-+]?\d+)?%?\s*')
+_DIGIT = re.compile(r'\d')
+
+
+def looks_numeric(text: str) -> bool:
+    return _NUMERIC_TEXT.fullmatch(text) is not None and _DIGIT.search(text) is not None
+
+
+def shared_string_table(z: zipfile.ZipFile) -> Tuple[np.ndarray, np.ndarray]:
+    """(length, looks_numeric) of every shared string, as NumPy arrays."""
+    lengths = array('i')
+    numeric = bytearray()
+
+    def on_entry(entry):
+        lengths.append(len(entry.text))
+        numeric.append(looks_numeric(entry.text))
+
+    part = sst_part(z)
+    if part is not None:
+        with z.open(part) as f:
+            SstScanner(on_entry).parse(f)
+    return (np.frombuffer(lengths, dtype=np.int32).copy(),
+            np.frombuffer(bytes(numeric), dtype=np.uint8).astype(bool))
+
+
+class ColumnStats:
+    """Per-column totals, grown as wider columns appear."""
+
+    def __init__(self):
+        self.width = 0
+        self.types = np.zeros((0, len(TYPE_NAMES)), dtype=np.int64)
+        self.errors = np.zeros((0, len(ERROR_VALUES)), dtype=np.int64)
+        self.formulas = np.zeros(0, dtype=np.int64)
+        self.numbers_as_text = np.zeros(0, dtype=np.int64)
+        self.long_text = np.zeros(0, dtype=np.int64)
+        self.text_length = np.zeros(0, dtype=np.int64)
+        self.max_length = np.zeros(0, dtype=np.int64)
+        self.number_sum = np.zeros(0, dtype=np.float64)
+        self.number_min = np.zeros(0, dtype=np.float64)
+        self.number_max = np.zeros(0, dtype=np.float64)
+        # first value of the column seen yet / was text (its header)
+        self.seen = np.zeros(0, dtype=bool)
+        self.header = np.zeros(0, dtype=np.int64)
+
+    def _grow(self, width: int):
+        extra = width - self.width
+        for name in ('types', 'errors'):
+            old = getattr(self, name)
+            setattr(self, name, np.vstack([old, np.zeros((extra, old.shape[1]), dtype=old.dtype)]))
+        for name in ('formulas', 'numbers_as_text', 'long_text', 'text_length', 'max_length', 'number_sum',
+                     'seen', 'header'):
+            old = getattr(self, name)
+            setattr(self, name, np.concatenate([old, np.zeros(extra, dtype=old.dtype)]))
+        self.number_min = np.concatenate([self.number_min, np.full(extra, np.inf)])
+        self.number_max = np.concatenate([self.number_max, np.full(extra, -np.inf)])
+        self.width = width
+
+    def add(self, cols: np.ndarray, types: np.ndarray, formulas: np.ndarray, lengths: np.ndarray,
+            numeric_text: np.ndarray, values: np.ndarray, errors: np.ndarray):
+        """Fold one batch in; `cols` are 0-based column indices."""
+        if not len(cols):
+            return
+        width = int(cols.max()) + 1
+        if width > self.width:
+            self._grow(width)
+        n = self.width
+        self.types += np.bincount(cols * len(TYPE_NAMES) + types,
+                                  minlength=n * len(TYPE_NAMES)).reshape(n, -1)
+        valued = types != BLANK
+        first_cols, first = np.unique(cols[valued], return_index=True)
+        new = ~self.seen[first_cols]
+        self.header[first_cols[new]] = types[valued][first[new]] == TEXT
+        self.seen[first_cols] = True
+        self.formulas += np.bincount(cols, weights=formulas, minlength=n).astype(np.int64)
+
+        text = types == TEXT
+        text_cols, text_lengths = cols[text], lengths[text]
+        self.numbers_as_text += np.bincount(text_cols, weights=numeric_text[text], minlength=n).astype(np.int64)
+        self.long_text += np.bincount(text_cols, weights=text_lengths >= LONG_TEXT, minlength=n).astype(np.int64)
+        self.text_length += np.bincount(text_cols, weights=text_lengths, minlength=n).astype(np.int64)
+        np.maximum.at(self.max_length, text_cols, text_lengths)
+
+        number = types == NUMBER
+        number_cols, number_values = cols[number], values[number]
+        finite = np.isfinite(number_values)
+        number_cols, number_values = number_cols[finite], number_values[finite]
+        self.number_sum += np.bincount(number_cols, weights=number_values, minlength=n)
+        np.minimum.at(self.number_min, number_cols, number_values)
+        np.maximum.at(self.number_max, number_cols, number_values)
+
+        error = types == ERROR
+        self.errors += np.bincount(cols[error] * len(ERROR_VALUES) + errors[error],
+                                   minlength=n * len(ERROR_VALUES)).reshape(n, -1)
+
+    def results(self) -> Dict[str, Dict[str, Any]]:
+        """{column letter: profile} for every column holding a value or formula."""
+        filled = self.types[:, 1:].sum(axis=1) + self.formulas
+        values = self.types[:, VALUE_TYPES].copy()
+        values[:, VALUE_TYPES.index(TEXT)] -= self.header
+        kinds = (values > 0).sum(axis=1)
+        columns = {}
+        for i in np.flatnonzero(filled):
+            types = self.types[i]
+            numbers = int(types[NUMBER])
+            texts = int(types[TEXT])
+            entry = {
+                'cells': int(types.sum()),
+                'types': {name: int(types[t]) for t, name in enumerate(TYPE_NAMES) if types[t]},
+                'formulas': int(self.formulas[i]),
+                'mixed_types': bool(kinds[i] > 1),
+                'numbers_as_text': int(self.numbers_as_text[i]),
+                'errors': {ERROR_VALUES[e]: int(c) for e, c in enumerate(self.errors[i]) if c},
+                'long_text': int(self.long_text[i]),
+                'max_text_length': int(self.max_length[i]),
+                'mean_text_length': round(int(self.text_length[i]) / texts, 1) if texts else None,
+            }
+            if numbers:
+                entry['min'] = _number(self.number_min[i])
+                entry['max'] = _number(self.number_max[i])
+                entry['mean'] = _number(self.number_sum[i] / numbers)
+            columns[column_letter(int(i) + 1)] = entry
+        return columns
+
+
+def _number(x: float):
+    if not math.isfinite(x):
+        return None
+    return int(x) if x.is_integer() and abs(x) < 2 ** 53 else round(float(x), 6)
+
+
+class ColumnProfiler:
+    """
+    Fills the batch buffers from the cells a WorksheetScanner reports
+    (add_cell) and flushes them into a ColumnStats.
+    """
+
+    def __init__(self, sst_lengths: np.ndarray, sst_numeric: np.ndarray):
+        self.sst_lengths = sst_lengths
+        self.sst_numeric = sst_numeric
+        self.stats = ColumnStats()
+        self._new_batch()
+
+    def _new_batch(self):
+        self.cols = array('i')
+        self.types = array('B')
+        self.formulas = array('B')
+        self.lengths = array('i')
+        self.numeric_text = array('B')
+        self.values = array('d')
+        self.refs = array('i')   # shared string index / error code, -1 otherwise
+
+    def add_cell(self, col: int, t: str, formula: int, text: str):
+        """One <c>: 1-based column, its t attribute, 1 if it has an <f>, its value text."""
+        ref = -1
+        value = math.nan
+        length = 0
+        numeric = 0
+        if not text and t != 'inlineStr':
+            kind = BLANK
+        elif t == 'n':
+            kind = NUMBER
+            try:
+                value = float(text)
+            except ValueError:
+                kind = TEXT
+                length = len(text)
+        elif t == 's':
+            kind = TEXT
+            try:
+                ref = int(text)
+            except ValueError:
+                ref = -1
+        elif t == 'inlineStr' or t == 'str':
+            kind = TEXT
+            length = len(text)
+            numeric = looks_numeric(text)
+        elif t == 'b':
+            kind = BOOLEAN
+        elif t == 'e':
+            kind = ERROR
+            ref = _ERROR_CODES.get(text, _ERROR_CODES['other'])
+        elif t == 'd':
+            kind = DATE
+        else:
+            kind = TEXT
+            length = len(text)
+        self.cols.append(col - 1)
+        self.types.append(kind)
+        self.formulas.append(formula)
+        self.lengths.append(length)
+        self.numeric_text.append(numeric)
+        self.values.append(value)
+        self.refs.append(ref)
+        if len(self.cols) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        cols = np.frombuffer(self.cols, dtype=np.int32).astype(np.int64)
+        types = np.frombuffer(self.types, dtype=np.uint8).astype(np.int64)
+        lengths = np.frombuffer(self.lengths, dtype=np.int32).astype(np.int64)
+        numeric_text = np.frombuffer(self.numeric_text, dtype=np.uint8).astype(bool)
+        refs = np.frombuffer(self.refs, dtype=np.int32)
+
+        # shared string cells take length / numeric look from the table
+        shared = (types == TEXT) & (refs >= 0) & (refs < len(self.sst_lengths))
+        lengths[shared] = self.sst_lengths[refs[shared]]
+        numeric_text[shared] = self.sst_numeric[refs[shared]]
+        errors = np.where(types == ERROR, refs, 0).astype(np.int64)
+
+        self.stats.add(cols, types, np.frombuffer(self.formulas, dtype=np.uint8), lengths,
+                       numeric_text, np.frombuffer(self.values, dtype=np.float64), errors)
+        self._new_batch()
+
+    def results(self) -> Dict[str, Dict[str, Any]]:
+        self.flush()
+        return self.stats.results()
+
+
+def profile_columns(path: str, sheets: Optional[List[str]] = None,
+                    on_sheet=None) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    {sheet name: {column letter: profile}} for the worksheets of `path`
+    (only those named in `sheets`, if given), scanning them just for this.
+    on_sheet(name) is called before each sheet and may raise to abort.
+    """
+    with zipfile.ZipFile(path, 'r') as z:
+        names = set(z.namelist())
+        sst_lengths, sst_numeric = shared_string_table(z)
+        profiles = {}
+        for sheet in workbook_sheets(z):
+            if sheet['type'] != 'worksheet' or sheet['part'] not in names:
+                continue
+            if sheets is not None and sheet['name'] not in sheets:
+                continue
+            if on_sheet is not None:
+                on_sheet(sheet['name'])
+            profiler = ColumnProfiler(sst_lengths, sst_numeric)
+            with z.open(sheet['part']) as f:
+                WorksheetScanner(profiler).parse(f)
+            profiles[sheet['name']] = profiler.results()
+    return profiles
+
+
+def column_issues(columns: Dict[str, Dict[str, Any]]) -> Dict[str, int]:
+    """Sheet / workbook totals of one profile: cells or columns with each issue."""
+    return {
+        'numbers_as_text': sum(c['numbers_as_text'] for c in columns.values()),
+        'error_cells': sum(sum(c['errors'].values()) for c in columns.values()),
+        'long_text_cells': sum(c['long_text'] for c in columns.values()),
+        'mixed_type_columns': sum(c['mixed_types'] for c in columns.values()),
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Per-column data profile of the worksheets")
+    parser.add_argument("input_file", help="Path to the Excel file")
+    parser.add_argument("--sheet", action="append", help="Only this sheet (repeatable)")
+    args = parser.parse_args()
+
+    print(json.dumps(profile_columns(args.input_file, args.sheet), indent=2))
@@ -0,0 +1,290 @@
+"""external_links.py
+Remove external workbook links at the package level.
+
+openpyxl's wb.external_links only drops the link parts; formulas such as
+=[1]Sheet1!A1 survive and point at nothing. This module works on the zip
+directly, in one streaming pass:
+  - drops xl/externalLinks/* and their relationships / content types
+  - removes <externalReferences> and external defined names from workbook.xml
+  - replaces every formula that references an external workbook with its
+    cached <v> value (shared formulas based on such a formula included)
+  - drops xl/calcChain.xml, which Excel rebuilds, since it would list
+    cells that no longer hold formulas
+"""
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+from typing import Any, Dict, IO, List, Set
+
+from xlsx_package import (CONTENT_TYPES_PART, content_types_rewriter, find_workbook_part,
+                          local_name, read_relationships, relationships_rewriter, rels_part_for,
+                          rewrite_package, workbook_sheets)
+from xml_rewrite import XmlRewriter, escape_text, local
+
+EXTERNAL_LINK_REL = '/externalLink'
+CALC_CHAIN_REL = '/calcChain'
+EXTERNAL_LINKS_FOLDER = 'xl/externalLinks/'
+
+# [1]Sheet1!A1, '[2]My Sheet'!B2, [3]!Name: the workbook index, then a
+# sheet name (or nothing, for a defined name) and '!'
+_BOOK_INDEX = re.compile(r"\[([0-9]+)\]")
+_SHEET_THEN_BANG = re.compile(r"[^\s!'\"(),;=<>&+\-*/^%\[\]{}]*!")
+
+
+def _skip_quoted(text: str, i: int) -> int:
+    """Index after the "..." / '...' starting at i (doubled quotes escape)."""
+    quote = text[i]
+    i += 1
+    while i < len(text):
+        if text[i] == quote:
+            if text[i + 1:i + 2] != quote:
+                return i + 1
+            i += 1
+        i += 1
+    return i
+
+
+def _skip_brackets(text: str, i: int) -> int:
+    """Index after the (nested) [...] starting at i; ' escapes the next character."""
+    depth = 0
+    while i < len(text):
+        ch = text[i]
+        if ch == "'":
+            i += 1
+        elif ch == '[':
+            depth += 1
+        elif ch == ']':
+            depth -= 1
+            if not depth:
+                return i + 1
+        i += 1
+    return i
+
+
+def external_book_indices(text: str) -> Set[int]:
+    """
+    Indices n of the external workbooks a formula refers to ([n]Sheet!A1,
+    '[n]My Sheet'!A1, [n]!Name). String literals and structured
+    references (Table1[[#This Row],[1]]) are skipped.
+    """
+    found = set()
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch == '"':
+            i = _skip_quoted(text, i)
+        elif ch == "'":
+            end = _skip_quoted(text, i)
+            match = _BOOK_INDEX.match(text, i + 1)
+            if match and text[end:end + 1] == '!':
+                found.add(int(match.group(1)))
+            i = end
+        elif ch == '[':
+            match = _BOOK_INDEX.match(text, i)
+            structured = i and (text[i - 1].isalnum() or text[i - 1] in '_.\\]')
+            if match and not structured and _SHEET_THEN_BANG.match(text, match.end()):
+                found.add(int(match.group(1)))
+                i = match.end()
+            else:
+                i = _skip_brackets(text, i)
+        else:
+            i += 1
+    return found
+
+
+def is_external_formula(text: str, books: Set[int]) -> bool:
+    """True when `text` refers to one of the external workbooks numbered `books`."""
+    return '[' in text and not books.isdisjoint(external_book_indices(text))
+
+
+def external_reference_count(z: zipfile.ZipFile, workbook_part: str) -> int:
+    """Number of <externalReference> entries in workbook.xml; formulas use 1..n."""
+    root = ET.fromstring(z.read(workbook_part))
+    return sum(1 for elem in root.iter() if local_name(elem.tag) == 'externalReference')
+
+
+class _WorkbookLinkRewriter(XmlRewriter):
+    def __init__(self, out: IO[bytes], removed_names: List[str], books: Set[int]):
+        super().__init__(out)
+        self.removed_names = removed_names
+        self.books = books
+        self.in_name = False
+        self.name_attrs = None
+        self.name_text = []
+
+    def start(self, name, attrs):
+        tag = local(name)
+        if tag == 'externalReferences':
+            return None
+        if tag == 'definedName':
+            self.begin_capture()
+            self.in_name = True
+            self.name_attrs = attrs
+            self.name_text = []
+        return attrs
+
+    def text(self, data):
+        if self.in_name:
+            self.name_text.append(data)
+        return data
+
+    def closed(self, name):
+        if self.in_name and local(name) == 'definedName':
+            self.in_name = False
+            markup = self.end_capture()
+            if is_external_formula(''.join(self.name_text), self.books):
+                self.removed_names.append(self.name_attrs.get('name', ''))
+            else:
+                self.write(markup)
+
+
+class _SheetLinkRewriter(XmlRewriter):
+    """
+    Buffers one <c> at a time; cells whose formula references an external
+    workbook are re-emitted with their cached value only.
+    """
+
+    def __init__(self, out: IO[bytes], sheet_name: str, rewritten: List[Dict[str, str]],
+                 books: Set[int]):
+        super().__init__(out)
+        self.sheet_name = sheet_name
+        self.books = books
+        self.rewritten = rewritten
+        self.external_shared = {}  # si -> master formula text
+
+        self.in_cell = False
+        self.cell_attrs = None
+        self.external = False
+        self.formula = ''
+        self.value = None
+        self._formula_attrs = {}
+        self._collect = None
+
+    def start(self, name, attrs):
+        tag = local(name)
+        if tag == 'c':
+            self.begin_capture()
+            self.in_cell = True
+            self.cell_attrs = dict(attrs)
+            self.external = False
+            self.formula = ''
+            self.value = None
+        elif self.in_cell and tag in ('f', 'v'):
+            self._collect = []
+            if tag == 'f':
+                self._formula_attrs = attrs
+        return attrs
+
+    def text(self, data):
+        if self._collect is not None:
+            self._collect.append(data)
+        return data
+
+    def end(self, name):
+        if self._collect is None:
+            return
+        tag = local(name)
+        text = ''.join(self._collect)
+        self._collect = None
+        if tag == 'v':
+            self.value = text
+            return
+
+        si = self._formula_attrs.get('si')
+        if text:
+            self.formula = text
+            if is_external_formula(text, self.books):
+                self.external = True
+                if self._formula_attrs.get('t') == 'shared' and si is not None:
+                    self.external_shared[si] = text
+        elif si is not None and si in self.external_shared:
+            self.formula = self.external_shared[si]
+            self.external = True
+
+    def closed(self, name):
+        if not self.in_cell or local(name) != 'c':
+            return
+        self.in_cell = False
+        markup = self.end_capture()
+        if not self.external:
+            self.write(markup)
+            return
+
+        attrs = self.cell_attrs
+        self.rewritten.append({'sheet': self.sheet_name, 'cell': attrs.get('r', ''),
+                               'formula': self.formula})
+        cell_type = attrs.pop('t', None)
+        if self.value is None:
+            self.write_element('c', attrs)
+        elif cell_type == 'str':
+            # formula string results become inline strings
+            attrs['t'] = 'inlineStr'
+            self.write_start('c', attrs)
+            self.write(f'<is><t xml:space="preserve">{escape_text(self.value)}</t></is>')
+            self.write_end('c')
+        else:
+            if cell_type in ('b', 'e'):
+                attrs['t'] = cell_type
+            self.write_start('c', attrs)
+            self.write(f'<v>{escape_text(self.value)}</v>')
+            self.write_end('c')
+
+
+def strip_external_links(input_file: str, output_file: str = None) -> Dict[str, Any]:
+    """
+    Write a copy of `input_file` without external workbook links.
+    `output_file` may equal `input_file`.
+
+    Returns {'output', 'links_removed', 'defined_names_removed',
+             'cells_rewritten', 'rewritten_cells': [{'sheet', 'cell', 'formula'}],
+             'bytes_before', 'bytes_after'}
+    """
+    if output_file is None:
+        output_file = input_file.replace(".xlsx", "_NOLINKS.xlsx")
+
+    with zipfile.ZipFile(input_file, 'r') as z:
+        names = set(z.namelist())
+        workbook_part = find_workbook_part(z)
+        wb_rels = read_relationships(z, workbook_part)
+        sheets = workbook_sheets(z)
+        books = set(range(1, external_reference_count(z, workbook_part) + 1))
+
+    link_ids = {rid for rid, (t, _) in wb_rels.items() if t.endswith(EXTERNAL_LINK_REL)}
+    removed = {n for n in names if n.startswith(EXTERNAL_LINKS_FOLDER)}
+    removed |= {target for rid, (_, target) in wb_rels.items() if rid in link_ids}
+
+    report = {'output': output_file, 'links_removed': len(link_ids),
+              'defined_names_removed': [], 'rewritten_cells': []}
+
+    rewriters = {}
+    if link_ids or removed:
+        calc_ids = {rid for rid, (t, _) in wb_rels.items() if t.endswith(CALC_CHAIN_REL)}
+        removed |= {wb_rels[rid][1] for rid in calc_ids}
+
+        rewriters[workbook_part] = \
+            lambda src, dst: _WorkbookLinkRewriter(dst, report['defined_names_removed'], books).rewrite(src)
+        rewriters[rels_part_for(workbook_part)] = relationships_rewriter(link_ids | calc_ids)
+        if CONTENT_TYPES_PART in names:
+            rewriters[CONTENT_TYPES_PART] = content_types_rewriter(removed)
+
+        for sheet in sheets:
+            if books and sheet['type'] == 'worksheet' and sheet['part'] in names:
+                rewriters[sheet['part']] = (
+                    lambda src, dst, name=sheet['name']:
+                    _SheetLinkRewriter(dst, name, report['rewritten_cells'], books).rewrite(src))
+
+    report.update(rewrite_package(input_file, output_file, rewriters, drop=removed & names))
+    report['cells_rewritten'] = len(report['rewritten_cells'])
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Remove external workbook links")
+    parser.add_argument("input_file", help="Path to the Excel file")
+    parser.add_argument("-o", "--output", help="Optional output file path")
+    args = parser.parse_args()
+
+    print(json.dumps(strip_external_links(args.input_file, args.output), indent=2))
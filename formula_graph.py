@@ -0,0 +1,630 @@
+"""formula_graph.py
+Formula dependency graph: which cells recalculate because of volatile
+functions, how deep the dependency chains go and which cells feed the
+most formulas.
+
+Formulas are read with the same streaming SAX pass as sheet_scanner and
+tokenized once per distinct *shape*: references are stored relative to
+the formula's own cell (R1C1 style), so =A1*2 in B1 and =A2*2 in B2 - and
+every child of a shared formula - point at the same template. Per
+formula cell the graph keeps four ints (sheet, row, col, template);
+edges are only materialised between formula cells, in flat arrays:
+
+  - precedents are resolved from the template and the cell position when
+    the graph is built (shared formulas and ranges are never expanded
+    into text or per-cell objects)
+  - a range only contributes the formula cells inside it, found by
+    bisecting the sorted cell keys column by column; large absolute
+    ranges (SUM($A:$A) copied down a column) become one shared range
+    node instead of N x M edges
+  - ranges with one fixed row end (running totals, SUM(B$1:B1) copied
+    down) become a chain of range nodes, each one the previous range
+    plus the rows it adds, so the edge count stays linear
+
+Volatile propagation, chain depth and cycle detection are one
+topological pass (Kahn) over those arrays.
+"""
+import heapq
+import re
+import zipfile
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+from xml.parsers import expat
+
+from sheet_scanner import (CHUNK_SIZE, MAX_COLUMN, MAX_ROW, VOLATILE_FUNCS, column_index,
+                           column_letter, split_ref)
+from xlsx_package import workbook_sheets
+
+# ranges holding at most this many formula cells are linked directly
+SMALL_RANGE = 16
+# hard cap on stored edges (4 bytes each); the result says when it was hit
+MAX_EDGES = 50_000_000
+
+_ROW_BITS = 21
+_COL_BITS = 14
+
+_SHEET = r"(?:'(?:[^']|'')+'|\[\d+\][^\s!'\"(),;]*|[^\W\d][\w.]*(?::[^\W\d][\w.]*)?)"
+_CELL = r"\$?[A-Za-z]{1,3}\$?\d{1,7}"
+_AREA = rf"(?:{_CELL}(?::{_CELL})?|\$?[A-Za-z]{{1,3}}:\$?[A-Za-z]{{1,3}}|\$?\d{{1,7}}:\$?\d{{1,7}})"
+
+TOKEN_REGEX = re.compile(rf"""
+    (?P<string>"(?:[^"]|"")*")
+  | (?P<error>\#(?:NULL!|DIV/0!|VALUE!|REF!|NAME\?|NUM!|N/A|GETTING_DATA|SPILL!|CALC!))
+  | (?P<ref>(?:{_SHEET}!)?{_AREA}(?![\w(.!\[]))
+  | (?P<struct>\[(?:[^\[\]]|\[[^\]]*\])*\])
+  | (?P<func>[A-Za-z_\\][\w.]*(?=\())
+  | (?P<name>[A-Za-z_\\][\w.]*)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<op><>|<=|>=|[-+*/^&=<>%:])
+  | (?P<paren>[(){{}}])
+  | (?P<sep>[,;])
+  | (?P<space>\s+)
+  | (?P<other>.)
+""", re.VERBOSE)
+
+_SIDE_REGEX = re.compile(r"(\$?)([A-Za-z]{1,3})?(\$?)(\d+)?$")
+_FUNC_PREFIXES = ('_xlfn.', '_xlws.')
+
+
+def tokenize(formula: str) -> Iterator[Tuple[str, str]]:
+    """
+    Yields (kind, text) for a formula as stored in the sheet XML (no
+    leading '='). kind is one of string, error, ref, struct, func, name,
+    number, op, paren, sep, other; whitespace is dropped.
+    """
+    for m in TOKEN_REGEX.finditer(formula):
+        kind = m.lastgroup
+        if kind != 'space':
+            yield kind, m.group()
+
+
+def function_name(token: str) -> str:
+    """'_xlfn.STDEV.S' -> 'STDEV.S'"""
+    name = token.upper()
+    for prefix in _FUNC_PREFIXES:
+        if name.startswith(prefix.upper()):
+            return name[len(prefix):]
+    return name
+
+
+def _parse_side(text: str) -> Optional[Tuple[int, int, bool, bool]]:
+    """'$B7' -> (7, 2, False, True); row / col is 0 when missing."""
+    m = _SIDE_REGEX.match(text)
+    if not m:
+        return None
+    col_dollar, letters, row_dollar, digits = m.groups()
+    if letters is None:
+        # row-only side ('$3'): the first '$' belongs to the row
+        return int(digits), 0, bool(col_dollar or row_dollar), False
+    return (int(digits) if digits else 0), column_index(letters), bool(row_dollar), bool(col_dollar)
+
+
+def parse_reference(token: str) -> Optional[Tuple[Optional[str], int, int, int, int, int]]:
+    """
+    'Data'!$A$1:B10 -> ('Data', 1, 1, 10, 2, flags); sheet is None for
+    references on the formula's own sheet. flags marks absolute parts:
+    1 first row, 2 first column, 4 last row, 8 last column.
+    External ([1]Sheet!A1) and 3D (Sheet1:Sheet3!A1) references return
+    None since they cannot be resolved inside this workbook.
+    """
+    sheet = None
+    area = token
+    if '!' in token:
+        sheet, _, area = token.rpartition('!')
+        if sheet.startswith("'"):
+            sheet = sheet[1:-1].replace("''", "'")
+        if sheet.startswith('[') or ':' in sheet:
+            return None
+
+    first, _, last = area.partition(':')
+    a = _parse_side(first)
+    b = _parse_side(last) if last else a
+    if a is None or b is None:
+        return None
+    r1, c1, r1_abs, c1_abs = a
+    r2, c2, r2_abs, c2_abs = b
+    if not c1:  # whole rows, 3:5
+        c1, c2, c1_abs, c2_abs = 1, MAX_COLUMN, True, True
+    elif not r1:  # whole columns, A:C
+        r1, r2, r1_abs, r2_abs = 1, MAX_ROW, True, True
+    flags = r1_abs | c1_abs << 1 | r2_abs << 2 | c2_abs << 3
+    return sheet, r1, c1, r2, c2, flags
+
+
+def formula_template(formula: str, row: int, col: int,
+                     sheet_index: Dict[str, int]) -> Tuple[bool, Tuple[Tuple[int, ...], ...]]:
+    """
+    (volatile, refs) for a formula anchored at (row, col). Relative parts
+    of each reference are stored as offsets from the anchor and the sheet
+    as -1 when it is the formula's own sheet, so copies of one formula
+    produce the same template.
+    """
+    volatile = False
+    refs = []
+    for kind, text in tokenize(formula):
+        if kind == 'func':
+            if function_name(text) in VOLATILE_FUNCS:
+                volatile = True
+        elif kind == 'ref':
+            parsed = parse_reference(text)
+            if parsed is None:
+                continue
+            sheet, r1, c1, r2, c2, flags = parsed
+            if sheet is None:
+                s = -1
+            else:
+                s = sheet_index.get(sheet.lower())
+                if s is None:
+                    continue
+            refs.append((s,
+                         r1 if flags & 1 else r1 - row,
+                         c1 if flags & 2 else c1 - col,
+                         r2 if flags & 4 else r2 - row,
+                         c2 if flags & 8 else c2 - col,
+                         flags))
+    return volatile, tuple(refs)
+
+
+def cell_key(sheet: int, col: int, row: int) -> int:
+    """Sort key ordering cells by sheet, column, row (column ranges are contiguous)."""
+    return (sheet << (_ROW_BITS + _COL_BITS)) | (col << _ROW_BITS) | row
+
+
+class FormulaCollector:
+    """
+    SAX handler passing every formula cell of one worksheet to
+    `callback(row, col, text, attrs)`; also tracks the used extent.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.row_idx = 0
+        self.col_idx = 0
+        self.max_row = 0
+        self.max_col = 0
+        self._in_formula = False
+        self._formula_attrs = None
+        self._text = []
+
+    def start(self, name: str, attrs: Dict[str, str]):
+        if ':' in name:
+            name = name.rpartition(':')[2]
+        if name == 'c':
+            ref = attrs.get('r')
+            if ref:
+                self.row_idx, self.col_idx = split_ref(ref)
+            else:
+                self.col_idx += 1
+            if self.row_idx > self.max_row:
+                self.max_row = self.row_idx
+            if self.col_idx > self.max_col:
+                self.max_col = self.col_idx
+        elif name == 'f':
+            self._in_formula = True
+            self._formula_attrs = attrs
+            self._text = []
+        elif name == 'row':
+            r = attrs.get('r')
+            self.row_idx = int(r) if r else self.row_idx + 1
+            self.col_idx = 0
+
+    def end(self, name: str):
+        if self._in_formula:
+            self._in_formula = False
+            self.callback(self.row_idx, self.col_idx, ''.join(self._text), self._formula_attrs)
+
+    def characters(self, data: str):
+        if self._in_formula:
+            self._text.append(data)
+
+    def parse(self, source: IO[bytes]):
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.characters
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.Parse(chunk, False)
+        parser.Parse(b'', True)
+
+
+class FormulaGraph:
+    """
+    Array-backed dependency graph. Node ids 0..N-1 are formula cells
+    (sorted by cell_key after build()), N.. are shared range nodes.
+    """
+
+    def __init__(self, sheet_names: List[str]):
+        self.sheet_names = list(sheet_names)
+        self.sheet_index = {name.lower(): i for i, name in enumerate(self.sheet_names)}
+        self.extent = [(1, 1)] * len(self.sheet_names)
+
+        self.node_sheet = array('i')
+        self.node_row = array('i')
+        self.node_col = array('i')
+        self.node_template = array('i')
+
+        self.templates = []  # [(volatile, refs)]
+        self._template_ids = {}
+        self._shared = {}  # (sheet, si) -> template id
+
+        self.keys = array('q')
+        self.range_start = array('q')
+        self.range_members = array('i')
+        self.pred_start = array('q')
+        self.preds = array('i')
+        self.node_reads = array('q')
+        self.truncated = False
+
+    # ---- collection --------------------------------------------------
+    def _template_id(self, template) -> int:
+        tid = self._template_ids.get(template)
+        if tid is None:
+            tid = self._template_ids[template] = len(self.templates)
+            self.templates.append(template)
+        return tid
+
+    def add_formula(self, sheet: int, row: int, col: int, text: str, attrs: Dict[str, str]):
+        kind = attrs.get('t')
+        if kind == 'dataTable' or not row or not col:
+            return
+        si = attrs.get('si')
+        if text:
+            tid = self._template_id(formula_template(text, row, col, self.sheet_index))
+            if kind == 'shared' and si is not None:
+                self._shared[(sheet, si)] = tid
+        else:
+            # shared formula child: same template, anchored at this cell
+            tid = self._shared.get((sheet, si))
+            if tid is None:
+                return
+        self.node_sheet.append(sheet)
+        self.node_row.append(row)
+        self.node_col.append(col)
+        self.node_template.append(tid)
+
+    def add_sheet(self, sheet: int, source: IO[bytes]):
+        collector = FormulaCollector(
+            lambda row, col, text, attrs: self.add_formula(sheet, row, col, text, attrs))
+        collector.parse(source)
+        self.extent[sheet] = (max(collector.max_row, 1), max(collector.max_col, 1))
+        self._shared = {k: v for k, v in self._shared.items() if k[0] != sheet}
+
+    # ---- graph -------------------------------------------------------
+    def _sort_nodes(self):
+        n = len(self.node_template)
+        keys = [cell_key(self.node_sheet[i], self.node_col[i], self.node_row[i]) for i in range(n)]
+        order = sorted(range(n), key=keys.__getitem__)
+        self.keys = array('q', (keys[i] for i in order))
+        del keys
+        for attr in ('node_sheet', 'node_row', 'node_col', 'node_template'):
+            old = getattr(self, attr)
+            setattr(self, attr, array('i', (old[i] for i in order)))
+
+    def lookup(self, sheet: int, row: int, col: int) -> int:
+        """Node id of a formula cell, -1 for constants / empty cells."""
+        key = cell_key(sheet, col, row)
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+        return -1
+
+    def cells_in(self, sheet: int, r1: int, c1: int, r2: int, c2: int) -> List[Tuple[int, int]]:
+        """[(lo, hi)] node id spans of the formula cells inside a range."""
+        spans = []
+        keys = self.keys
+        for c in range(c1, c2 + 1):
+            lo = bisect_left(keys, cell_key(sheet, c, r1))
+            hi = bisect_right(keys, cell_key(sheet, c, r2), lo)
+            if hi > lo:
+                spans.append((lo, hi))
+        return spans
+
+    def _new_range(self, n: int, base: int, spans) -> int:
+        rnode = len(self.range_start)
+        self.range_start.append(len(self.range_members))
+        if base >= 0:
+            self.range_members.append(n + base)
+        for lo, hi in spans:
+            self.range_members.extend(range(lo, hi))
+        return rnode
+
+    def _growing_range(self, chains, n: int, s: int, fixed: int, moving: int,
+                       c1: int, c2: int) -> int:
+        """
+        Range node for rows fixed..moving (either direction) of columns
+        c1..c2; -1 when it holds no formula cells. A chain keeps one node
+        per row holding formula cells, each the previous node plus that
+        row, so the rows between the nearest built node and `moving` are
+        added row by row, starting at the fixed end.
+        """
+        down = moving >= fixed
+        ends, nodes = chains.setdefault((s, fixed, c1, c2, down), ([], {}))
+        key = moving if down else -moving
+        i = bisect_right(ends, key)
+        if i and ends[i - 1] == key:
+            return nodes[key]
+        base = nodes[ends[i - 1]] if i else -1
+        reached = abs(ends[i - 1]) if i else None
+        if down:
+            lo, hi = (reached + 1 if i else fixed), moving
+        else:
+            lo, hi = moving, (reached - 1 if i else fixed)
+
+        cells = sorted(((self.node_row[node], node)
+                        for a, b in self.cells_in(s, lo, c1, hi, c2) for node in range(a, b)),
+                       reverse=not down)
+        k = 0
+        while k < len(cells):
+            row = cells[k][0]
+            rnode = len(self.range_start)
+            self.range_start.append(len(self.range_members))
+            if base >= 0:
+                self.range_members.append(n + base)
+            while k < len(cells) and cells[k][0] == row:
+                self.range_members.append(cells[k][1])
+                k += 1
+            base = rnode
+            row_key = row if down else -row
+            if row_key != key:
+                insort(ends, row_key)
+                nodes[row_key] = rnode
+        if base >= 0:
+            insort(ends, key)
+            nodes[key] = base
+        return base
+
+    def build(self, max_edges: int = MAX_EDGES):
+        """Resolve every template into precedent edges."""
+        self._sort_nodes()
+        n = len(self.node_template)
+        range_ids = {}
+        chains = {}
+        preds = self.preds
+        members = self.range_members
+        pred_start = self.pred_start
+        reads = self.node_reads
+
+        for node in range(n):
+            pred_start.append(len(preds))
+            sheet, row, col = self.node_sheet[node], self.node_row[node], self.node_col[node]
+            node_reads = 0
+            for s, r1, c1, r2, c2, flags in self.templates[self.node_template[node]][1]:
+                s = sheet if s < 0 else s
+                if not flags & 1:
+                    r1 += row
+                if not flags & 2:
+                    c1 += col
+                if not flags & 4:
+                    r2 += row
+                if not flags & 8:
+                    c2 += col
+                # exactly one row end absolute: a running total or a
+                # "rows to the end" range, expanded as a chain
+                growing = (flags ^ flags >> 2) & 1
+                swapped = r1 > r2
+                if swapped:
+                    r1, r2 = r2, r1
+                if c1 > c2:
+                    c1, c2 = c2, c1
+                if r1 < 1 or c1 < 1 or r2 > MAX_ROW or c2 > MAX_COLUMN:
+                    continue  # shifted off the grid: #REF!
+                max_r, max_c = self.extent[s]
+                r2 = min(r2, max_r)
+                c2 = min(c2, max_c)
+                if r1 > r2 or c1 > c2:
+                    continue
+                node_reads += (r2 - r1 + 1) * (c2 - c1 + 1)
+                if self.truncated:
+                    continue
+
+                if r1 == r2 and c1 == c2:
+                    target = self.lookup(s, r1, c1)
+                    if target >= 0:
+                        preds.append(target)
+                    continue
+
+                if growing:
+                    if bool(flags & 1) != swapped:  # top row fixed
+                        rnode = self._growing_range(chains, n, s, r1, r2, c1, c2)
+                    else:
+                        rnode = self._growing_range(chains, n, s, r2, r1, c1, c2)
+                    if rnode >= 0:
+                        preds.append(n + rnode)
+                    continue
+
+                shared = flags & 5 == 5  # rows fixed: repeats down a column
+                rkey = (s, r1, c1, r2, c2)
+                rnode = range_ids.get(rkey) if shared else None
+                if rnode is None:
+                    spans = self.cells_in(s, r1, c1, r2, c2)
+                    count = sum(hi - lo for lo, hi in spans)
+                    if not count:
+                        continue
+                    if not shared or count <= SMALL_RANGE:
+                        for lo, hi in spans:
+                            preds.extend(range(lo, hi))
+                        continue
+                    rnode = range_ids[rkey] = self._new_range(n, -1, spans)
+                preds.append(n + rnode)
+
+            reads.append(node_reads)
+            if len(preds) + len(members) > max_edges:
+                self.truncated = True
+        pred_start.append(len(preds))
+        self.range_start.append(len(members))
+
+    def _precedents(self, node: int, n: int):
+        if node < n:
+            return self.preds[self.pred_start[node]:self.pred_start[node + 1]]
+        r = node - n
+        return self.range_members[self.range_start[r]:self.range_start[r + 1]]
+
+    def _dependents(self, n: int, total: int) -> Tuple[array, array]:
+        """Reverse CSR: (dep_start, deps) over all nodes."""
+        counts = array('q', bytes(8 * (total + 1)))
+        for p in self.preds:
+            counts[p + 1] += 1
+        for m in self.range_members:
+            counts[m + 1] += 1
+        for i in range(total):
+            counts[i + 1] += counts[i]
+        dep_start = counts
+        fill = array('q', dep_start)
+        deps = array('i', bytes(4 * dep_start[total]))
+        for node in range(total):
+            for p in self._precedents(node, n):
+                deps[fill[p]] = node
+                fill[p] += 1
+        return dep_start, deps
+
+    def cell_name(self, node: int) -> str:
+        name = self.sheet_names[self.node_sheet[node]]
+        return f"{name}!{column_letter(self.node_col[node])}{self.node_row[node]}"
+
+    def analyze(self, top: int = 20) -> Dict[str, Any]:
+        n = len(self.node_template)
+        total = n + len(self.range_start) - 1
+        dep_start, deps = self._dependents(n, total)
+
+        remaining = array('i', (len(self._precedents(i, n)) for i in range(total)))
+        depth = array('i', bytes(4 * total))
+        parent = array('i', [-1]) * total
+        dirty = bytearray(total)
+        for node in range(n):
+            if self.templates[self.node_template[node]][0]:
+                dirty[node] = 1
+        volatile_cells = sum(dirty)
+
+        # Kahn: a node is finished once all of its precedents are
+        queue = array('i', (i for i in range(total) if not remaining[i]))
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            if node < n:
+                depth[node] += 1
+            d_node, f_node = depth[node], dirty[node]
+            for i in range(dep_start[node], dep_start[node + 1]):
+                d = deps[i]
+                if d_node > depth[d]:
+                    depth[d] = d_node
+                    parent[d] = node
+                if f_node:
+                    dirty[d] = 1
+                remaining[d] -= 1
+                if not remaining[d]:
+                    queue.append(d)
+        finished = sum(1 for i in queue if i < n)
+
+        # formula cells reading each range node, through chained ranges too
+        # (dependents come after their precedents in the Kahn order)
+        range_fanout = array('q', (dep_start[d + 1] - dep_start[d] for d in range(n, total)))
+        for node in reversed(queue):
+            if node >= n:
+                range_fanout[node - n] = sum(1 if d < n else range_fanout[d - n]
+                                             for d in deps[dep_start[node]:dep_start[node + 1]])
+
+        def fanout(node):
+            count = 0
+            for i in range(dep_start[node], dep_start[node + 1]):
+                d = deps[i]
+                count += 1 if d < n else range_fanout[d - n]
+            return count
+
+        result: Dict[str, Any] = {
+            'formula_cells': n,
+            'formula_templates': len(self.templates),
+            'edges': len(self.preds) + len(self.range_members),
+            'range_nodes': total - n,
+            'volatile_cells': volatile_cells,
+            'volatile_closure': 0,
+            'circular_cells': n - finished,
+            'longest_chain': None,
+            'recalc_cost': {'cells_recalculated': 0, 'cell_reads': 0},
+            'hotspots': [],
+            'sheets': {},
+            'truncated': self.truncated,
+        }
+        if not n:
+            return result
+
+        closure = 0
+        reads = 0
+        per_sheet = {}
+        for node in range(n):
+            entry = per_sheet.setdefault(self.node_sheet[node], [0, 0])
+            entry[0] += 1
+            if dirty[node]:
+                closure += 1
+                reads += self.node_reads[node]
+                entry[1] += 1
+        result['volatile_closure'] = closure
+        result['recalc_cost'] = {'cells_recalculated': closure, 'cell_reads': reads}
+        result['sheets'] = {self.sheet_names[s]: {'formula_cells': c, 'volatile_closure': v}
+                            for s, (c, v) in sorted(per_sheet.items())}
+
+        end = max(range(n), key=depth.__getitem__)
+        start = end
+        node = parent[end]
+        while node >= 0:
+            if node < n:
+                start = node
+            node = parent[node]
+        result['longest_chain'] = {'length': depth[end], 'start': self.cell_name(start),
+                                   'end': self.cell_name(end)}
+
+        for node in heapq.nlargest(top, range(n), key=fanout):
+            count = fanout(node)
+            if not count:
+                break
+            result['hotspots'].append({
+                'cell': self.cell_name(node),
+                'dependents': count,
+                'volatile': bool(self.templates[self.node_template[node]][0]),
+                'in_volatile_closure': bool(dirty[node]),
+            })
+        return result
+
+
+def analyze_formula_graph(path: str, top: int = 20, max_edges: int = MAX_EDGES) -> Dict[str, Any]:
+    """
+    Build the dependency graph of every worksheet in `path`.
+
+    Returns {'formula_cells', 'formula_templates', 'edges', 'range_nodes',
+             'volatile_cells', 'volatile_closure', 'circular_cells',
+             'longest_chain': {'length', 'start', 'end'},
+             'recalc_cost': {'cells_recalculated', 'cell_reads'},
+             'hotspots': [{'cell', 'dependents', 'volatile', 'in_volatile_closure'}],
+             'sheets': {name: {'formula_cells', 'volatile_closure'}},
+             'truncated'}
+    volatile_closure counts the volatile cells plus everything downstream
+    of them, i.e. what Excel recalculates on every edit; cell_reads is the
+    number of cells those formulas reference (clipped to the used range).
+    """
+    with zipfile.ZipFile(path, 'r') as z:
+        sheets = workbook_sheets(z)
+        names = set(z.namelist())
+        graph = FormulaGraph([s['name'] for s in sheets])
+        for i, sheet in enumerate(sheets):
+            if sheet['type'] == 'worksheet' and sheet['part'] in names:
+                with z.open(sheet['part']) as f:
+                    graph.add_sheet(i, f)
+    graph.build(max_edges)
+    return graph.analyze(top)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Formula dependency graph and volatile closure")
+    parser.add_argument("input_file", help="Path to the Excel file")
+    parser.add_argument("--top", type=int, default=20, help="Number of hotspot cells to list")
+    args = parser.parse_args()
+
+    print(json.dumps(analyze_formula_graph(args.input_file, args.top), indent=2))
@@ -1,27 +1,54 @@
+import os
+import queue
+import threading
+import time
 import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
+from tkinter import filedialog, messagebox, scrolledtext, ttk
 
 from analyzer import analyze_xlsx
 from basic_corruption_checker import check_excel_corruption
-from report_generator import generate_report
+from progress import Cancelled
+from report_generator import generate_report, write_dashboard, write_text_report
 
 # CLEANUP MODULES
-from cleanup import remove_excel_objects, remove_excessive_styles  # full cleanup
 from cleanup_styles import cleanup_styles_file                 # styles-only cleanup
 from cleanup_styles import cleanup_excel_file
 
+# how often the Tk thread drains the worker's message queue (ms)
+POLL_MS = 100
+# minimum gap between two 'chunk' progress messages from the worker (s)
+CHUNK_INTERVAL = 0.2
+
+
 class ExcelScannerGUI:
+    """
+    All scanning and cleanup runs on one background worker thread that
+    takes jobs from `self.jobs` in order. The worker never touches a widget:
+    it posts (kind, job, payload) messages to `self.messages`, which the Tk
+    thread polls with root.after. Every job carries its own cancel Event;
+    Cancel sets the events of all jobs queued or running, the worker skips
+    a job whose event is already set, and the progress callback handed to
+    the analyzer / cleanup raises Cancelled at its next call, so the running
+    job stops between chunks or steps.
+    """
+
     def __init__(self, root):
         self.root = root
         self.root.title("Excel Scanner Tool")
 
         self.file_path = None
-        self.analysis_result = None
+        self.analysis_result = None      # text shown in the output box
+        self.results = []                # structured results of this batch
+
+        self.jobs = queue.Queue()        # (kind, path, cancel) waiting for the worker
+        self.messages = queue.Queue()    # worker -> Tk thread
+        self.pending = []                # cancel events of jobs queued or running
+        self._progress = {}              # per-job counters for the status line
 
         # -----------------------------------
-        # Select Excel file
+        # Select Excel file(s)
         # -----------------------------------
-        self.btn_select = tk.Button(root, text="Select Excel File", command=self.choose_file)
+        self.btn_select = tk.Button(root, text="Select Excel File(s)", command=self.choose_file)
         self.btn_select.pack(pady=10)
 
         # -----------------------------------
@@ -30,6 +57,17 @@ class ExcelScannerGUI:
         self.output_box = scrolledtext.ScrolledText(root, width=80, height=20)
         self.output_box.pack(pady=10)
 
+        # -----------------------------------
+        # Progress
+        # -----------------------------------
+        self.progress_bar = ttk.Progressbar(root, length=480, mode='determinate')
+        self.progress_bar.pack(pady=2)
+        self.status_var = tk.StringVar(value="Idle")
+        tk.Label(root, textvariable=self.status_var, anchor='w').pack(fill='x', padx=10)
+
+        self.btn_cancel = tk.Button(root, text="Cancel", command=self.cancel, state=tk.DISABLED)
+        self.btn_cancel.pack(pady=5)
+
         # -----------------------------------
         # Buttons
         # -----------------------------------
@@ -42,6 +80,191 @@ class ExcelScannerGUI:
         self.cleanup_styles_button = tk.Button(root, text="Cleanup Styles Only", command=self.run_cleanup_styles)
         self.cleanup_styles_button.pack(pady=5)
 
+        self.worker = threading.Thread(target=self._worker_loop, name='scanner-worker', daemon=True)
+        self.worker.start()
+        self.root.after(POLL_MS, self._poll_messages)
+
+    # ------------------------------------------------------------------
+    # JOB QUEUE
+    # ------------------------------------------------------------------
+    def _enqueue(self, kind, path):
+        cancel = threading.Event()
+        self.pending.append(cancel)
+        self.jobs.put((kind, path, cancel))
+        self.btn_cancel.config(state=tk.NORMAL)
+        self._show_queue()
+
+    def cancel(self):
+        """Stop the running job and drop everything still queued."""
+        # the worker reports each of these as cancelled, which is when
+        # _finish takes it off self.pending
+        for cancel in self.pending:
+            cancel.set()
+        if self.pending:
+            self.status_var.set("Cancelling…")
+
+    def _show_queue(self):
+        waiting = max(len(self.pending) - 1, 0)
+        self.root.title(f"Excel Scanner Tool ({waiting} queued)" if waiting else "Excel Scanner Tool")
+
+    # ------------------------------------------------------------------
+    # WORKER THREAD (no Tk calls in here)
+    # ------------------------------------------------------------------
+    def _worker_loop(self):
+        while True:
+            job = self.jobs.get()
+            if job[2].is_set():
+                self.messages.put(('cancelled', job, None))
+                continue
+            self.messages.put(('started', job, None))
+            try:
+                payload = self._run_job(job)
+            except Cancelled:
+                self.messages.put(('cancelled', job, None))
+            except Exception as e:
+                self.messages.put(('error', job, str(e)))
+            else:
+                self.messages.put(('done', job, payload))
+
+    def _run_job(self, job):
+        kind, path, cancel = job
+        last_chunk = [0.0]
+
+        def progress(event):
+            if cancel.is_set():
+                raise Cancelled()
+            if event['event'] == 'chunk':
+                now = time.perf_counter()
+                if now - last_chunk[0] < CHUNK_INTERVAL:
+                    return
+                last_chunk[0] = now
+            self.messages.put(('progress', job, event))
+
+        if kind == 'analyze':
+            progress({'event': 'phase', 'phase': 'integrity check'})
+            corruption_result = check_excel_corruption(path)
+            analysis_result = analyze_xlsx(path, progress=progress)
+            return f"{corruption_result}\n\n{analysis_result}", analysis_result
+
+        cleanup = cleanup_excel_file if kind == 'cleanup' else cleanup_styles_file
+        target = self._output_path(path, kind)
+        before = self._file_state(target)
+        output = None
+        try:
+            output = cleanup(path, progress=progress)
+        finally:
+            if output is None and target != path:
+                self._remove_partial_output(target, before)
+        return output
+
+    @staticmethod
+    def _output_path(path, kind):
+        suffix = "_CLEANED.xlsx" if kind == 'cleanup' else "_STYLES_CLEANED.xlsx"
+        return path.replace(".xlsx", suffix)
+
+    @staticmethod
+    def _file_state(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    @classmethod
+    def _remove_partial_output(cls, target, before):
+        # only what this job wrote: an output left by an earlier run that
+        # the failed job never touched stays
+        state = cls._file_state(target)
+        if state is None or state == before:
+            return
+        try:
+            os.remove(target)
+        except OSError:
+            pass
+
+    # ------------------------------------------------------------------
+    # TK THREAD: apply worker messages
+    # ------------------------------------------------------------------
+    def _poll_messages(self):
+        try:
+            while True:
+                kind, job, payload = self.messages.get_nowait()
+                getattr(self, f'_on_{kind}')(job, payload)
+        except queue.Empty:
+            pass
+        self.root.after(POLL_MS, self._poll_messages)
+
+    def _on_started(self, job, payload):
+        self._progress = {'start': time.perf_counter(), 'sheets_done': 0, 'sheets_total': 0,
+                          'cells_done': 0, 'current_cells': 0, 'label': ''}
+        self.progress_bar.config(value=0, maximum=1)
+        self._set_status(job)
+
+    def _on_progress(self, job, event):
+        p = self._progress
+        kind = event['event']
+        if kind == 'start':
+            p['sheets_total'] = event['sheets_total']
+            p['sheets_done'] = event['cached']
+        elif kind == 'chunk':
+            p['current_cells'] = event['cells']
+            p['label'] = event['sheet']
+        elif kind == 'sheet':
+            p['sheets_done'] += 1
+            p['cells_done'] += event['cells']
+            p['current_cells'] = 0
+            p['label'] = event['sheet']
+        else:  # 'phase' / 'step'
+            p['label'] = event.get('phase') or event.get('step')
+        self.progress_bar.config(maximum=max(p['sheets_total'], 1), value=p['sheets_done'])
+        self._set_status(job)
+
+    def _set_status(self, job):
+        kind, path, _ = job
+        p = self._progress
+        name = os.path.basename(path)
+        if kind != 'analyze':
+            self.status_var.set(f"{kind} {name}: {p['label'] or 'starting'}")
+            return
+        cells = p['cells_done'] + p['current_cells']
+        elapsed = max(time.perf_counter() - p['start'], 1e-6)
+        self.status_var.set(f"Analyzing {name}: sheet {p['sheets_done']}/{p['sheets_total']}"
+                            f" ({p['label']}), {cells:,} cells, {cells / elapsed:,.0f} cells/s")
+
+    def _on_done(self, job, payload):
+        kind, path, _ = job
+        if kind == 'analyze':
+            self.file_path = path
+            report_text, result = payload
+            self.results.append(result)
+            text = f"Selected file:\n{path}\n\n{report_text}\n\n"
+            self.analysis_result = text if self.analysis_result is None else self.analysis_result + text
+            self.output_box.insert(tk.END, text)
+            self.output_box.see(tk.END)
+            self.progress_bar.config(value=self.progress_bar['maximum'])
+        elif kind == 'cleanup':
+            messagebox.showinfo("Success", f"Full cleanup completed.\nSaved to:\n{payload}")
+        else:
+            messagebox.showinfo("Success", f"Style cleanup completed.\nSaved to:\n{payload}")
+        self._finish(job, f"Finished {os.path.basename(path)}")
+
+    def _on_cancelled(self, job, payload):
+        self.output_box.insert(tk.END, f"Cancelled: {job[1]}\n\n")
+        self._finish(job, "Cancelled")
+
+    def _on_error(self, job, message):
+        kind, path, _ = job
+        what = "analyze file" if kind == 'analyze' else "clean up file"
+        self._finish(job, f"Failed: {os.path.basename(path)}")
+        messagebox.showerror("Error", f"Failed to {what}:\n{path}\n\n{message}")
+
+    def _finish(self, job, status):
+        self.pending.remove(job[2])
+        self.status_var.set(status)
+        if not self.pending:
+            self.btn_cancel.config(state=tk.DISABLED)
+        self._show_queue()
+
     # ------------------------------------------------------------------
     # CLEANUP FUNCTIONS
     # ------------------------------------------------------------------
@@ -49,50 +272,34 @@ class ExcelScannerGUI:
         if not self.file_path:
             messagebox.showerror("Error", "No file selected!")
             return
-
-        try:
-            output = cleanup_excel_file(self.file_path)
-            messagebox.showinfo("Success", f"Full cleanup completed.\nSaved to:\n{output}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self._enqueue('cleanup', self.file_path)
 
     def run_cleanup_styles(self):
         if not self.file_path:
             messagebox.showerror("Error", "No file selected!")
             return
-
-        try:
-            output = cleanup_styles_file(self.file_path)
-            messagebox.showinfo("Success", f"Style cleanup completed.\nSaved to:\n{output}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self._enqueue('cleanup_styles', self.file_path)
 
     # ------------------------------------------------------------------
     # FILE SELECTION
     # ------------------------------------------------------------------
     def choose_file(self):
-        self.file_path = filedialog.askopenfilename(
-            title="Select Excel File",
+        paths = filedialog.askopenfilenames(
+            title="Select Excel File(s)",
             filetypes=[("Excel Files", "*.xlsx *.xlsm *.xls")]
         )
 
-        if not self.file_path:
+        if not paths:
             return
 
-        self.output_box.delete(1.0, tk.END)
-        self.output_box.insert(tk.END, f"Selected file:\n{self.file_path}\n\n")
-
-        try:
-            corruption_result = check_excel_corruption(self.file_path)
-            analysis_result = analyze_xlsx(self.file_path)
-
-            # Combine both results
-            self.analysis_result = f"{corruption_result}\n\n{analysis_result}"
-
-            self.output_box.insert(tk.END, self.analysis_result)
-
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to analyze file:\n{e}")
+        if not self.pending:
+            # a new batch starts a new report
+            self.output_box.delete(1.0, tk.END)
+            self.analysis_result = None
+            self.results = []
+        self.file_path = paths[-1]
+        for path in paths:
+            self._enqueue('analyze', path)
 
     # ------------------------------------------------------------------
     # SAVE REPORT
@@ -104,14 +311,21 @@ class ExcelScannerGUI:
 
         save_path = filedialog.asksaveasfilename(
             defaultextension=".txt",
-            filetypes=[("Text Report", "*.txt")]
+            filetypes=[("Text Report", "*.txt"), ("HTML Report", "*.html"),
+                       ("JSON", "*.json"), ("CSV", "*.csv")]
         )
 
         if not save_path:
             return
 
         try:
-            generate_report(self.analysis_result, save_path)
+            if os.path.splitext(save_path)[1].lower() in ('.html', '.htm', '.json', '.csv'):
+                if len(self.results) == 1:
+                    generate_report(self.results[0], save_path)
+                else:
+                    write_dashboard(self.results, save_path)
+            else:
+                write_text_report(self.analysis_result, save_path)
             messagebox.showinfo("Saved", f"Report saved to:\n{save_path}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save report:\n{e}")
@@ -1,47 +1,356 @@
-import sys
-import tkinter as tk
-from gui import ExcelScannerGUI
+"""main.py
+Entry point of ExcelScanner: without arguments the GUI starts, otherwise
+a subcommand runs.
 
-# Cleanup modules
-from cleanup import remove_excel_objects, remove_excessive_styles
-from cleanup_styles import cleanup_excel_file
-from cleanup_styles import cleanup_styles_file
+    ExcelScanner.exe check book.xlsx --level deep
+    ExcelScanner.exe analyze book.xlsx -o analysis.json
+    ExcelScanner.exe cleanup book.xlsx -o clean.xlsx
+    ExcelScanner.exe batch D:/shares/finance -o scan.jsonl --workers 8
 
+Each command names the module it needs; that module is imported only when
+the command runs, so `check` never pays for openpyxl, tkinter or COM.
+The old flag style (main.py book.xlsx --cleanup) still works.
+"""
 import argparse
+import importlib
+import json
+import os
+import sys
+from typing import Any, Callable, Dict, List, NamedTuple
+
+
+class Command(NamedTuple):
+    help: str
+    module: str                                           # imported on use
+    configure: Callable[[argparse.ArgumentParser], None]  # adds arguments
+    run: Callable[[Any, argparse.Namespace], int]         # (module, args) -> exit code
+
+
+def _profiler(args):
+    if not getattr(args, 'profile', False):
+        return None
+    from profiling import Profiler
+    return Profiler()
+
+
+def _print_profile(profiler):
+    if profiler:
+        from profiling import format_profile
+        print(format_profile(profiler.summary()))
+
+
+def _file_args(p, output=True, profile=True):
+    p.add_argument("file", help="Path to Excel file")
+    if output:
+        p.add_argument("-o", "--output", help="Output file path")
+    if profile:
+        p.add_argument("--profile", action="store_true",
+                       help="Print wall / CPU time and memory peak per step")
+
+
+# ---- check -----------------------------------------------------------
+def _configure_check(p):
+    _file_args(p, output=False)
+    p.add_argument("--level", choices=['quick', 'crc', 'deep'], default='crc',
+                   help="quick (directory only), crc (verify members), deep (XML + relationships)")
+    p.add_argument("--json", action="store_true", help="Print the structured result")
+
+
+def _run_check(mod, args):
+    profiler = _profiler(args)
+    result = mod.check_excel_integrity(args.file, args.level, profiler=profiler)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(mod.format_integrity(result))
+        _print_profile(profiler)
+    return 0 if result['status'] in ('OK', 'WARNING') else 1
+
+
+# ---- analyze ---------------------------------------------------------
+def _configure_analyze(p):
+    _file_args(p)
+    p.add_argument("--engine", choices=['stream', 'openpyxl'], default='stream')
+    p.add_argument("--workers", type=int, default=1, help="Scan worksheets in N processes")
+    p.add_argument("--cache", help="Part cache database")
+    p.add_argument("--index", help="Result index database (answers copies of indexed workbooks)")
+    p.add_argument("--formula-graph", action="store_true", help="Add formula dependency analysis")
+    p.add_argument("--column-profile", action="store_true",
+                   help="Add per-column value types, numbers stored as text, errors, long text (needs NumPy)")
+    p.add_argument("--time-budget", type=float, metavar="SECONDS",
+                   help="Quick scan: sample large sheets to finish in about this time")
+    p.add_argument("--cell-budget", type=int, metavar="CELLS",
+                   help="Quick scan: parse about this many cells, estimate the rest")
+
+
+def _run_analyze(mod, args):
+    res = mod.analyze_xlsx(args.file, engine=args.engine, workers=args.workers,
+                           cache_path=args.cache, formula_graph=args.formula_graph,
+                           profiler=_profiler(args), time_budget=args.time_budget,
+                           cell_budget=args.cell_budget, index_path=args.index,
+                           column_profile=args.column_profile)
+    text = json.dumps(res, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"Analysis written → {args.output}")
+    else:
+        print(text)
+    return 1 if 'error' in res else 0
+
+
+# ---- batch -----------------------------------------------------------
+def _configure_batch(p):
+    p.add_argument("targets", nargs='+', help="Files, directories or glob patterns")
+    p.add_argument("-o", "--output", required=True, help="JSONL output (existing entries are skipped)")
+    p.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    p.add_argument("--timeout", type=float, help="Per-file timeout in seconds")
+    p.add_argument("--engine", choices=['stream', 'openpyxl'], default='stream')
+    p.add_argument("--cache", help="Part cache database shared by all workers")
+    p.add_argument("--index", help="Result index database: copies of indexed workbooks are not rescanned")
+    p.add_argument("--time-budget", type=float, metavar="SECONDS",
+                   help="Quick scan: seconds per file, large sheets are sampled")
+    p.add_argument("--retry-timeouts", action="store_true",
+                   help="On resume, scan files that timed out in an earlier run again")
+
+
+def _run_batch(mod, args):
+    summary = mod.run_batch(args.targets, args.output, args.workers or os.cpu_count() or 1,
+                            args.timeout or mod.DEFAULT_TIMEOUT, args.engine, args.cache,
+                            args.time_budget, args.index, args.retry_timeouts)
+    print(f"Batch scan written → {args.output}")
+    print(json.dumps(summary))
+    return 1 if summary['errors'] or summary['timeouts'] else 0
+
+
+# ---- sizes -----------------------------------------------------------
+def _configure_sizes(p):
+    _file_args(p, output=False, profile=False)
+    p.add_argument("--top", type=int, default=10, help="Largest members to list")
+    p.add_argument("--json", action="store_true", help="Print the structured result")
+
+
+def _run_sizes(mod, args):
+    report = mod.package_sizes(args.file, args.top)
+    print(json.dumps(report, indent=2) if args.json else mod.format_sizes(report))
+    return 0
+
+
+# ---- index -----------------------------------------------------------
+def _configure_index(p):
+    p.add_argument("args", nargs=argparse.REMAINDER,
+                   help="query DB [--where FIELD>VALUE] [--sort FIELD] | duplicates DB | similar DB | stats DB")
+
 
+def _run_index(mod, args):
+    return mod.main(args.args)
 
-def run_cli():
-    parser = argparse.ArgumentParser(description="Excel Scanner CLI Tool")
 
-    parser.add_argument("file", help="Path to Excel file")
-    parser.add_argument("--cleanup", action="store_true", help="Full cleanup (objects, links, styles)")
-    parser.add_argument("--cleanup_styles", action="store_true", help="Cleanup styles only")
-    parser.add_argument("-o", "--output", help="Output file path")
+# ---- report ----------------------------------------------------------
+def _configure_report(p):
+    p.add_argument("input", nargs='+',
+                   help="Analyzer JSON / JSON-lines files or workbooks; several make a dashboard")
+    p.add_argument("-o", "--output", default="excel_report.html", help="Report path")
+    p.add_argument("--format", choices=['html', 'json', 'csv'],
+                   help="Report format (default: from the output extension, else html)")
 
-    args = parser.parse_args()
 
-    if args.cleanup:
-        output = cleanup_excel_file(args.file, args.output)
-        print(f"Full cleanup complete → {output}")
-        return
+def _run_report(mod, args):
+    fmt = args.format
+    if not fmt:
+        try:
+            fmt = mod.report_format(args.output)
+        except ValueError:
+            fmt = 'html'
+    report = mod.build_report(args.input, args.output, fmt)
+    print(f"{report['kind'].capitalize()} written → {report['output']} "
+          f"({report['workbooks']} workbooks, {report['failed']} failed)")
+    return 0
 
-    if args.cleanup_styles:
-        output = cleanup_styles_file(args.file, args.output)
-        print(f"Style-only cleanup complete → {output}")
-        return
 
-    print("No valid action selected. Use --help for more options.")
+# ---- package cleanups ------------------------------------------------
+def _run_cleanup(mod, args):
+    profiler = _profiler(args)
+    output = mod.cleanup_excel_file(args.file, args.output, profiler=profiler)
+    print(f"Full cleanup complete → {output}")
+    _print_profile(profiler)
+    return 0
 
 
-def run_gui():
+def _run_cleanup_styles(mod, args):
+    profiler = _profiler(args)
+    output = mod.cleanup_styles_file(args.file, args.output, profiler=profiler)
+    print(f"Style-only cleanup complete → {output}")
+    _print_profile(profiler)
+    return 0
+
+
+def _run_consolidate_styles(mod, args):
+    report = mod.consolidate_styles(args.file, args.output)
+    print(f"Style consolidation complete → {report['output']} "
+          f"({report['cell_xfs_before']} → {report['cell_xfs_after']} cell formats)")
+    return 0
+
+
+def _run_trim(mod, args):
+    report = mod.trim_used_range(args.file, args.output)
+    removed = sum(s['rows_removed'] for s in report['sheets'].values())
+    print(f"Used-range trim complete → {report['output']} ({removed} empty rows removed)")
+    for name, stats in report['sheets'].items():
+        for key, label in (('hidden_rows_removed', 'hidden'), ('custom_height_rows_removed', 'custom-height')):
+            if stats[key]:
+                print(f"  {name}: dropped {label} rows {', '.join(stats[key])}")
+    return 0
+
+
+def _run_consolidate_rules(mod, args):
+    report = mod.consolidate_rules(args.file, args.output)
+    sheets = report['sheets'].values()
+    print(f"Rule consolidation complete → {report['output']} "
+          f"({sum(s['cf_rules_before'] for s in sheets)} → {sum(s['cf_rules_after'] for s in sheets)} "
+          f"conditional formats, {sum(s['dv_before'] for s in sheets)} → "
+          f"{sum(s['dv_after'] for s in sheets)} validations)")
+    return 0
+
+
+def _run_compact_strings(mod, args):
+    report = mod.compact_shared_strings(args.file, args.output)
+    print(f"Shared strings compacted → {report['output']} "
+          f"({report['entries_before']} → {report['entries_after']} strings)")
+    return 0
+
+
+def _run_strip_pivot_records(mod, args):
+    report = mod.strip_pivot_records(args.file, args.output)
+    saved = sum(c['records_compressed_bytes'] for c in report['caches'])
+    print(f"Pivot cache records stripped → {report['output']} "
+          f"({report['records_removed']} records parts, {saved} compressed bytes)")
+    return 0
+
+
+# ---- repack ----------------------------------------------------------
+def _configure_repack(p):
+    _file_args(p, profile=False)
+    p.add_argument("--level", type=int, default=9, choices=range(10), metavar="0-9",
+                   help="Deflate level (default 9)")
+    p.add_argument("--workers", type=int, help="Compression threads")
+    p.add_argument("--keep-media", action="store_true", help="Only recompress, keep all media")
+
+
+def _run_repack(mod, args):
+    report = mod.repack_package(args.file, args.output, args.level, args.workers, not args.keep_media)
+    print(f"Repack complete → {report['output']}")
+    print(mod.format_repack(report))
+    return 0
+
+
+# ---- serve -----------------------------------------------------------
+def _configure_serve(p):
+    p.add_argument("--host", default='127.0.0.1', help="Interface to bind (default: localhost only)")
+    p.add_argument("--port", type=int, default=8765, help="TCP port (0 picks a free one)")
+    p.add_argument("--unix", help="Listen on this Unix socket path instead of TCP")
+    p.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    p.add_argument("--queue-size", type=int, default=64,
+                   help="Jobs that may wait; further submissions get 503")
+
+
+def _run_serve(mod, args):
+    import asyncio
+    try:
+        asyncio.run(mod.serve(args.host, args.port, args.unix, args.workers, args.queue_size))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+# ---- gui -------------------------------------------------------------
+def _run_gui(mod, args):
+    import tkinter as tk
     root = tk.Tk()
-    app = ExcelScannerGUI(root)
+    app = mod.ExcelScannerGUI(root)
     root.mainloop()
+    return 0
+
+
+COMMANDS: Dict[str, Command] = {
+    'check': Command("Verify the ZIP container and its parts", 'basic_corruption_checker',
+                     _configure_check, _run_check),
+    'analyze': Command("Analyze sheets, formulas and styles", 'analyzer',
+                       _configure_analyze, _run_analyze),
+    'batch': Command("Scan directories / globs of workbooks into a JSONL file (resumable)", 'batch_scan',
+                     _configure_batch, _run_batch),
+    'sizes': Command("Bytes per part and category, from the zip directory only", 'package_sizes',
+                     _configure_sizes, _run_sizes),
+    'index': Command("Query the result index (metrics, duplicates, near-duplicates)", 'result_index',
+                     _configure_index, _run_index),
+    'report': Command("Write an HTML / JSON / CSV report or batch dashboard", 'report_generator',
+                      _configure_report, _run_report),
+    'cleanup': Command("Full cleanup (objects, links, styles)", 'cleanup_styles',
+                       _file_args, _run_cleanup),
+    'cleanup-styles': Command("Cleanup styles only", 'cleanup_styles',
+                              _file_args, _run_cleanup_styles),
+    'consolidate-styles': Command("Merge duplicate / drop unused cell formats, keeping formatting",
+                                  'style_consolidation',
+                                  lambda p: _file_args(p, profile=False), _run_consolidate_styles),
+    'trim-used-range': Command("Drop formatted rows / columns beyond each sheet's data", 'used_range',
+                               lambda p: _file_args(p, profile=False), _run_trim),
+    'consolidate-rules': Command("Merge conditional formats / data validations that differ only by range",
+                                 'rule_consolidation',
+                                 lambda p: _file_args(p, profile=False), _run_consolidate_rules),
+    'compact-strings': Command("Drop unreferenced and duplicate shared strings", 'shared_strings',
+                               lambda p: _file_args(p, profile=False), _run_compact_strings),
+    'strip-pivot-records': Command("Drop pivot cache records, keeping the caches (refreshed on load)",
+                                   'pivot_caches',
+                                   lambda p: _file_args(p, profile=False), _run_strip_pivot_records),
+    'repack': Command("Drop duplicate / orphaned media and recompress the package", 'repack',
+                      _configure_repack, _run_repack),
+    'serve': Command("Run the local scan service (warm worker pool, JSON over HTTP)", 'scan_service',
+                     _configure_serve, _run_serve),
+    'gui': Command("Start the GUI", 'gui', lambda p: None, _run_gui),
+}
+
+# main.py book.xlsx --cleanup  ->  main.py cleanup book.xlsx
+LEGACY_FLAGS = {
+    '--cleanup': 'cleanup',
+    '--cleanup_styles': 'cleanup-styles',
+    '--consolidate_styles': 'consolidate-styles',
+    '--trim_used_range': 'trim-used-range',
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='ExcelScanner', description="Excel Scanner CLI Tool")
+    sub = parser.add_subparsers(dest='command', metavar='command')
+    for name, command in COMMANDS.items():
+        command.configure(sub.add_parser(name, help=command.help, description=command.help))
+    return parser
+
+
+def translate_legacy(argv: List[str]) -> List[str]:
+    """Rewrite the old `<file> --cleanup ...` form into a subcommand line."""
+    if not argv or argv[0] in COMMANDS or argv[0] in ('-h', '--help'):
+        return argv
+    for flag, name in LEGACY_FLAGS.items():
+        if flag in argv:
+            return [name] + [a for a in argv if a != flag]
+    return argv
+
+
+def main(argv: List[str] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        argv = ['gui']
+    argv = translate_legacy(argv)
+    if argv[0] not in COMMANDS and argv[0] not in ('-h', '--help'):
+        print("No valid action selected. Use --help for more options.")
+        return 2
+
+    args = build_parser().parse_args(argv)
+    command = COMMANDS[args.command]
+    return command.run(importlib.import_module(command.module), args)
 
 
 if __name__ == "__main__":
-    # If run without arguments → launch GUI
-    if len(sys.argv) == 1:
-        run_gui()
-    else:
-        run_cli()
+    import multiprocessing
+    multiprocessing.freeze_support()  # worker processes of the frozen exe
+    sys.exit(main())
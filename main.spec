@@ -6,7 +6,8 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    # main.py imports the command modules by name, out of PyInstaller's sight
+    hiddenimports=['analyzer', 'basic_corruption_checker', 'batch_scan', 'cleanup_styles', 'gui', 'package_sizes', 'pivot_caches', 'repack', 'report_generator', 'result_index', 'rule_consolidation', 'scan_service', 'shared_strings', 'style_consolidation', 'used_range'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,277 @@
+"""object_removal.py
+Remove drawings, charts, OLE objects and form/ActiveX controls directly
+from the XLSX package - no Excel, no COM, works on any OS.
+
+One streaming zip-to-zip pass:
+  - drops xl/drawings/*, xl/charts/*, xl/embeddings/*, xl/activeX/*,
+    xl/ctrlProps/* and media no longer referenced by anything
+  - removes <drawing>, <legacyDrawing>, <oleObjects> and <controls>
+    (including their mc:AlternateContent wrappers) from the sheets
+  - drops the matching relationships and [Content_Types].xml overrides
+
+The object elements all follow <sheetData> in a worksheet, so the cell
+data is copied byte for byte and only the (small) tail after
+</sheetData> goes through the XML rewriter; members that are not
+rewritten are copied still compressed.
+
+Sheets with comments keep their legacy VML drawing, which Excel needs to
+show the comment boxes. Chartsheets are left intact since they consist
+of nothing but their drawing.
+"""
+import io
+import re
+import zipfile
+from collections import defaultdict
+from typing import Any, Dict, IO, Optional, Set
+from xml.parsers import expat
+
+from xlsx_package import (CONTENT_TYPES_PART, content_types_rewriter, read_relationships,
+                          relationships_rewriter, rels_part_for, rewrite_package,
+                          source_part_of, workbook_sheets)
+from xml_rewrite import CHUNK_SIZE, XmlRewriter, local
+
+OBJECT_FOLDERS = {
+    'xl/drawings/': 'drawings',
+    'xl/charts/': 'charts',
+    'xl/embeddings/': 'embeddings',
+    'xl/activeX/': 'activeX',
+    'xl/ctrlProps/': 'ctrlProps',
+}
+MEDIA_FOLDER = 'xl/media/'
+SHEET_OBJECT_TAGS = {'drawing', 'legacyDrawing', 'oleObjects', 'controls'}
+COMMENTS_REL = '/comments'
+
+# end of the cell data: '<' cannot occur unescaped in text, so this only
+# matches markup
+_SHEET_DATA_END = re.compile(rb'</(?:[\w.-]+:)?sheetData\s*>|<(?:[\w.-]+:)?sheetData\s*/>')
+_SHEET_DATA = b'sheetData'
+_MATCH_CARRY = 64
+_TAIL_ROOT = b'<_tail>'
+
+
+def category_of(name: str) -> str:
+    for folder, category in OBJECT_FOLDERS.items():
+        if name.startswith(folder):
+            return category
+    if name.startswith(MEDIA_FOLDER):
+        return 'media'
+    return ''
+
+
+def reachable_parts(z: zipfile.ZipFile, roots, names: Set[str]) -> Set[str]:
+    """Every part reachable from `roots` by following internal relationships."""
+    seen = set()
+    todo = list(roots)
+    while todo:
+        part = todo.pop()
+        if part in seen or part not in names:
+            continue
+        seen.add(part)
+        for _, target in read_relationships(z, part).values():
+            todo.append(target)
+    return seen
+
+
+def _split_sheet(source: IO[bytes], sink: Optional[IO[bytes]] = None) -> bytes:
+    """
+    Read a worksheet up to the end of <sheetData>, copying those bytes to
+    `sink` unchanged, and return the rest of the part (b'' when there is
+    no sheetData: everything was copied).
+    """
+    carry = b''
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        data = carry + chunk
+        match = _find_sheet_data_end(data)
+        if match:
+            if sink is not None:
+                sink.write(data[:match.end()])
+            return data[match.end():] + source.read()
+        keep = len(data) if not chunk else max(0, len(data) - _MATCH_CARRY)
+        if sink is not None:
+            sink.write(data[:keep])
+        if not chunk:
+            return b''
+        carry = data[keep:]
+
+
+def _find_sheet_data_end(data: bytes):
+    # bytes.find is far faster than a regex scan over the cell data; the
+    # regex only checks the markup around each hit
+    pos = data.find(_SHEET_DATA)
+    while pos >= 0:
+        match = _SHEET_DATA_END.match(data, max(0, data.rfind(b'<', 0, pos)))
+        if match and match.end() > pos:
+            return match
+        pos = data.find(_SHEET_DATA, pos + 1)
+    return None
+
+
+def _tail_document(tail: bytes):
+    """(the tail's elements wrapped in a stand-in root, the closing root tag)."""
+    close = tail.rfind(b'</')
+    if close < 0:
+        return None, tail
+    return _TAIL_ROOT + tail[:close] + b'</_tail>', tail[close:]
+
+
+def _object_rel_ids(source: IO[bytes], keep_legacy: bool) -> Set[str]:
+    """Relationship ids used inside the object elements of one sheet."""
+    ids = set()
+    depth = 0
+
+    def start(name, attrs):
+        nonlocal depth
+        if depth or (local(name) in SHEET_OBJECT_TAGS
+                     and not (keep_legacy and local(name) == 'legacyDrawing')):
+            depth += 1
+            for k, v in attrs.items():
+                if ':' in k and local(k) == 'id':
+                    ids.add(v)
+
+    def end(name):
+        nonlocal depth
+        if depth:
+            depth -= 1
+
+    document, _ = _tail_document(_split_sheet(source))
+    if document is None:
+        return ids
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.Parse(document, True)
+    return ids
+
+
+class _SheetObjectRewriter(XmlRewriter):
+    def __init__(self, out: IO[bytes], keep_legacy: bool):
+        super().__init__(out)
+        self.keep_legacy = keep_legacy
+        self.capture_level = 0
+        self.captured_object = False
+
+    def start(self, name, attrs):
+        tag = local(name)
+        if tag in SHEET_OBJECT_TAGS and not (self.keep_legacy and tag == 'legacyDrawing'):
+            self.captured_object = True
+            return None
+        if tag == 'AlternateContent' and len(self.path) == 1:
+            # <controls>/<oleObjects> come wrapped in mc:AlternateContent;
+            # buffer it and drop the whole wrapper if it held one.
+            self.begin_capture()
+            self.capture_level = len(self.path) + 1
+            self.captured_object = False
+        return attrs
+
+    def closed(self, name):
+        if self.capture_level and len(self.path) == self.capture_level:
+            self.capture_level = 0
+            markup = self.end_capture()
+            if not self.captured_object:
+                self.write(markup)
+
+
+def _rewrite_sheet(src: IO[bytes], dst: IO[bytes], keep_legacy: bool):
+    document, close = _tail_document(_split_sheet(src, dst))
+    if document is not None:
+        out = io.BytesIO()
+        _SheetObjectRewriter(out, keep_legacy).rewrite(io.BytesIO(document))
+        body = out.getvalue()
+        dst.write(body[len(_TAIL_ROOT):-len(b'</_tail>')] if body.startswith(_TAIL_ROOT) else b'')
+    dst.write(close)
+
+
+def _sheet_rewriter(keep_legacy: bool):
+    return lambda src, dst: _rewrite_sheet(src, dst, keep_legacy)
+
+
+def remove_objects(input_file: str, output_file: str = None) -> Dict[str, Any]:
+    """
+    Write a copy of `input_file` without drawings, charts, OLE objects and
+    controls. `output_file` may equal `input_file` (replaced atomically).
+
+    Returns {'output', 'removed': {category: {'parts', 'bytes'}},
+             'bytes_before', 'bytes_after'}; 'bytes' is the compressed size
+    each category occupied in the package.
+    """
+    if output_file is None:
+        output_file = input_file.replace(".xlsx", "_cleaned.xlsx")
+
+    with zipfile.ZipFile(input_file, 'r') as z:
+        infos = {i.filename: i for i in z.infolist()}
+        names = set(infos)
+        sheets = workbook_sheets(z)
+
+        protected = reachable_parts(
+            z, [s['part'] for s in sheets if s['type'] == 'chartsheet'], names)
+        removed = {n for n in names
+                   if n[-1] != '/' and category_of(n) and category_of(n) != 'media'
+                   and n not in protected}
+
+        rewriters = {}
+        drop_rel_ids = defaultdict(set)
+        for sheet in sheets:
+            part = sheet['part']
+            if sheet['type'] != 'worksheet' or part not in names:
+                continue
+            rels = read_relationships(z, part)
+            keep_legacy = any(t.endswith(COMMENTS_REL) for t, _ in rels.values())
+            with z.open(part) as f:
+                ids = _object_rel_ids(f, keep_legacy)
+            # objects still referenced from elements we keep (comment VML,
+            # header/footer images) stay, together with what they point at
+            for rid, (_, target) in rels.items():
+                if rid not in ids and target in removed:
+                    removed -= reachable_parts(z, [target], names)
+            if not ids:
+                continue
+            rewriters[part] = _sheet_rewriter(keep_legacy)
+            drop_rel_ids[rels_part_for(part)] |= ids
+
+        # relationships pointing at removed parts go too; whatever media is
+        # still referenced afterwards is kept
+        referenced_media = set()
+        for rels_name in names:
+            if not rels_name.endswith('.rels') or rels_name in removed:
+                continue
+            source = source_part_of(rels_name)
+            if source in removed:
+                removed.add(rels_name)
+                continue
+            for rid, (rel_type, target) in read_relationships(z, source).items():
+                if target in removed:
+                    drop_rel_ids[rels_name].add(rid)
+                elif rid not in drop_rel_ids[rels_name] and target.startswith(MEDIA_FOLDER):
+                    referenced_media.add(target)
+
+        removed |= {n for n in names
+                    if n.startswith(MEDIA_FOLDER) and n[-1] != '/' and n not in referenced_media}
+
+    for rels_name, ids in drop_rel_ids.items():
+        if ids and rels_name in names and rels_name not in removed:
+            rewriters[rels_name] = relationships_rewriter(ids)
+    if CONTENT_TYPES_PART in names:
+        rewriters[CONTENT_TYPES_PART] = content_types_rewriter(removed)
+
+    report = {'output': output_file, 'removed': {}}
+    for name in sorted(removed):
+        entry = report['removed'].setdefault(category_of(name), {'parts': 0, 'bytes': 0})
+        entry['parts'] += 1
+        entry['bytes'] += infos[name].compress_size
+
+    sizes = rewrite_package(input_file, output_file, rewriters, drop=removed)
+    report.update(sizes)
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Remove drawings, charts, OLE objects and controls")
+    parser.add_argument("input_file", help="Path to the Excel file")
+    parser.add_argument("-o", "--output", help="Optional output file path")
+    args = parser.parse_args()
+
+    print(json.dumps(remove_objects(args.input_file, args.output), indent=2))
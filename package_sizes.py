@@ -0,0 +1,150 @@
+"""package_sizes.py
+Where the bytes of a workbook go, from the zip central directory alone.
+
+Every member's compressed and uncompressed size is recorded in the
+directory, so "why is this file 80 MB" is answered without inflating or
+even reading a single part: members are grouped into categories (sheets,
+styles, sharedStrings, media, ...) by their path inside the package.
+
+    python package_sizes.py book.xlsx --top 20
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import zipfile
+from typing import Any, Dict, Iterable, List
+
+TOP_MEMBERS = 10
+
+# first match wins; paths are matched case-insensitively below any prefix,
+# so a workbook part outside xl/ is categorised the same way
+CATEGORIES = (
+    ('sheets', r'(?:^|/)(?:worksheets|chartsheets|dialogsheets|macrosheets)/'),
+    ('styles', r'(?:^|/)styles\.xml$'),
+    ('sharedStrings', r'(?:^|/)sharedStrings\.xml$'),
+    ('media', r'(?:^|/)media/'),
+    ('pivotCache', r'(?:^|/)pivotCache/'),
+    ('pivotTables', r'(?:^|/)pivotTables/'),
+    ('drawings', r'(?:^|/)(?:drawings|charts)/'),
+    ('externalLinks', r'(?:^|/)externalLinks/'),
+    ('vbaProject', r'(?:^|/)vbaProject\.bin$'),
+    ('calcChain', r'(?:^|/)calcChain\.xml$'),
+    ('tables', r'(?:^|/)tables/'),
+    ('comments', r'(?:^|/)(?:comments\d*\.xml|threadedComments/|persons/)'),
+    ('printerSettings', r'(?:^|/)printerSettings/'),
+    ('customXml', r'^customXml/'),
+    ('structure', r'(?:^|/)(?:_rels/|\[Content_Types\]\.xml$|workbook\.xml$|theme/|docProps/)'),
+)
+_CATEGORY_PATTERNS = [(name, re.compile(pattern, re.IGNORECASE)) for name, pattern in CATEGORIES]
+
+
+def part_category(name: str) -> str:
+    for category, pattern in _CATEGORY_PATTERNS:
+        if pattern.search(name):
+            return category
+    return 'other'
+
+
+def _ratio(uncompressed: int, compressed: int):
+    return round(uncompressed / compressed, 2) if compressed else None
+
+
+def _entry(compressed: int, uncompressed: int, total_compressed: int) -> Dict[str, Any]:
+    return {
+        'compressed_bytes': compressed,
+        'uncompressed_bytes': uncompressed,
+        'ratio': _ratio(uncompressed, compressed),
+        'share': round(compressed / total_compressed, 4) if total_compressed else 0.0,
+    }
+
+
+def size_attribution(infos: Iterable[zipfile.ZipInfo], top: int = TOP_MEMBERS,
+                     parts: bool = False) -> Dict[str, Any]:
+    """
+    Compressed / uncompressed bytes of a package per category, the `top`
+    largest members by compressed size and, with parts=True, every member.
+    'ratio' is uncompressed / compressed, 'share' the part of the total
+    compressed size. Directory entries are skipped.
+    """
+    members = [i for i in infos if not i.is_dir()]
+    total_compressed = sum(i.compress_size for i in members)
+    total_uncompressed = sum(i.file_size for i in members)
+
+    sums: Dict[str, List[int]] = {}
+    for info in members:
+        counts = sums.setdefault(part_category(info.filename), [0, 0, 0])
+        counts[0] += 1
+        counts[1] += info.compress_size
+        counts[2] += info.file_size
+    categories = {
+        name: {'members': count, **_entry(compressed, uncompressed, total_compressed)}
+        for name, (count, compressed, uncompressed)
+        in sorted(sums.items(), key=lambda item: -item[1][1])
+    }
+
+    def member(info: zipfile.ZipInfo) -> Dict[str, Any]:
+        return {'part': info.filename, 'category': part_category(info.filename),
+                **_entry(info.compress_size, info.file_size, total_compressed)}
+
+    ranked = sorted(members, key=lambda i: -i.compress_size)
+    report = {
+        'members': len(members),
+        'compressed_bytes': total_compressed,
+        'uncompressed_bytes': total_uncompressed,
+        'ratio': _ratio(total_uncompressed, total_compressed),
+        'categories': categories,
+        'largest': [member(i) for i in ranked[:top]],
+    }
+    if parts:
+        report['parts'] = [member(i) for i in ranked]
+    return report
+
+
+def package_sizes(path: str, top: int = TOP_MEMBERS, parts: bool = False) -> Dict[str, Any]:
+    """size_attribution() of the workbook at `path`, plus its size on disk."""
+    with zipfile.ZipFile(path, 'r') as z:
+        report = size_attribution(z.infolist(), top, parts)
+    report['file_bytes'] = os.path.getsize(path)
+    return report
+
+
+def human_size(n: float) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if abs(n) < 1024:
+            return f"{n:,.0f} {unit}" if unit == 'B' else f"{n:,.1f} {unit}"
+        n /= 1024
+    return f"{n:,.2f} GB"
+
+
+def format_sizes(report: Dict[str, Any]) -> str:
+    """Plain-text table of a package_sizes / size_attribution report."""
+    lines = [f"Compressed {human_size(report['compressed_bytes'])}, uncompressed "
+             f"{human_size(report['uncompressed_bytes'])} ({report['ratio'] or '-'}x), {report['members']} members",
+             '',
+             f"{'Category':<16}{'Members':>8}{'Compressed':>16}{'Uncompressed':>16}{'Ratio':>8}{'Share':>8}"]
+    for name, c in report['categories'].items():
+        lines.append(f"{name:<16}{c['members']:>8}{human_size(c['compressed_bytes']):>16}"
+                     f"{human_size(c['uncompressed_bytes']):>16}{c['ratio'] or '-':>8}{c['share']:>8.1%}")
+    lines += ['', 'Largest members (compressed):']
+    for m in report['largest']:
+        lines.append(f"  {human_size(m['compressed_bytes']):>12}  {human_size(m['uncompressed_bytes']):>12}  {m['part']}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description='Size attribution from the zip central directory')
+    p.add_argument('file', help='Path to Excel file')
+    p.add_argument('--top', type=int, default=TOP_MEMBERS, help='Largest members to list')
+    p.add_argument('--all-parts', action='store_true', help='Include every member (with --json)')
+    p.add_argument('--json', action='store_true', help='Print the structured result')
+    args = p.parse_args(argv)
+
+    report = package_sizes(args.file, args.top, args.all_parts)
+    print(json.dumps(report, indent=2) if args.json else format_sizes(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""part_cache.py
+On-disk (SQLite) cache of per-part analysis results.
+
+Entries are keyed by zip member name plus the CRC32 and uncompressed size
+recorded in the zip central directory, so an unchanged sheet is recognised
+without decompressing it. The cache is bounded by the total size of the
+stored payloads and evicts least-recently-used entries first.
+
+The payload total is kept in a one-row table updated in the same
+transaction as each insert, so a put costs O(1); eviction only runs once
+the total passes max_bytes and then frees down to LOW_WATER of it. Hits
+refresh last_used lazily (at most every TOUCH_INTERVAL seconds per entry,
+written in batches with the next put or on close), so workers sharing one
+cache do not serialize on the SQLite write lock while reading.
+"""
+import json
+import sqlite3
+import time
+from typing import Any, Optional
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+LOW_WATER = 0.9         # eviction frees down to this share of max_bytes
+TOUCH_INTERVAL = 60.0   # seconds before a hit refreshes last_used again
+TOUCH_BATCH = 256       # pending last_used refreshes flushed at once
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS parts (
+    part      TEXT    NOT NULL,
+    crc       INTEGER NOT NULL,
+    size      INTEGER NOT NULL,
+    version   TEXT    NOT NULL,
+    payload   TEXT    NOT NULL,
+    nbytes    INTEGER NOT NULL,
+    last_used REAL    NOT NULL,
+    PRIMARY KEY (part, crc, size, version)
+);
+CREATE INDEX IF NOT EXISTS parts_last_used ON parts (last_used);
+CREATE TABLE IF NOT EXISTS totals (
+    id     INTEGER PRIMARY KEY CHECK (id = 0),
+    nbytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals SELECT 0, COALESCE(SUM(nbytes), 0) FROM parts;
+'''
+
+KEY = 'part=? AND crc=? AND size=? AND version=?'
+
+
+class PartCache:
+    """
+    cache = PartCache('scan_cache.db')
+    hit = cache.get('xl/worksheets/sheet1.xml', info.CRC, info.file_size, version)
+    cache.put(..., value)
+
+    `version` identifies the scanner producing the payload; bumping it
+    invalidates older entries without touching the file.
+    """
+
+    def __init__(self, db_path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._touched = {}   # key -> time of the hit, written lazily
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def get(self, part: str, crc: int, size: int, version: str) -> Optional[Any]:
+        key = (part, crc, size, version)
+        row = self.conn.execute(f'SELECT payload, last_used FROM parts WHERE {KEY}', key).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        now = time.time()
+        if now - row[1] >= TOUCH_INTERVAL:
+            self._touched[key] = now
+            if len(self._touched) >= TOUCH_BATCH:
+                with self.conn:
+                    self._flush_touched()
+        return json.loads(row[0])
+
+    def put(self, part: str, crc: int, size: int, version: str, value: Any):
+        payload = json.dumps(value)
+        key = (part, crc, size, version)
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self._flush_touched()
+            old = self.conn.execute(f'SELECT nbytes FROM parts WHERE {KEY}', key).fetchone()
+            self.conn.execute('INSERT OR REPLACE INTO parts VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              key + (payload, len(payload), time.time()))
+            self.conn.execute('UPDATE totals SET nbytes = nbytes + ? WHERE id = 0',
+                              (len(payload) - (old[0] if old else 0),))
+            total = self.conn.execute('SELECT nbytes FROM totals WHERE id = 0').fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(total)
+
+    def _flush_touched(self):
+        # caller holds the transaction
+        if self._touched:
+            self.conn.executemany(f'UPDATE parts SET last_used=? WHERE {KEY}',
+                                  [(t,) + key for key, t in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self, total: int):
+        target = self.max_bytes * LOW_WATER
+        doomed = []
+        freed = 0
+        for rowid, nbytes in self.conn.execute('SELECT rowid, nbytes FROM parts ORDER BY last_used'):
+            if total - freed <= target:
+                break
+            doomed.append((rowid,))
+            freed += nbytes
+        self.conn.executemany('DELETE FROM parts WHERE rowid=?', doomed)
+        self.conn.execute('UPDATE totals SET nbytes = nbytes - ? WHERE id = 0', (freed,))
+        self.evicted += len(doomed)
+
+    def summary(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'evicted': self.evicted}
+
+    def close(self):
+        if self._touched:
+            with self.conn:
+                self._flush_touched()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,243 @@
+"""pivot_caches.py
+Pivot cache records: how big they are, and dropping them safely.
+
+A pivot cache is a definition part (fields, shared items, source range)
+plus an optional records part holding a copy of every source row, often
+the largest part of the file. The records are only needed until the
+next refresh, so strip_pivot_records() drops the records parts and marks
+each definition refreshOnLoad="1" / saveData="0": the pivot tables keep
+their layout and cached items, and Excel rebuilds the records from the
+source range when the file is opened.
+
+Sizes come from the zip central directory; records are counted by
+streaming the part through expat and are never held in memory (the strip
+does not even read them). Without counting, only the root's declared
+count is read. Counts can be kept in a part_cache.PartCache (keyed by the
+records part's name, CRC and size), so an unchanged cache is not
+streamed again.
+"""
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, IO, List, Optional
+from xml.parsers import expat
+
+from xlsx_package import (CONTENT_TYPES_PART, content_types_rewriter, find_workbook_part,
+                          local_name, read_relationships, relationships_rewriter,
+                          rels_part_for, rewrite_package)
+from xml_rewrite import CHUNK_SIZE, XmlRewriter, local
+
+PIVOT_CACHE_DEFINITION_REL = '/pivotCacheDefinition'
+PIVOT_CACHE_RECORDS_REL = '/pivotCacheRecords'
+# PartCache version of the count_records() payloads
+COUNT_VERSION = 'pivot-records-1'
+
+
+def count_records(source: IO[bytes]) -> Dict[str, Any]:
+    """
+    Stream a pivotCacheRecords part: {'record_count': <r> elements,
+    'declared_count': the root's count attribute (None when absent)}.
+    """
+    report = {'record_count': 0, 'declared_count': None}
+
+    def start(name, attrs):
+        tag = local(name)
+        if tag == 'r':
+            report['record_count'] += 1
+        elif tag == 'pivotCacheRecords' and 'count' in attrs:
+            report['declared_count'] = int(attrs['count'])
+
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        parser.Parse(chunk, False)
+    parser.Parse(b'', True)
+    return report
+
+
+def declared_count(source: IO[bytes]) -> Optional[int]:
+    """The count attribute of a pivotCacheRecords root, reading only up to the root."""
+    root = {}
+
+    def start(name, attrs):
+        if not root:
+            root['count'] = attrs.get('count')
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start
+    while not root:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        parser.Parse(chunk, False)
+    try:
+        return int(root['count']) if root.get('count') is not None else None
+    except ValueError:
+        return None
+
+
+def _definition_info(source: IO[bytes]) -> Dict[str, Any]:
+    """Root flags, field count and source of a pivotCacheDefinition part, streamed."""
+    info = {'fields': 0, 'refresh_on_load': False, 'save_data': True, 'source': None}
+
+    def start(name, attrs):
+        tag = local(name)
+        if tag == 'pivotCacheDefinition':
+            info['refresh_on_load'] = attrs.get('refreshOnLoad') in ('1', 'true')
+            info['save_data'] = attrs.get('saveData') not in ('0', 'false')
+        elif tag == 'cacheField':
+            info['fields'] += 1
+        elif tag == 'worksheetSource':
+            if 'name' in attrs:
+                info['source'] = attrs['name']
+            else:
+                sheet = attrs.get('sheet')
+                info['source'] = f"{sheet}!{attrs.get('ref', '')}" if sheet else attrs.get('ref')
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        parser.Parse(chunk, False)
+    parser.Parse(b'', True)
+    return info
+
+
+def pivot_cache_parts(z: zipfile.ZipFile) -> List[Dict[str, Any]]:
+    """
+    The workbook's pivot caches: [{'cache_id', 'definition', 'records',
+    'records_rel_ids'}], 'records' being None for a cache saved without them.
+    """
+    workbook_part = find_workbook_part(z)
+    rels = read_relationships(z, workbook_part, internal_only=True)
+    cache_ids = {}
+    for elem in ET.fromstring(z.read(workbook_part)).iter():
+        if local_name(elem.tag) == 'pivotCache':
+            rid = next((v for k, v in elem.attrib.items() if local_name(k) == 'id'), None)
+            cache_ids[rid] = elem.get('cacheId')
+
+    names = set(z.namelist())
+    caches = []
+    for rid, (rel_type, definition) in rels.items():
+        if not rel_type.endswith(PIVOT_CACHE_DEFINITION_REL) or definition not in names:
+            continue
+        records = {r: target for r, (t, target) in read_relationships(z, definition, True).items()
+                   if t.endswith(PIVOT_CACHE_RECORDS_REL)}
+        part = next((p for p in records.values() if p in names), None)
+        caches.append({'cache_id': cache_ids.get(rid), 'definition': definition,
+                       'records': part, 'records_rel_ids': set(records)})
+    return caches
+
+
+def analyze_pivot_caches(z: zipfile.ZipFile, count: bool = True, part_cache=None) -> List[Dict[str, Any]]:
+    """
+    Per pivot cache: {'cache_id', 'definition', 'records', 'fields', 'source',
+    'refresh_on_load', 'save_data', 'records_compressed_bytes',
+    'records_bytes', 'declared_count', and with count=True 'record_count'}.
+    `part_cache` (part_cache.PartCache) keeps the streamed counts.
+    """
+    report = []
+    for cache in pivot_cache_parts(z):
+        with z.open(cache['definition']) as f:
+            entry = {'cache_id': cache['cache_id'], 'definition': cache['definition'],
+                     'records': cache['records'], **_definition_info(f)}
+        entry['records_compressed_bytes'] = entry['records_bytes'] = 0
+        if cache['records']:
+            info = z.getinfo(cache['records'])
+            entry['records_compressed_bytes'] = info.compress_size
+            entry['records_bytes'] = info.file_size
+            if count:
+                hit = (part_cache.get(info.filename, info.CRC, info.file_size, COUNT_VERSION)
+                       if part_cache else None)
+                if hit is None:
+                    with z.open(info) as f:
+                        hit = count_records(f)
+                    if part_cache:
+                        part_cache.put(info.filename, info.CRC, info.file_size, COUNT_VERSION, hit)
+                entry.update(hit)
+            else:
+                with z.open(info) as f:
+                    entry['declared_count'] = declared_count(f)
+        report.append(entry)
+    return report
+
+
+class _DefinitionRewriter(XmlRewriter):
+    def __init__(self, out: IO[bytes], drop_ids):
+        super().__init__(out)
+        self.drop_ids = drop_ids
+
+    def start(self, name, attrs):
+        if not self.path and local(name) == 'pivotCacheDefinition':
+            # r:id pointed at the records part
+            for key in [k for k, v in attrs.items() if local(k) == 'id' and v in self.drop_ids]:
+                del attrs[key]
+            attrs['refreshOnLoad'] = '1'
+            attrs['saveData'] = '0'
+        return attrs
+
+
+def strip_pivot_records(input_file: str, output_file: str = None) -> Dict[str, Any]:
+    """
+    Write a copy of `input_file` without pivot cache records, keeping the
+    cache definitions (set to refresh on load) and the pivot tables.
+    `output_file` may equal `input_file`.
+
+    Returns {'output', 'caches': [{'cache_id', 'definition', 'records',
+             'records_compressed_bytes', 'records_bytes'}], 'records_removed',
+             'bytes_before', 'bytes_after'}
+    """
+    if output_file is None:
+        output_file = input_file.replace(".xlsx", "_NOPIVOTRECORDS.xlsx")
+
+    with zipfile.ZipFile(input_file, 'r') as z:
+        names = set(z.namelist())
+        caches = pivot_cache_parts(z)
+        sizes = {c['records']: z.getinfo(c['records']) for c in caches if c['records']}
+
+    report = {'output': output_file, 'caches': []}
+    rewriters = {}
+    removed = set()
+    for cache in caches:
+        records = cache['records']
+        info = sizes.get(records)
+        report['caches'].append({'cache_id': cache['cache_id'], 'definition': cache['definition'],
+                                 'records': records,
+                                 'records_compressed_bytes': info.compress_size if info else 0,
+                                 'records_bytes': info.file_size if info else 0})
+        drop_ids = cache['records_rel_ids']
+        rewriters[cache['definition']] = \
+            lambda src, dst, ids=drop_ids: _DefinitionRewriter(dst, ids).rewrite(src)
+        if drop_ids:
+            rewriters[rels_part_for(cache['definition'])] = relationships_rewriter(drop_ids)
+        if records:
+            removed.add(records)
+    if removed and CONTENT_TYPES_PART in names:
+        rewriters[CONTENT_TYPES_PART] = content_types_rewriter(removed)
+
+    report['records_removed'] = len(removed)
+    report.update(rewrite_package(input_file, output_file, rewriters, drop=removed))
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Pivot cache records: sizes, or strip them keeping the pivots")
+    parser.add_argument("input_file", help="Path to the Excel file")
+    parser.add_argument("-o", "--output", help="Optional output file path (with --strip)")
+    parser.add_argument("--strip", action="store_true",
+                        help="Remove the records parts and refresh the caches on load")
+    args = parser.parse_args()
+
+    if args.strip:
+        print(json.dumps(strip_pivot_records(args.input_file, args.output), indent=2))
+    else:
+        with zipfile.ZipFile(args.input_file, 'r') as z:
+            print(json.dumps(analyze_pivot_caches(z), indent=2))
@@ -0,0 +1,137 @@
+"""profiling.py
+Per-phase wall time, CPU time and memory peak for the scan and cleanup
+paths.
+
+    profiler = Profiler()
+    with profiler.phase('load_workbook'):
+        ...
+    with profiler.phase('scan', sheet='Sheet1'):
+        ...
+    result['profile'] = profiler.summary()
+
+Functions take an optional `profiler`; when it is None they use
+NULL_PROFILER, whose phase() hands back one shared no-op context manager,
+so an unprofiled run only pays an attribute lookup per phase. Memory is
+tracked with tracemalloc, which slows the profiled run itself down
+noticeably; Profiler(memory=False) records times only.
+"""
+import contextlib
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class _NullProfiler:
+    enabled = False
+
+    def phase(self, name: str, sheet: str = None):
+        return _NULL_CONTEXT
+
+    def add(self, name: str, record: Dict[str, Any], sheet: str = None):
+        pass
+
+
+NULL_PROFILER = _NullProfiler()
+
+
+class Profiler:
+    enabled = True
+
+    def __init__(self, memory: bool = True):
+        self.memory = memory
+        self.phases: List[Dict[str, Any]] = []
+        self._stack = []  # open phase records, innermost last
+        self._started_tracing = False
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    @contextlib.contextmanager
+    def phase(self, name: str, sheet: str = None):
+        record = {'phase': name, 'sheet': sheet, 'depth': len(self._stack),
+                  'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_memory_bytes': None}
+        self.phases.append(record)
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            # tracemalloc has a single peak counter: fold the running peak
+            # into the enclosing phase before restarting it for this one
+            if self._stack:
+                self._fold_peak(self._stack[-1])
+            tracemalloc.reset_peak()
+            record['peak_memory_bytes'] = 0
+        self._stack.append(record)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = round(time.perf_counter() - wall, 6)
+            record['cpu_seconds'] = round(time.process_time() - cpu, 6)
+            self._stack.pop()
+            if tracing:
+                self._fold_peak(record)
+                if self._stack:
+                    outer = self._stack[-1]
+                    outer['peak_memory_bytes'] = max(outer['peak_memory_bytes'],
+                                                     record['peak_memory_bytes'])
+                tracemalloc.reset_peak()
+
+    @staticmethod
+    def _fold_peak(record: Dict[str, Any]):
+        peak = tracemalloc.get_traced_memory()[1]
+        if peak > record['peak_memory_bytes']:
+            record['peak_memory_bytes'] = peak
+
+    def add(self, name: str, record: Dict[str, Any], sheet: str = None):
+        """Attach a phase measured elsewhere (e.g. in a worker process)."""
+        entry = dict(record, phase=name, sheet=sheet, depth=len(self._stack))
+        self.phases.append(entry)
+
+    def summary(self) -> Dict[str, Any]:
+        peaks = [p['peak_memory_bytes'] for p in self.phases if p['peak_memory_bytes'] is not None]
+        return {
+            'total_wall_seconds': round(time.perf_counter() - self._start_wall, 6),
+            'total_cpu_seconds': round(time.process_time() - self._start_cpu, 6),
+            'peak_memory_bytes': max(peaks) if peaks else None,
+            'phases': [dict(p) for p in self.phases],
+        }
+
+    def close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+def profiled_call(memory: bool, fn: Callable, *args) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Run fn(*args) under a fresh Profiler and return (value, phase record);
+    used to measure work submitted to process pools.
+    """
+    profiler = Profiler(memory)
+    try:
+        with profiler.phase('call'):
+            value = fn(*args)
+    finally:
+        profiler.close()
+    record = profiler.phases[0]
+    return value, {k: record[k] for k in ('wall_seconds', 'cpu_seconds', 'peak_memory_bytes')}
+
+
+def format_profile(profile: Optional[Dict[str, Any]]) -> str:
+    """Plain-text table of a summary() dict."""
+    if not profile:
+        return ''
+    lines = [f"{'phase':<32} {'sheet':<20} {'wall s':>9} {'cpu s':>9} {'peak MB':>9}"]
+    for p in profile['phases']:
+        name = '  ' * p.get('depth', 0) + p['phase']
+        peak = p['peak_memory_bytes']
+        peak = f'{peak / (1 << 20):9.1f}' if peak is not None else f"{'-':>9}"
+        lines.append(f"{name:<32} {(p['sheet'] or ''):<20} "
+                     f"{p['wall_seconds']:9.3f} {p['cpu_seconds']:9.3f} {peak}")
+    lines.append(f"{'total':<32} {'':<20} {profile['total_wall_seconds']:9.3f} "
+                 f"{profile['total_cpu_seconds']:9.3f}")
+    return '\n'.join(lines)
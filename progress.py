@@ -0,0 +1,22 @@
+"""progress.py
+Progress reporting and cooperative cancellation for long-running scans
+and cleanups.
+
+Operations take an optional `progress` callable and call it with small
+event dicts as they go ({'event': 'sheet', 'sheet': 'Data', 'cells': 1200},
+...). The callback may raise Cancelled to stop the operation at that
+point; the exception propagates to the caller unchanged.
+"""
+from typing import Any, Callable, Dict, Optional
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+
+class Cancelled(Exception):
+    """Raised by a progress callback to abort the running operation."""
+
+
+def notify(progress: Optional[ProgressCallback], event: str, **fields):
+    if progress is not None:
+        fields['event'] = event
+        progress(fields)
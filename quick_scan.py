@@ -0,0 +1,290 @@
+"""quick_scan.py
+Budgeted worksheet scan for triage: the per-sheet counters are estimated
+from a sample of the sheet XML instead of parsing all of it.
+
+A sheet part is a deflate stream, so it is still decompressed front to
+back (cheap next to parsing it), but only some 64 KB blocks are parsed.
+The first block (sheet header and first rows) always is; its parse cost
+and cell density decide which fraction of the remaining <sheetData>
+blocks fits the budget, and those are picked evenly across the sheet.
+The block holding </sheetData> is always sampled (it has the last rows),
+and everything after it (merged cells, ...) is parsed in full. Each
+sampled block is cut to whole <row> elements and parsed on its own by the
+same WorksheetScanner.
+
+Counts are extrapolated over the <sheetData> bytes with a ratio estimator
+(count per byte of sampled XML), with a 95 % bound from the spread
+between blocks. Sheets small enough for the budget are scanned exactly.
+
+The data extent and style counts of a sampled sheet come from the
+sampled rows only; info['sample']['approximate'] names those fields.
+When the deadline stops a sheet before </sheetData>, nothing after it
+(merged cells, conditional formats, validations) is read and the data
+extent is unknown: the row / column extent falls back to <dimension> and
+info['sample']['unavailable'] names the fields left at 0. Its counts
+are still extrapolated by bytes (which follow row length, unlike row
+numbers), but the samples all come from the front of the sheet, so
+there is no bound: info['sample']['bound_valid'] is False.
+"""
+import math
+import re
+import time
+import zipfile
+from typing import Any, Dict, IO, List, Optional, Tuple
+
+from sheet_scanner import WorksheetScanner, column_profiler
+
+BLOCK_SIZE = 1 << 16
+Z_95 = 1.96
+# sheets that cannot even be inflated within their time are still sampled
+# this densely, over the part that is reached before the deadline
+MIN_FRACTION = 0.01
+# a sampled block without a complete row borrows at most this many more
+MAX_CARRY_BLOCKS = 16
+# counters extrapolated from the sample (info keys, plus 'cells' / 'string_cells')
+ESTIMATED_FIELDS = ('cells', 'formulas', 'volatile_formulas', 'hidden_rows', 'string_cells')
+# info keys a sample only knows from the rows it parsed (no bound)
+APPROXIMATE_FIELDS = ('unique_styles', 'data_max_row', 'data_max_column', 'wasted_rows', 'wasted_columns')
+# info keys read after </sheetData>
+TAIL_FIELDS = ('merged_cells', 'conditional_formats', 'cf_rules', 'cf_ranges', 'cf_duplicate_rules',
+               'data_validations', 'dv_ranges', 'dv_duplicate_rules')
+# info keys a sheet cut short by the deadline cannot report
+UNAVAILABLE_FIELDS = TAIL_FIELDS + ('data_max_row', 'data_max_column', 'wasted_rows', 'wasted_columns')
+
+_ROOT = re.compile(rb'<((?:[\w.-]+:)?worksheet)[\s/>]')
+_ROW_START = re.compile(rb'<(?:[\w.-]+:)?row[\s/>]')
+_ROW_END = re.compile(rb'</(?:[\w.-]+:)?row>|<(?:[\w.-]+:)?row\b[^<>]*/>')
+_SHEET_DATA_START = re.compile(rb'<(?:[\w.-]+:)?sheetData[\s/>]')
+_SHEET_DATA_END = re.compile(rb'</(?:[\w.-]+:)?sheetData>')
+
+
+class ScanBudget:
+    """
+    Time (seconds) and / or cell allowance for one workbook. Sheets are
+    allotted shares in proportion to their uncompressed size: cells of the
+    whole allowance, time of what is left when the sheet starts.
+    """
+
+    def __init__(self, seconds: float = None, cells: int = None, total_bytes: int = 0):
+        self.seconds = seconds
+        self.cells = cells
+        self.total_bytes = total_bytes
+        self.bytes_left = total_bytes
+        self.started = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def allot(self, size: int) -> Tuple[Optional[float], Optional[float]]:
+        """(seconds, cells) for the next sheet of `size` bytes; None = unlimited."""
+        seconds = cells = None
+        if self.seconds is not None:
+            left = max(self.seconds - self.elapsed(), 0.0)
+            seconds = left * size / max(self.bytes_left, size, 1)
+        if self.cells is not None:
+            cells = self.cells * size / max(self.total_bytes, size, 1)
+        self.bytes_left = max(self.bytes_left - size, 0)
+        return seconds, cells
+
+
+def sample_fraction(size: int, head_bytes: int, head_cells: int, inflate_seconds: float,
+                    parse_seconds: float, seconds: Optional[float], cells: Optional[float]) -> float:
+    """
+    Share of a `size`-byte sheet to parse, judged from its first
+    `head_bytes`: what fits the cell allowance, and the time left after
+    inflating the whole part. 1.0 means scan it exactly.
+    """
+    fraction = 1.0
+    if cells is not None and head_cells:
+        fraction = min(fraction, cells / (head_cells * size / head_bytes))
+    if seconds is not None and parse_seconds > 0:
+        spare = seconds - inflate_seconds * size / head_bytes
+        fraction = min(fraction, spare / (parse_seconds * size / head_bytes))
+    return fraction if fraction >= 1.0 else max(fraction, MIN_FRACTION)
+
+
+def _sheet_data_end(data: bytes):
+    # plain find first: the regex alone is slow on every inflated block
+    if data.find(b'sheetData>') < 0:
+        return None
+    return _SHEET_DATA_END.search(data)
+
+
+def _counts(scanner: WorksheetScanner) -> Tuple[int, ...]:
+    info = scanner.info
+    return (scanner.cells, info['formulas'], info['volatile_formulas'],
+            info['hidden_rows'], scanner.string_cells)
+
+
+def _whole_rows(data: bytes) -> Tuple[Optional[int], Optional[int]]:
+    """(start of the first <row>, end of the last complete row) in `data`."""
+    first = _ROW_START.search(data)
+    if first is None:
+        return None, None
+    last = None
+    for last in _ROW_END.finditer(data, first.start()):
+        pass
+    return first.start(), (last.end() if last else None)
+
+
+def ratio_estimate(samples: List[Tuple[int, int]], population_bytes: int) -> Tuple[int, int]:
+    """
+    Total of a count over `population_bytes` from (count, bytes) samples:
+    (estimate, 95 % bound). With a single sample the bound is the estimate.
+    """
+    n = len(samples)
+    sampled = sum(b for _, b in samples)
+    if not n or not sampled:
+        return 0, 0
+    ratio = sum(y for y, _ in samples) / sampled
+    total = ratio * population_bytes
+    covered = min(sampled / population_bytes, 1.0) if population_bytes else 1.0
+    if covered >= 1.0:
+        return round(total), 0
+    if n < 2:
+        return round(total), round(total)
+    spread = sum((y - ratio * b) ** 2 for y, b in samples) / (n - 1)
+    mean_bytes = sampled / n
+    variance = population_bytes ** 2 * (1 - covered) * spread / (n * mean_bytes ** 2)
+    return round(total), math.ceil(Z_95 * math.sqrt(variance))
+
+
+def sample_worksheet(source: IO[bytes], size: int, budget: ScanBudget,
+                     on_chunk=None, profiler=None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Scan one worksheet stream of `size` uncompressed bytes within `budget`.
+    Same (info, counters) as sheet_scanner.scan_worksheet; estimated sheets
+    also carry info['estimated'] = True, info['error_bounds'] (95 % bound per
+    ESTIMATED_FIELDS entry) and info['sample'] with the 'approximate' and
+    'unavailable' info keys. A column profile (`profiler`) of a sampled
+    sheet covers the sampled rows only.
+    """
+    seconds, cells = budget.allot(size)
+    started = time.perf_counter()
+    deadline = started + seconds if seconds is not None else None
+    scanner = WorksheetScanner(profiler)
+    parser = scanner.parser()
+    head = source.read(BLOCK_SIZE)
+    inflated = time.perf_counter()
+    parser.Parse(head, False)
+    parsed = time.perf_counter()
+    if on_chunk is not None:
+        on_chunk(scanner)
+
+    data_start = _SHEET_DATA_START.search(head)
+    root = _ROOT.search(head)
+    fraction = 1.0
+    if len(head) == BLOCK_SIZE and data_start and root and _sheet_data_end(head) is None:
+        fraction = sample_fraction(size, len(head), scanner.cells, inflated - started,
+                                   parsed - inflated, seconds, cells)
+    if fraction >= 1.0:
+        # fits the budget: keep the same parser going, exact counts
+        while True:
+            chunk = source.read(BLOCK_SIZE)
+            if not chunk:
+                break
+            parser.Parse(chunk, False)
+            if on_chunk is not None:
+                on_chunk(scanner)
+        parser.Parse(b'', True)
+        return scanner.results()
+
+    samples = [(_counts(scanner), len(head) - data_start.start())]
+    offset = len(head)          # bytes read so far
+    data_end = None             # offset of </sheetData>
+    block = 0
+    carry = None                # sampled data still waiting for a complete row
+    carried = 0
+    want = False                # next block should be sampled
+    tail_parser = None
+    truncated = False
+
+    def take(segment: bytes):
+        before = _counts(scanner)
+        scanner.parser().Parse(b'<sample>' + segment, False)  # never closed
+        samples.append((tuple(a - b for a, b in zip(_counts(scanner), before)), len(segment)))
+
+    while True:
+        chunk = source.read(BLOCK_SIZE)
+        if not chunk:
+            break
+        block += 1
+        if tail_parser is not None:
+            tail_parser.Parse(chunk, False)
+        else:
+            end = _sheet_data_end(chunk)
+            rows = chunk[:end.start()] if end else chunk
+            if carry is not None:
+                carry += rows
+                carried += 1
+            elif end or want or math.floor(block * fraction) != math.floor((block - 1) * fraction):
+                first, _ = _whole_rows(rows)
+                want = first is None and not end  # inside one huge row: try the next block
+                if first is not None:
+                    carry = rows[first:]
+                    carried = 0
+            if carry is not None:
+                _, last = _whole_rows(carry)
+                if last is not None:
+                    take(carry[:last])
+                    carry = None
+                elif end or carried >= MAX_CARRY_BLOCKS:
+                    carry = None
+            if end:
+                data_end = offset + end.start()
+                tail_parser = scanner.parser()
+                tail_parser.Parse(b'<' + root.group(1) + b'>' + chunk[end.end():], False)
+        offset += len(chunk)
+        if on_chunk is not None:
+            on_chunk(scanner)
+        if tail_parser is None and deadline is not None and time.perf_counter() >= deadline:
+            truncated = True
+            break
+    if tail_parser is not None:
+        tail_parser.Parse(b'', True)
+
+    population = (data_end if data_end is not None else size) - data_start.start()
+    estimates = [ratio_estimate([(y[i], b) for y, b in samples], population)
+                 for i in range(len(ESTIMATED_FIELDS))]
+    sampled_bytes = sum(b for _, b in samples)
+
+    info, counters = scanner.results()
+    values = dict(zip(ESTIMATED_FIELDS, (value for value, _ in estimates)))
+    for field in ('formulas', 'volatile_formulas', 'hidden_rows'):
+        info[field] = values[field]
+    counters['cells'] = values['cells']
+    counters['string_cells'] = values['string_cells']
+    scale = population / sampled_bytes if sampled_bytes else 1.0
+    counters['styles'] = {xf: round(count * scale) for xf, count in counters['styles'].items()}
+    info['estimated'] = True
+    info['error_bounds'] = dict(zip(ESTIMATED_FIELDS, (bound for _, bound in estimates)))
+    info['sample'] = {
+        'blocks_sampled': len(samples),
+        'sampled_bytes': sampled_bytes,
+        'sheet_data_bytes': population,
+        'fraction': round(sampled_bytes / population, 4) if population else 1.0,
+        'truncated': truncated,
+        # samples from the front only: error_bounds do not cover the unread rows
+        'bound_valid': not truncated,
+        'approximate': list(APPROXIMATE_FIELDS) + (['columns'] if 'columns' in info else []),
+        'unavailable': [],
+    }
+    if truncated:
+        # the last rows and the tail were never read: the extent is what
+        # <dimension> declares, the data extent is unknown
+        info['max_row'] = max(info['max_row'], scanner.dim_row)
+        info['max_column'] = max(info['max_column'], scanner.dim_col)
+        for field in UNAVAILABLE_FIELDS:
+            info[field] = 0
+        info['sample']['approximate'] = [f for f in info['sample']['approximate'] if f not in UNAVAILABLE_FIELDS]
+        info['sample']['unavailable'] = list(UNAVAILABLE_FIELDS)
+    return info, counters
+
+
+def sample_sheet_part(path: str, part: str, budget: ScanBudget, on_chunk=None,
+                      string_table=None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Open `path` and sample the worksheet stored at zip member `part`."""
+    with zipfile.ZipFile(path, 'r') as z:
+        size = z.getinfo(part).file_size
+        with z.open(part) as f:
+            return sample_worksheet(f, size, budget, on_chunk, column_profiler(string_table))
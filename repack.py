@@ -0,0 +1,346 @@
+"""repack.py
+Shrink a workbook package without touching its content.
+
+  - media parts (xl/media/...) are hashed while streaming; identical ones
+    collapse onto the first of them by pointing the relationships of
+    drawings, VML and sheets at it
+  - media no relationship points to any more are dropped
+  - every member is recompressed at a chosen deflate level; members are
+    compressed in a thread pool (zlib releases the GIL) and written in
+    their original order, at most `workers * 2` of them held in memory.
+    A member deflate cannot shrink (most images) is stored instead.
+
+The zipfile module compresses inside write(), so the output is written
+by _ZipWriter from the finished deflate streams.
+
+    python repack.py book.xlsx -o small.xlsx --level 9
+"""
+import hashlib
+import os
+import posixpath
+import struct
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Set, Tuple
+
+from package_sizes import human_size, part_category
+from xlsx_package import content_types_rewriter, local_name, resolve_target, source_part_of
+from xml_rewrite import XmlRewriter, local
+
+DEFAULT_LEVEL = 9
+CHUNK_SIZE = 1 << 20
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+
+
+# ---- media -----------------------------------------------------------
+def _thread_zip(path: str, tls: threading.local, opened: list) -> zipfile.ZipFile:
+    # one handle per thread so reads don't serialise on a shared file lock
+    z = getattr(tls, 'zip', None)
+    if z is None:
+        z = tls.zip = zipfile.ZipFile(path, 'r')
+        opened.append(z)
+    return z
+
+
+def _digest(path: str, name: str, tls: threading.local, opened: list) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    with _thread_zip(path, tls, opened).open(name) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.digest()
+
+
+def media_duplicates(path: str, names: List[str], workers: int = None) -> Dict[str, str]:
+    """{duplicate media part: first part with the same content}, hashed in parallel."""
+    tls = threading.local()
+    opened = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            digests = list(pool.map(lambda n: _digest(path, n, tls, opened), names))
+    finally:
+        for z in opened:
+            z.close()
+    first = {}
+    duplicates = {}
+    for name, digest in zip(names, digests):
+        canonical = first.setdefault(digest, name)
+        if canonical != name:
+            duplicates[name] = canonical
+    return duplicates
+
+
+def _relationships(z: zipfile.ZipFile, rels_name: str) -> List[Tuple[str, str, str]]:
+    """[(Id, raw Target, resolved part)] of the internal relationships in a .rels part."""
+    source = source_part_of(rels_name)
+    out = []
+    for rel in ET.fromstring(z.read(rels_name)):
+        if local_name(rel.tag) != 'Relationship' or rel.get('TargetMode') == 'External':
+            continue
+        target = rel.get('Target', '')
+        out.append((rel.get('Id'), target, resolve_target(source, target)))
+    return out
+
+
+def plan_media(z: zipfile.ZipFile, duplicates: Dict[str, str],
+               media: Iterable[str]) -> Tuple[Dict[str, Dict[str, str]], Set[str]]:
+    """
+    Relationship targets to rewrite ({rels part: {Id: new Target}}) so no
+    relationship points at a duplicate, and the media parts that are left
+    without any relationship (duplicates included).
+    """
+    retarget = {}
+    referenced = set()
+    for rels_name in (n for n in z.namelist() if n.endswith('.rels')):
+        folder = posixpath.dirname(source_part_of(rels_name))
+        for rel_id, target, part in _relationships(z, rels_name):
+            canonical = duplicates.get(part, part)
+            referenced.add(canonical)
+            if canonical != part:
+                new = '/' + canonical if target.startswith('/') else posixpath.relpath(canonical, folder)
+                retarget.setdefault(rels_name, {})[rel_id] = new
+    return retarget, set(media) - referenced
+
+
+class _TargetRewriter(XmlRewriter):
+    def __init__(self, out: IO[bytes], targets: Dict[str, str]):
+        super().__init__(out)
+        self.targets = targets
+
+    def start(self, name, attrs):
+        if local(name) == 'Relationship' and attrs.get('Id') in self.targets:
+            attrs['Target'] = self.targets[attrs['Id']]
+        return attrs
+
+
+# ---- compression -----------------------------------------------------
+class _DeflateSink:
+    """File-like target collecting the deflate stream, CRC and size of what is written to it."""
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        self.chunks = []
+        self.crc = 0
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        out = self._compressor.compress(data)
+        if out:
+            self.chunks.append(out)
+        return len(data)
+
+    def finish(self) -> List[bytes]:
+        self.chunks.append(self._compressor.flush())
+        return self.chunks
+
+
+class _Member:
+    __slots__ = ('info', 'method', 'crc', 'size', 'chunks')
+
+    def __init__(self, info: zipfile.ZipInfo, method: int, crc: int, size: int, chunks: List[bytes]):
+        self.info = info
+        self.method = method
+        self.crc = crc
+        self.size = size
+        self.chunks = chunks
+
+    @property
+    def compressed_size(self) -> int:
+        return sum(len(c) for c in self.chunks)
+
+
+def _compress(path: str, info: zipfile.ZipInfo, rewriter, level: int,
+              tls: threading.local, opened: list) -> _Member:
+    z = _thread_zip(path, tls, opened)
+    sink = _DeflateSink(level)
+    with z.open(info) as src:
+        if rewriter is None:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                sink.write(chunk)
+        else:
+            rewriter(src, sink)
+    chunks = sink.finish()
+    member = _Member(info, zipfile.ZIP_DEFLATED, sink.crc, sink.size, chunks)
+    if rewriter is None and member.compressed_size >= sink.size:
+        member.method, member.chunks = zipfile.ZIP_STORED, [z.read(info)]
+    return member
+
+
+def _in_order(pool: ThreadPoolExecutor, fn: Callable, items: Iterable, window: int) -> Iterator:
+    """pool.map() that keeps at most `window` results pending."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class _ZipWriter:
+    """Writes members whose (deflate) data is already computed, zip64 where needed."""
+
+    def __init__(self, fp: IO[bytes]):
+        self.fp = fp
+        self.entries = []
+        self.offset = 0
+
+    @staticmethod
+    def _dos_time(date_time) -> Tuple[int, int]:
+        y, mo, d, h, mi, s = date_time
+        return (h << 11) | (mi << 5) | (s // 2), (max(y - 1980, 0) << 9) | (mo << 5) | d
+
+    def add(self, member: _Member):
+        info = member.info
+        name = info.filename.encode('utf-8')
+        flags = 0x800 if not info.filename.isascii() else 0
+        dos_time, dos_date = self._dos_time(info.date_time)
+        csize = member.compressed_size
+        zip64 = member.size >= ZIP64_LIMIT or csize >= ZIP64_LIMIT
+        extra = struct.pack('<HHQQ', 1, 16, member.size, csize) if zip64 else b''
+        header = struct.pack('<IHHHHHIIIHH', 0x04034b50, 45 if zip64 else 20, flags, member.method,
+                             dos_time, dos_date, member.crc,
+                             ZIP64_LIMIT if zip64 else csize, ZIP64_LIMIT if zip64 else member.size,
+                             len(name), len(extra))
+        self.entries.append((member, name, flags, dos_time, dos_date, csize, self.offset))
+        self.fp.write(header + name + extra)
+        for chunk in member.chunks:
+            self.fp.write(chunk)
+        self.offset += len(header) + len(name) + len(extra) + csize
+
+    def close(self):
+        start = self.offset
+        for member, name, flags, dos_time, dos_date, csize, offset in self.entries:
+            fields = [v for v in (member.size, csize, offset) if v >= ZIP64_LIMIT]
+            extra = struct.pack('<HH', 1, 8 * len(fields)) + struct.pack(f'<{len(fields)}Q', *fields) \
+                if fields else b''
+            record = struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50,
+                                 (member.info.create_system << 8) | 20, 45 if fields else 20,
+                                 flags, member.method, dos_time, dos_date, member.crc,
+                                 min(csize, ZIP64_LIMIT), min(member.size, ZIP64_LIMIT),
+                                 len(name), len(extra), 0, 0, 0, member.info.external_attr,
+                                 min(offset, ZIP64_LIMIT))
+            self.fp.write(record + name + extra)
+            self.offset += len(record) + len(name) + len(extra)
+        size = self.offset - start
+        count = len(self.entries)
+        if count >= ZIP64_COUNT_LIMIT or start >= ZIP64_LIMIT or size >= ZIP64_LIMIT:
+            self.fp.write(struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0,
+                                      count, count, size, start))
+            self.fp.write(struct.pack('<IIQI', 0x07064b50, 0, self.offset, 1))
+        self.fp.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(count, ZIP64_COUNT_LIMIT),
+                                  min(count, ZIP64_COUNT_LIMIT), min(size, ZIP64_LIMIT),
+                                  min(start, ZIP64_LIMIT), 0))
+
+
+# ---- repack ----------------------------------------------------------
+def repack_package(input_file: str, output_file: str = None, level: int = DEFAULT_LEVEL,
+                   workers: int = None, dedupe_media: bool = True) -> Dict[str, Any]:
+    """
+    Write a deduplicated, recompressed copy of `input_file` (may equal
+    `output_file`). `level` is the zlib deflate level (0-9).
+
+    Returns {'output', 'level', 'media_duplicates', 'media_orphans',
+             'members_before', 'members_after', 'bytes_before', 'bytes_after',
+             'categories': {category: {'bytes_before', 'bytes_after', 'bytes_saved'}}}
+    with compressed member bytes per package_sizes category.
+    """
+    if output_file is None:
+        output_file = input_file.replace(".xlsx", "_REPACKED.xlsx")
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+
+    with zipfile.ZipFile(input_file, 'r') as z:
+        infos = [i for i in z.infolist() if not i.is_dir()]
+        media = [i.filename for i in infos if part_category(i.filename) == 'media']
+        duplicates = media_duplicates(input_file, media, workers) if dedupe_media and media else {}
+        retarget, dropped = plan_media(z, duplicates, media) if dedupe_media else ({}, set())
+
+    rewriters = {name: (lambda src, dst, t=targets: _TargetRewriter(dst, t).rewrite(src))
+                 for name, targets in retarget.items()}
+    if dropped:
+        rewriters['[Content_Types].xml'] = content_types_rewriter(dropped)
+    kept = [i for i in infos if i.filename not in dropped]
+
+    categories = {}
+    for info in infos:
+        entry = categories.setdefault(part_category(info.filename),
+                                      {'bytes_before': 0, 'bytes_after': 0, 'bytes_saved': 0})
+        entry['bytes_before'] += info.compress_size
+
+    bytes_before = os.path.getsize(input_file)
+    fd, tmp = tempfile.mkstemp(suffix='.xlsx', dir=os.path.dirname(os.path.abspath(output_file)))
+    tls = threading.local()
+    opened = []
+    try:
+        with os.fdopen(fd, 'wb') as out, ThreadPoolExecutor(max_workers=workers) as pool:
+            writer = _ZipWriter(out)
+            compress = lambda info: _compress(input_file, info, rewriters.get(info.filename),
+                                              level, tls, opened)
+            for member in _in_order(pool, compress, kept, workers * 2):
+                writer.add(member)
+                categories[part_category(member.info.filename)]['bytes_after'] += member.compressed_size
+            writer.close()
+        os.replace(tmp, output_file)
+    finally:
+        for z in opened:
+            z.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    for entry in categories.values():
+        entry['bytes_saved'] = entry['bytes_before'] - entry['bytes_after']
+    return {
+        'output': output_file,
+        'level': level,
+        'media_duplicates': len(duplicates),
+        'media_orphans': len(dropped) - len(duplicates),
+        'members_before': len(infos),
+        'members_after': len(kept),
+        'bytes_before': bytes_before,
+        'bytes_after': os.path.getsize(output_file),
+        'categories': dict(sorted(categories.items(), key=lambda item: -item[1]['bytes_saved'])),
+    }
+
+
+def format_repack(report: Dict[str, Any]) -> str:
+    """Plain-text summary of a repack_package report, bytes saved per category."""
+    lines = [f"{human_size(report['bytes_before'])} → {human_size(report['bytes_after'])} "
+             f"(level {report['level']}, {report['media_duplicates']} duplicate and "
+             f"{report['media_orphans']} orphaned media dropped)",
+             '',
+             f"{'Category':<16}{'Before':>14}{'After':>14}{'Saved':>14}"]
+    for name, c in report['categories'].items():
+        lines.append(f"{name:<16}{human_size(c['bytes_before']):>14}{human_size(c['bytes_after']):>14}"
+                     f"{human_size(c['bytes_saved']):>14}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Deduplicate media and recompress a workbook package")
+    parser.add_argument("input_file", help="Path to the Excel file")
+    parser.add_argument("-o", "--output", help="Optional output file path")
+    parser.add_argument("--level", type=int, default=DEFAULT_LEVEL, choices=range(10), metavar="0-9",
+                        help="Deflate level (default %(default)s)")
+    parser.add_argument("--workers", type=int, help="Compression threads")
+    parser.add_argument("--keep-media", action="store_true", help="Only recompress, keep all media")
+    parser.add_argument("--json", action="store_true", help="Print the structured result")
+    args = parser.parse_args()
+
+    report = repack_package(args.input_file, args.output, args.level, args.workers, not args.keep_media)
+    print(json.dumps(report, indent=2) if args.json else format_repack(report))
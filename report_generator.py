@@ -1,11 +1,33 @@
 """report_generator.py
-Generate a human-readable HTML report using a simple jinja2 template.
+Write analyzer results as HTML, JSON or CSV, and aggregate many results
+into one batch dashboard.
+
+    generate_report(result, 'book.html')          # format from the extension
+    write_dashboard(iter_results(paths), 'batch.html')
+
+The jinja2 templates are compiled once per process (jinja2 is imported on
+first use, so importing this module stays cheap). Dashboards consume an
+iterable of results and write each row as it arrives, so memory does not
+grow with the number of workbooks; only the totals and a small top-N list
+are kept.
 """
+import csv
+import functools
+import heapq
+import itertools
 import json
-import sys
-from jinja2 import Template
+import os
+from typing import Any, Dict, Iterable, Iterator, List
 
 HTML_TEMPLATE = '''
+{% macro sampled(info, field) -%}
+{% if field in ((info.sample or {}).unavailable or []) %}n/a
+{%- elif field in ((info.sample or {}).approximate or []) %}~{{ info[field] }}
+{%- else %}{{ info[field] }}{% endif %}
+{%- endmacro %}
+{% macro estimate(value, bounds, field, valid) -%}
+{% if not bounds %}{{ value }}{% elif valid is false %}~{{ value }}{% else %}{{ value }} ± {{ bounds[field] }}{% endif %}
+{%- endmacro %}
 <!doctype html>
 <html>
 <head>
@@ -21,6 +43,9 @@ h1{font-size:22px}
 </head>
 <body>
 <h1>Excel Analyzer Report</h1>
+{% if error %}
+<div class="section" style="border-color:#c33"><strong>Error:</strong> {{ error }}</div>
+{% endif %}
 <div class="section">
 <strong>File:</strong> {{ path }}<br>
 <strong>Sheets:</strong> {{ sheet_count }}<br>
@@ -31,11 +56,14 @@ h1{font-size:22px}
 
 <div class="section">
 <h2>Summary</h2>
+{% if estimated %}
+<p>Quick scan: large sheets were sampled; ± figures are 95 % error bounds, ~ marks values seen in the sampled rows only or extrapolated from a sheet cut short by the time budget (no bound), n/a what such a sheet did not reach.</p>
+{% endif %}
 <ul>
-<li>Total cells scanned (estimate): {{ total_cells_scanned_estimate }}</li>
-<li>Total formulas: {{ total_formulas }}</li>
-<li>Total volatile formulas: {{ total_volatile_formulas }}</li>
-<li>Total merged cells: {{ total_merged_cells }}</li>
+<li>Total cells scanned (estimate): {{ estimate(total_cells_scanned_estimate, error_bounds, 'total_cells_scanned_estimate', bounds_valid) }}</li>
+<li>Total formulas: {{ estimate(total_formulas, error_bounds, 'total_formulas', bounds_valid) }}</li>
+<li>Total volatile formulas: {{ estimate(total_volatile_formulas, error_bounds, 'total_volatile_formulas', bounds_valid) }}</li>
+<li>Total merged cells: {{ total_merged_cells }}{% if 'total_merged_cells' in (incomplete_totals or []) %} (without sheets cut short){% endif %}</li>
 </ul>
 </div>
 
@@ -43,50 +71,409 @@ h1{font-size:22px}
 <div class="section">
 <h2>Sheets</h2>
 <table class="table">
-<thead><tr><th>Sheet</th><th>Rows</th><th>Cols</th><th>Formulas</th><th>Volatile</th><th>Merged</th><th>Hidden rows</th><th>Hidden cols</th><th>Unique styles</th></tr></thead>
+<thead><tr><th>Sheet</th><th>Rows</th><th>Cols</th><th>Formulas</th><th>Volatile</th><th>Merged</th><th>Hidden rows</th><th>Hidden cols</th><th>Unique styles</th><th>Wasted rows</th><th>Wasted cols</th><th>CF rules</th><th>CF ranges</th><th>Validations</th></tr></thead>
 <tbody>
-{% for name,info in sheets.items() %}
+{% for name,info in (sheets or {}).items() %}
 <tr>
 <td>{{ name }}</td>
 <td>{{ info.max_row }}</td>
 <td>{{ info.max_column }}</td>
-<td>{{ info.formulas }}</td>
-<td>{{ info.volatile_formulas }}</td>
-<td>{{ info.merged_cells }}</td>
-<td>{{ info.hidden_rows }}</td>
+<td>{{ estimate(info.formulas, info.error_bounds, 'formulas', (info.sample or {}).bound_valid) }}</td>
+<td>{{ estimate(info.volatile_formulas, info.error_bounds, 'volatile_formulas', (info.sample or {}).bound_valid) }}</td>
+<td>{{ sampled(info, 'merged_cells') }}</td>
+<td>{{ estimate(info.hidden_rows, info.error_bounds, 'hidden_rows', (info.sample or {}).bound_valid) }}</td>
 <td>{{ info.hidden_columns }}</td>
-<td>{{ info.unique_styles }}</td>
+<td>{{ sampled(info, 'unique_styles') }}</td>
+<td>{{ sampled(info, 'wasted_rows') }}</td>
+<td>{{ sampled(info, 'wasted_columns') }}</td>
+<td>{{ sampled(info, 'cf_rules') }}{% if info.cf_duplicate_rules %} ({{ info.cf_duplicate_rules }} duplicate){% endif %}</td>
+<td>{{ sampled(info, 'cf_ranges') }}</td>
+<td>{{ sampled(info, 'data_validations') }}{% if info.dv_duplicate_rules %} ({{ info.dv_duplicate_rules }} duplicate){% endif %}</td>
 </tr>
 {% endfor %}
 </tbody>
 </table>
 </div>
 
+{% if column_issues %}
+<div class="section">
+<h2>Column profile</h2>
+<p>Numbers stored as text: {{ column_issues.numbers_as_text }}, error cells: {{ column_issues.error_cells }}, long text cells: {{ column_issues.long_text_cells }}, mixed-type columns: {{ column_issues.mixed_type_columns }}</p>
+{% for name, info in (sheets or {}).items() if info.columns %}
+<h3>{{ name }}</h3>
+<table class="table">
+<thead><tr><th>Column</th><th>Cells</th><th>Types</th><th>Formulas</th><th>Numbers as text</th><th>Errors</th><th>Long text</th><th>Max length</th><th>Min</th><th>Max</th><th>Mean</th></tr></thead>
+<tbody>
+{% for letter, c in info.columns.items() %}
+<tr>
+<td>{{ letter }}</td>
+<td>{{ c.cells }}</td>
+<td>{% for t, n in c.types.items() %}{{ t }} {{ n }}{% if not loop.last %}, {% endif %}{% endfor %}{% if c.mixed_types %} (mixed){% endif %}</td>
+<td>{{ c.formulas }}</td>
+<td>{{ c.numbers_as_text }}</td>
+<td>{% for e, n in c.errors.items() %}{{ e }} {{ n }}{% if not loop.last %}, {% endif %}{% endfor %}</td>
+<td>{{ c.long_text }}</td>
+<td>{{ c.max_text_length }}</td>
+<td>{{ c.min if c.min is not none else '' }}</td>
+<td>{{ c.max if c.max is not none else '' }}</td>
+<td>{{ c.mean if c.mean is not none else '' }}</td>
+</tr>
+{% endfor %}
+</tbody>
+</table>
+{% endfor %}
+</div>
+{% endif %}
+
+{% if package_sizes %}
+<div class="section">
+<h2>Package size</h2>
+<p>{{ package_sizes.compressed_bytes }} bytes compressed, {{ package_sizes.uncompressed_bytes }} uncompressed ({{ package_sizes.ratio }}x) in {{ package_sizes.members }} members</p>
+<table class="table">
+<thead><tr><th>Category</th><th>Members</th><th>Compressed</th><th>Uncompressed</th><th>Ratio</th><th>Share</th></tr></thead>
+<tbody>
+{% for name, c in package_sizes.categories.items() %}
+<tr><td>{{ name }}</td><td>{{ c.members }}</td><td>{{ c.compressed_bytes }}</td><td>{{ c.uncompressed_bytes }}</td><td>{{ c.ratio }}</td><td>{{ '%.1f' % (c.share * 100) }} %</td></tr>
+{% endfor %}
+</tbody>
+</table>
+<table class="table">
+<thead><tr><th>Largest member</th><th>Category</th><th>Compressed</th><th>Uncompressed</th><th>Ratio</th></tr></thead>
+<tbody>
+{% for m in package_sizes.largest %}
+<tr><td>{{ m.part }}</td><td>{{ m.category }}</td><td>{{ m.compressed_bytes }}</td><td>{{ m.uncompressed_bytes }}</td><td>{{ m.ratio }}</td></tr>
+{% endfor %}
+</tbody>
+</table>
+</div>
+{% endif %}
+
+{% if pivot_caches and not pivot_caches.error %}
+<div class="section">
+<h2>Pivot caches</h2>
+<table class="table">
+<thead><tr><th>Cache</th><th>Source</th><th>Fields</th><th>Records</th><th>Records bytes</th><th>Compressed</th><th>Refresh on load</th></tr></thead>
+<tbody>
+{% for c in pivot_caches %}
+<tr><td>{{ c.cache_id }} ({{ c.definition }})</td><td>{{ c.source or '' }}</td><td>{{ c.fields }}</td><td>{% if not c.records %}not saved{% elif c.record_count is defined %}{{ c.record_count }}{% elif c.declared_count is not none %}~{{ c.declared_count }} (declared){% else %}n/a{% endif %}</td><td>{{ c.records_bytes }}</td><td>{{ c.records_compressed_bytes }}</td><td>{{ 'yes' if c.refresh_on_load else 'no' }}</td></tr>
+{% endfor %}
+</tbody>
+</table>
+</div>
+{% endif %}
+
+{% if shared_strings and not shared_strings.error %}
+<div class="section">
+<h2>Shared strings</h2>
+<ul>
+<li>Part: {{ shared_strings.part }} ({{ shared_strings.bytes }} bytes, {{ shared_strings.compressed_bytes }} compressed)</li>
+<li>Entries: {{ shared_strings.entries }} (declared count {{ shared_strings.count }}, uniqueCount {{ shared_strings.unique_count }})</li>
+<li>Duplicate entries: {{ shared_strings.duplicate_entries }} ({{ shared_strings.duplicate_bytes }} bytes)</li>
+{% if shared_strings.unreferenced_entries is defined %}
+<li>Unreferenced entries: {{ shared_strings.unreferenced_entries }} ({{ shared_strings.unreferenced_bytes }} bytes)</li>
+{% endif %}
+<li>Rich text: {{ shared_strings.rich_text_entries }} entries, {{ shared_strings.rich_text_runs }} runs</li>
+</ul>
+<table class="table">
+<thead><tr><th>Index</th><th>Bytes</th><th>Runs</th><th>Preview</th></tr></thead>
+<tbody>
+{% for s in shared_strings.largest %}
+<tr><td>{{ s.index }}</td><td>{{ s.bytes }}</td><td>{{ s.runs }}</td><td>{{ s.preview }}</td></tr>
+{% endfor %}
+</tbody>
+</table>
+</div>
+{% endif %}
+
+{% if profile %}
+<div class="section">
+<h2>Profile</h2>
+<table class="table">
+<thead><tr><th>Phase</th><th>Sheet</th><th>Wall (s)</th><th>CPU (s)</th><th>Peak memory (MB)</th></tr></thead>
+<tbody>
+{% for p in profile.phases %}
+<tr>
+<td style="padding-left:{{ 6 + 16 * p.depth }}px">{{ p.phase }}</td>
+<td>{{ p.sheet or '' }}</td>
+<td>{{ '%.3f' % p.wall_seconds }}</td>
+<td>{{ '%.3f' % p.cpu_seconds }}</td>
+<td>{{ '%.1f' % (p.peak_memory_bytes / 1048576) if p.peak_memory_bytes is not none else '-' }}</td>
+</tr>
+{% endfor %}
+<tr><th>Total</th><th></th><th>{{ '%.3f' % profile.total_wall_seconds }}</th><th>{{ '%.3f' % profile.total_cpu_seconds }}</th><th></th></tr>
+</tbody>
+</table>
+</div>
+{% endif %}
 
 </body>
 </html>
 '''
 
-def generate_report(analyzer_result: dict, out_path: str):
-    tmpl = Template(HTML_TEMPLATE)
-    html = tmpl.render(**analyzer_result)
-    with open(out_path, 'w', encoding='utf-8') as f:
-        f.write(html)
 
-def generate_report(text, output_path="excel_report.txt"):
+DASHBOARD_TEMPLATE = '''
+<!doctype html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Excel Batch Dashboard</title>
+<style>
+body{font-family: Arial, sans-serif;padding:18px}
+h1{font-size:22px}
+.section{margin-bottom:18px;padding:12px;border:1px solid #ddd;border-radius:8px}
+.table{width:100%;border-collapse:collapse}
+.table th,.table td{border:1px solid #ccc;padding:6px;text-align:left}
+tr.error td{background:#fbeaea}
+</style>
+</head>
+<body>
+<h1>Excel Batch Dashboard</h1>
+<div class="section">
+<h2>Workbooks</h2>
+<table class="table">
+<thead><tr><th>File</th><th>Status</th><th>Sheets</th><th>Cells</th><th>Formulas</th><th>Volatile</th><th>Merged</th><th>Wasted rows</th><th>Media</th><th>External links</th></tr></thead>
+<tbody>
+{% for r in rows %}
+<tr class="{{ r.status }}">
+<td>{{ r.path }}</td>
+<td>{{ r.error or r.status }}</td>
+<td>{{ r.sheet_count }}</td>
+<td>{{ r.total_cells_scanned_estimate }}</td>
+<td>{{ r.total_formulas }}</td>
+<td>{{ r.total_volatile_formulas }}</td>
+<td>{{ r.total_merged_cells }}</td>
+<td>{{ r.wasted_rows }}</td>
+<td>{{ r.media_count }}</td>
+<td>{{ r.external_links_count }}</td>
+</tr>
+{% endfor %}
+</tbody>
+</table>
+</div>
+
+<div class="section">
+<h2>Totals</h2>
+<ul>
+<li>Workbooks: {{ totals.workbooks }} ({{ totals.failed }} failed)</li>
+<li>Sheets: {{ totals.sheet_count }}</li>
+<li>Cells scanned (estimate): {{ totals.total_cells_scanned_estimate }}</li>
+<li>Formulas: {{ totals.total_formulas }} ({{ totals.total_volatile_formulas }} volatile)</li>
+<li>Merged cells: {{ totals.total_merged_cells }}</li>
+<li>Wasted rows: {{ totals.wasted_rows }}</li>
+<li>Media files: {{ totals.media_count }}</li>
+<li>External links: {{ totals.external_links_count }}</li>
+<li>Pivot cache records: {{ totals.pivot_records_bytes }} bytes</li>
+</ul>
+</div>
+
+<div class="section">
+<h2>Largest workbooks</h2>
+<table class="table">
+<thead><tr><th>File</th><th>Cells</th><th>Formulas</th><th>Volatile</th></tr></thead>
+<tbody>
+{% for r in largest %}
+<tr><td>{{ r.path }}</td><td>{{ r.total_cells_scanned_estimate }}</td><td>{{ r.total_formulas }}</td><td>{{ r.total_volatile_formulas }}</td></tr>
+{% endfor %}
+</tbody>
+</table>
+</div>
+
+</body>
+</html>
+'''
+
+REPORT_FORMATS = ('html', 'json', 'csv')
+_EXTENSIONS = {'.html': 'html', '.htm': 'html', '.json': 'json', '.csv': 'csv'}
+
+# per-sheet columns of the single-workbook CSV
+SHEET_COLUMNS = ('max_row', 'max_column', 'formulas', 'volatile_formulas', 'merged_cells',
+                 'hidden_rows', 'hidden_columns', 'unique_styles', 'dimension',
+                 'data_max_row', 'data_max_column', 'wasted_rows', 'wasted_columns',
+                 'conditional_formats', 'cf_rules', 'cf_ranges', 'cf_duplicate_rules',
+                 'data_validations', 'dv_ranges', 'dv_duplicate_rules')
+# one dashboard row per workbook; the numeric ones are also totalled
+SUMMARY_TOTALS = ('sheet_count', 'zip_entry_count', 'media_count', 'external_links_count',
+                  'total_cells_scanned_estimate', 'total_formulas', 'total_volatile_formulas',
+                  'total_merged_cells', 'wasted_rows', 'total_cf_rules', 'total_cf_duplicate_rules',
+                  'total_data_validations', 'pivot_records_bytes')
+SUMMARY_COLUMNS = ('path', 'status') + SUMMARY_TOTALS + ('error',)
+LARGEST_COUNT = 20
+
+
+@functools.lru_cache(maxsize=None)
+def _template(source: str):
+    from jinja2 import Environment
+    return Environment(autoescape=True).from_string(source)
+
+
+def report_format(path: str, fmt: str = None) -> str:
+    """`fmt` if given, otherwise the format implied by the file extension."""
+    fmt = fmt or _EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f'Cannot tell the report format of {path!r}, expected one of {REPORT_FORMATS}')
+    return fmt
+
+
+def generate_report(analyzer_result: Dict[str, Any], out_path: str, fmt: str = None) -> str:
+    """Write one analyze_xlsx result as HTML, JSON or CSV (one row per sheet)."""
+    fmt = report_format(out_path, fmt)
+    if fmt == 'html':
+        with open(out_path, 'w', encoding='utf-8') as f:
+            for chunk in _template(HTML_TEMPLATE).generate(**analyzer_result):
+                f.write(chunk)
+    elif fmt == 'json':
+        with open(out_path, 'w', encoding='utf-8') as f:
+            json.dump(analyzer_result, f, indent=2)
+    else:
+        with open(out_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('path', 'sheet') + SHEET_COLUMNS)
+            for name, info in (analyzer_result.get('sheets') or {}).items():
+                writer.writerow([analyzer_result.get('path'), name] + [info.get(c) for c in SHEET_COLUMNS])
+    return out_path
+
+
+def write_text_report(text: str, output_path: str = "excel_report.txt") -> str:
+    """Save already formatted text (the GUI's output pane) as is."""
     with open(output_path, "w", encoding="utf-8") as f:
         f.write(text)
     return output_path
 
 
+def summary_row(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten one analyzer result into a dashboard row."""
+    row = {c: result.get(c) for c in SUMMARY_COLUMNS}
+    row['status'] = 'error' if result.get('error') else 'ok'
+    sheets = result.get('sheets') or {}
+    row['wasted_rows'] = sum(info.get('wasted_rows', 0) for info in sheets.values())
+    return row
+
+
+def _tally(results: Iterable[Dict[str, Any]], totals: Dict[str, Any],
+           largest: List) -> Iterator[Dict[str, Any]]:
+    """Yield dashboard rows, folding each into `totals` and the `largest` heap."""
+    for seq, result in enumerate(results):
+        row = summary_row(result)
+        totals['workbooks'] += 1
+        totals['failed'] += row['status'] == 'error'
+        for c in SUMMARY_TOTALS:
+            totals[c] += row[c] or 0
+        entry = (row['total_cells_scanned_estimate'] or 0, -seq, row)
+        if len(largest) < LARGEST_COUNT:
+            heapq.heappush(largest, entry)
+        else:
+            heapq.heappushpop(largest, entry)
+        yield row
+
+
+def write_dashboard(results: Iterable[Dict[str, Any]], out_path: str, fmt: str = None) -> Dict[str, Any]:
+    """
+    Aggregate many analyzer results into one dashboard, streaming rows to
+    `out_path` as `results` yields them. Returns the totals.
+    """
+    fmt = report_format(out_path, fmt)
+    totals: Dict[str, Any] = dict.fromkeys(('workbooks', 'failed') + SUMMARY_TOTALS, 0)
+    largest: List = []
+    rows = _tally(results, totals, largest)
+
+    def ranked():
+        return [row for _, _, row in sorted(largest, reverse=True)]
+
+    with open(out_path, 'w', encoding='utf-8', newline='' if fmt == 'csv' else None) as f:
+        if fmt == 'html':
+            # the totals/largest sections render after the row loop has run
+            context = {'rows': rows, 'totals': totals, 'largest': _Deferred(ranked)}
+            for chunk in _template(DASHBOARD_TEMPLATE).generate(**context):
+                f.write(chunk)
+        elif fmt == 'json':
+            f.write('{"results": [')
+            for i, row in enumerate(rows):
+                f.write((',\n' if i else '\n') + json.dumps(row))
+            f.write('\n],\n"totals": ' + json.dumps(totals, indent=2))
+            f.write(',\n"largest": ' + json.dumps([r['path'] for r in ranked()]) + '}\n')
+        else:
+            writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    return totals
+
+
+class _Deferred:
+    """Iterable that calls `fn` only when the template reaches it."""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __iter__(self):
+        return iter(self.fn())
+
+
+def iter_results(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield analyzer results from analyzer JSON files (one result or a list),
+    JSON-lines files (one result per line, batch_scan.py records included)
+    or workbooks, which are analyzed on the fly. Unreadable inputs yield
+    {'path', 'error'}.
+    """
+    for path in paths:
+        ext = os.path.splitext(path)[1].lower()
+        try:
+            if ext == '.jsonl':
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            yield _unwrap(json.loads(line))
+            elif ext == '.json':
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, list):
+                    yield from data
+                else:
+                    yield data
+            else:
+                from analyzer import analyze_xlsx
+                yield analyze_xlsx(path)
+        except (OSError, ValueError) as e:
+            yield {'path': path, 'error': f'Failed to read result: {e}'}
+
+
+def _unwrap(record: Dict[str, Any]) -> Dict[str, Any]:
+    # batch_scan.py nests the analyzer result; timeouts have none at all
+    if 'analysis' in record:
+        return record['analysis']
+    if record.get('status') in ('error', 'timeout') and 'sheets' not in record:
+        return {'path': record.get('path'), 'error': record.get('error') or record['status']}
+    return record
+
+
+def build_report(inputs: List[str], out_path: str, fmt: str = None) -> Dict[str, Any]:
+    """
+    A single result becomes a workbook report; anything more becomes a
+    dashboard. Returns {'output', 'kind': 'report'|'dashboard', 'workbooks', 'failed'}.
+    """
+    results = iter_results(inputs)
+    first = next(results, None)
+    second = next(results, None)
+    if first is None:
+        raise ValueError('No analyzer results found')
+    if second is None:
+        generate_report(first, out_path, fmt)
+        return {'output': out_path, 'kind': 'report', 'workbooks': 1,
+                'failed': int(bool(first.get('error')))}
+    totals = write_dashboard(itertools.chain((first, second), results), out_path, fmt)
+    return {'output': out_path, 'kind': 'dashboard', 'workbooks': totals['workbooks'],
+            'failed': totals['failed']}
+
+
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
-        print('Usage: python report_generator.py <analyzer_json_path> <out_report.html>')
-        sys.exit(1)
-    import json
-    ajson = sys.argv[1]
-    out = sys.argv[2]
-    with open(ajson, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    generate_report(data, out)
-    print('Report written to', out)
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write an analyzer report or a batch dashboard")
+    parser.add_argument("inputs", nargs='+', help="Analyzer JSON / JSON-lines files or workbooks")
+    parser.add_argument("-o", "--output", default="excel_report.html", help="Report path")
+    parser.add_argument("--format", choices=REPORT_FORMATS, help="Default: from the output extension")
+    args = parser.parse_args()
+
+    report = build_report(args.inputs, args.output, args.format)
+    print(f"{report['kind'].capitalize()} written to {report['output']} "
+          f"({report['workbooks']} workbooks, {report['failed']} failed)")
@@ -0,0 +1,345 @@
+"""result_index.py
+Persistent (SQLite) index of analyze_xlsx results, keyed by content.
+
+Every indexed workbook gets a fingerprint:
+  - a hash of the whole file: a byte-identical copy anywhere else is
+    answered from the index without being scanned again
+  - a hash per worksheet of its normalized XML (no XML declaration, no
+    whitespace between tags, no uid / revision / dyDescent attributes
+    that change on every save): workbooks sharing most of their sheets
+    are grouped as near-duplicates by similar_groups()
+
+The dashboard metrics of each result (report_generator.summary_row) are
+stored as indexed columns, so "which files have more than 1000 volatile
+formulas" is an index range scan even over hundreds of thousands of rows:
+
+    python result_index.py query index.db --where "total_volatile_formulas>1000" --sort total_formulas
+    python result_index.py duplicates index.db
+    python result_index.py similar index.db --threshold 0.8
+
+Results are also keyed by the analysis options ('stream', 'openpyxl',
+'+formula_graph', '+column_profile') and the scanner version; quick-scan estimates are never
+indexed.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import zipfile
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from report_generator import SUMMARY_TOTALS, summary_row
+from sheet_scanner import SCANNER_VERSION
+from xlsx_package import workbook_sheets
+
+CHUNK_SIZE = 1 << 20
+# metrics stored as columns (and indexed), besides the file size
+METRICS = SUMMARY_TOTALS + ('file_bytes',)
+# result keys that describe one run rather than the workbook
+RUN_KEYS = ('path', 'profile', 'cache', 'index')
+DEFAULT_THRESHOLD = 0.5
+# a sheet hash shared by more workbooks than this (a blank sheet, a
+# standard cover page) does not make them similar
+MAX_SHARED = 1000
+DEFAULT_LIMIT = 50
+
+_WHERE = re.compile(r'^\s*(\w+)\s*(>=|<=|!=|=|>|<)\s*(.+?)\s*$')
+_VOLATILE_ATTRS = re.compile(rb'\s(?:[\w.-]+:)?(?:uid|revisionId|dyDescent)="[^"]*"')
+_XML_DECL = re.compile(rb'^\s*<\?xml[^>]*\?>')
+_BETWEEN_TAGS = re.compile(rb'>\s+(?=<|$)')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path       TEXT    PRIMARY KEY,
+    size       INTEGER NOT NULL,
+    mtime      REAL    NOT NULL,
+    file_hash  TEXT    NOT NULL,
+    indexed_at REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_hash ON files (file_hash);
+CREATE TABLE IF NOT EXISTS results (
+    file_hash  TEXT    NOT NULL,
+    options    TEXT    NOT NULL,
+    version    TEXT    NOT NULL,
+    first_path TEXT    NOT NULL,
+    status     TEXT    NOT NULL,
+    %s,
+    payload    BLOB    NOT NULL,
+    PRIMARY KEY (file_hash, options)
+);
+CREATE TABLE IF NOT EXISTS sheets (
+    file_hash  TEXT    NOT NULL,
+    sheet      TEXT    NOT NULL,
+    hash       TEXT    NOT NULL,
+    PRIMARY KEY (file_hash, sheet)
+);
+CREATE INDEX IF NOT EXISTS sheets_hash ON sheets (hash);
+''' % ',\n    '.join(f'{m} INTEGER' for m in METRICS)
+SCHEMA += ''.join(f'CREATE INDEX IF NOT EXISTS results_{m} ON results (options, {m});\n' for m in METRICS)
+
+
+def options_key(engine: str = 'stream', formula_graph: bool = False, column_profile: bool = False) -> str:
+    """Results only answer runs with the same options: 'stream', 'openpyxl+formula_graph', ..."""
+    return engine + ('+formula_graph' if formula_graph else '') + ('+column_profile' if column_profile else '')
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def normalized_hash(source) -> str:
+    """Hash of a streamed XML part after normalization (see the module docstring)."""
+    h = hashlib.blake2b(digest_size=20)
+    carry = b''
+    first = True
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        data = carry + chunk
+        # every tag before the last '<' is complete
+        cut = data.rfind(b'<') if chunk else len(data)
+        if cut <= 0 and chunk:
+            carry = data
+            continue
+        piece, carry = data[:cut], data[cut:]
+        if first:
+            piece = _XML_DECL.sub(b'', piece, count=1)
+            first = False
+        h.update(_BETWEEN_TAGS.sub(b'>', _VOLATILE_ATTRS.sub(b'', piece)))
+        if not chunk:
+            return h.hexdigest()
+
+
+def sheet_hashes(path: str) -> Dict[str, str]:
+    """{worksheet name: normalized_hash of its part}"""
+    with zipfile.ZipFile(path, 'r') as z:
+        names = set(z.namelist())
+        hashes = {}
+        for sheet in workbook_sheets(z):
+            if sheet['type'] == 'worksheet' and sheet['part'] in names:
+                with z.open(sheet['part']) as f:
+                    hashes[sheet['name']] = normalized_hash(f)
+    return hashes
+
+
+def parse_where(text: str) -> Tuple[str, str, Any]:
+    """'total_formulas>=100' -> ('total_formulas', '>=', 100); only METRICS and status."""
+    match = _WHERE.match(text)
+    if not match:
+        raise ValueError(f'Cannot parse filter {text!r}, expected e.g. total_formulas>1000')
+    field, op, value = match.groups()
+    if field not in METRICS + ('status',):
+        raise ValueError(f'Unknown field {field!r}, expected one of {METRICS + ("status",)}')
+    if field != 'status':
+        value = float(value) if '.' in value else int(value)
+    return field, op, value
+
+
+class ResultIndex:
+    """
+    index = ResultIndex('results.db')
+    hit = index.lookup(path, options)      # stored result or None
+    index.put(path, result, options)
+    index.query([('total_volatile_formulas', '>', 1000)], sort='-total_formulas')
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    # ---- fingerprints ------------------------------------------------
+    def _file_hash(self, path: str, stat: os.stat_result) -> str:
+        # a path indexed before with the same size and mtime is not re-read
+        row = self.conn.execute('SELECT file_hash FROM files WHERE path=? AND size=? AND mtime=?',
+                                (path, stat.st_size, stat.st_mtime)).fetchone()
+        return row[0] if row else file_hash(path)
+
+    def _remember(self, path: str, stat: os.stat_result, digest: str):
+        self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                          (path, stat.st_size, stat.st_mtime, digest, time.time()))
+
+    # ---- results -----------------------------------------------------
+    def lookup(self, path: str, options: str = 'stream') -> Optional[Dict[str, Any]]:
+        """
+        The stored result of a byte-identical workbook, with 'path' set to
+        `path` and result['index'] = {'hit': True, 'file_hash', 'first_path'};
+        None when there is none.
+        """
+        stat = os.stat(path)
+        digest = self._file_hash(path, stat)
+        with self.conn:
+            self._remember(path, stat, digest)
+        row = self.conn.execute(
+            'SELECT first_path, payload FROM results WHERE file_hash=? AND options=? AND version=?',
+            (digest, options, SCANNER_VERSION)).fetchone()
+        if row is None:
+            return None
+        result = json.loads(zlib.decompress(row[1]))
+        result['path'] = path
+        result['index'] = {'hit': True, 'file_hash': digest, 'first_path': row[0]}
+        return result
+
+    def put(self, path: str, result: Dict[str, Any], options: str = 'stream'):
+        """Store `result` (an analyze_xlsx result without 'error') under the file's fingerprint."""
+        stat = os.stat(path)
+        digest = self._file_hash(path, stat)
+        hashes = sheet_hashes(path)
+        stored = {k: v for k, v in result.items() if k not in RUN_KEYS}
+        row = summary_row(result)
+        row['file_bytes'] = stat.st_size
+        with self.conn:
+            self._remember(path, stat, digest)
+            self.conn.execute(
+                f'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, {", ".join("?" * len(METRICS))}, ?)',
+                (digest, options, SCANNER_VERSION, path, row['status'],
+                 *(row.get(m) for m in METRICS), zlib.compress(json.dumps(stored).encode('utf-8'))))
+            self.conn.execute('DELETE FROM sheets WHERE file_hash=?', (digest,))
+            self.conn.executemany('INSERT INTO sheets VALUES (?, ?, ?)',
+                                  [(digest, name, h) for name, h in hashes.items()])
+        result['index'] = {'hit': False, 'file_hash': digest}
+
+    # ---- queries -----------------------------------------------------
+    def query(self, where: Sequence[Tuple[str, str, Any]] = (), sort: str = None,
+              limit: int = DEFAULT_LIMIT, options: str = 'stream') -> List[Dict[str, Any]]:
+        """
+        Indexed paths whose metrics match every (field, op, value) in
+        `where`; `sort` is a metric, '-metric' for descending order.
+        """
+        clauses = ['r.options = ?']
+        params: List[Any] = [options]
+        for field, op, value in where:
+            if field not in METRICS + ('status',) or op not in ('>', '>=', '<', '<=', '=', '!='):
+                raise ValueError(f'Invalid filter {field}{op}{value}')
+            clauses.append(f'r.{field} {op} ?')
+            params.append(value)
+        order = ''
+        if sort:
+            field = sort.lstrip('-')
+            if field not in METRICS:
+                raise ValueError(f'Cannot sort on {field!r}, expected one of {METRICS}')
+            order = f' ORDER BY r.{field} {"DESC" if sort.startswith("-") else "ASC"}'
+        params.append(limit)
+        columns = ('path', 'file_hash', 'status') + METRICS
+        rows = self.conn.execute(
+            f'SELECT f.path, r.file_hash, r.status, {", ".join("r." + m for m in METRICS)} '
+            f'FROM results r JOIN files f ON f.file_hash = r.file_hash '
+            f'WHERE {" AND ".join(clauses)}{order} LIMIT ?', params)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def duplicates(self) -> List[Dict[str, Any]]:
+        """Byte-identical workbooks: [{'file_hash', 'paths'}], largest groups first."""
+        groups = {}
+        for digest, path in self.conn.execute(
+                'SELECT file_hash, path FROM files WHERE file_hash IN '
+                '(SELECT file_hash FROM files GROUP BY file_hash HAVING COUNT(*) > 1) ORDER BY path'):
+            groups.setdefault(digest, []).append(path)
+        return sorted(({'file_hash': d, 'paths': p} for d, p in groups.items()),
+                      key=lambda g: -len(g['paths']))
+
+    def similar_groups(self, threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+        """
+        Near-duplicate workbooks: contents whose sets of sheet hashes have a
+        Jaccard similarity of at least `threshold`, joined transitively.
+        [{'contents': distinct file hashes, 'paths'}], largest groups first.
+        """
+        counts = dict(self.conn.execute('SELECT file_hash, COUNT(DISTINCT hash) FROM sheets GROUP BY file_hash'))
+        parent = {}
+
+        def find(x):
+            while parent.get(x, x) != x:
+                parent[x] = parent.get(parent[x], parent[x])
+                x = parent[x]
+            return x
+
+        pairs = self.conn.execute(
+            'SELECT a.file_hash, b.file_hash, COUNT(DISTINCT a.hash) FROM sheets a '
+            'JOIN sheets b ON a.hash = b.hash AND a.file_hash < b.file_hash '
+            'WHERE a.hash IN (SELECT hash FROM sheets GROUP BY hash HAVING COUNT(*) BETWEEN 2 AND ?) '
+            'GROUP BY a.file_hash, b.file_hash', (MAX_SHARED,))
+        for a, b, shared in pairs:
+            if shared / (counts[a] + counts[b] - shared) >= threshold:
+                parent.setdefault(a, a)
+                parent.setdefault(b, b)
+                parent[find(a)] = find(b)
+
+        groups = {}
+        for digest in parent:
+            groups.setdefault(find(digest), set()).add(digest)
+        out = []
+        for members in groups.values():
+            marks = ','.join('?' * len(members))
+            paths = [p for (p,) in self.conn.execute(
+                f'SELECT path FROM files WHERE file_hash IN ({marks}) ORDER BY path', sorted(members))]
+            out.append({'contents': len(members), 'paths': paths})
+        return sorted(out, key=lambda g: -len(g['paths']))
+
+    def summary(self) -> Dict[str, int]:
+        one = lambda sql: self.conn.execute(sql).fetchone()[0]
+        return {'paths': one('SELECT COUNT(*) FROM files'),
+                'contents': one('SELECT COUNT(DISTINCT file_hash) FROM files'),
+                'results': one('SELECT COUNT(*) FROM results')}
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description='Query the analysis result index')
+    sub = p.add_subparsers(dest='action', required=True)
+    q = sub.add_parser('query', help='Indexed workbooks matching metric filters')
+    q.add_argument('db', help='Index database')
+    q.add_argument('--where', action='append', default=[], metavar='FIELD OP VALUE',
+                   help=f'Filter such as "total_volatile_formulas>1000" (repeatable); fields: {", ".join(METRICS)}')
+    q.add_argument('--sort', help='Metric to sort on (largest first)')
+    q.add_argument('--asc', action='store_true', help='Sort smallest first')
+    q.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help='Rows to return')
+    q.add_argument('--options', default='stream', help='Analysis options key (e.g. stream+formula_graph)')
+    d = sub.add_parser('duplicates', help='Byte-identical workbooks')
+    d.add_argument('db', help='Index database')
+    s = sub.add_parser('similar', help='Near-duplicate workbooks (shared sheets)')
+    s.add_argument('db', help='Index database')
+    s.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                   help='Minimum Jaccard similarity of the sheet sets')
+    t = sub.add_parser('stats', help='Number of indexed paths, contents and results')
+    t.add_argument('db', help='Index database')
+    args = p.parse_args(argv)
+
+    with ResultIndex(args.db) as index:
+        if args.action == 'query':
+            try:
+                where = [parse_where(w) for w in args.where]
+            except ValueError as e:
+                p.error(str(e))
+            sort = args.sort and (args.sort if args.asc else '-' + args.sort)
+            report = index.query(where, sort, args.limit, args.options)
+        elif args.action == 'duplicates':
+            report = index.duplicates()
+        elif args.action == 'similar':
+            report = index.similar_groups(args.threshold)
+        else:
+            report = index.summary()
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,330 @@
+"""rule_consolidation.py
+Merge conditional formatting and data validation rules that differ only
+by the range they apply to.
+
+Copying cells around splits one rule into many: the same rule, with its
+formula shifted, on hundreds of small ranges, which Excel re-evaluates on
+every scroll. Each worksheet is rewritten as a stream; its top-level
+<conditionalFormatting> blocks and <dataValidations> are collected
+(sheet_scanner.RuleCollector) and written back with every group of equal
+rules (sheet_scanner.rule_key) as one rule over the union of their ranges:
+  - ranges are unioned with merge_areas(), which coalesces rectangles
+    along rows and columns until nothing changes, in O(n log n) per pass
+  - formulas are rebased onto the first cell of the merged range
+  - a merged conditional format keeps the best (lowest) priority of its
+    group; blocks holding several rules are split into one block per rule
+  - a rule only joins a group if no other rule overlapping it has a
+    priority between the group's and its own: moving it up past that rule
+    (a stopIfTrue rule, or one setting the same format) would change what
+    its cells show. Such rules form groups of their own. Only top-level
+    rules are weighed: x14 blocks come after them in the sheet
+Conditional formats evaluated over their whole range (color scales, data
+bars, icon sets, top / bottom, above average, duplicate / unique) and
+pivot table formats keep their own ranges, as do x14 extension blocks.
+The before / after counts are those of the analyzer (x14 blocks included,
+ranges counted per block).
+"""
+import zipfile
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from sheet_scanner import (FORMULA_TAGS, RULE_BLOCKS, RuleCollector, absolute_formula,
+                           format_sqref, relative_formula, rule_key)
+from xlsx_package import rewrite_package, workbook_sheets
+from xml_rewrite import XmlRewriter, escape_text, local
+
+# conditional formats that are decided cell by cell, so their ranges can be joined
+PER_CELL_CF_TYPES = {
+    'expression', 'cellIs', 'containsText', 'notContainsText', 'beginsWith', 'endsWith',
+    'containsBlanks', 'notContainsBlanks', 'containsErrors', 'notContainsErrors', 'timePeriod',
+}
+
+Area = Tuple[int, int, int, int]
+
+
+def _coalesce(areas: Set[Area], along_rows: bool) -> Set[Area]:
+    """Join areas sharing the same column span (or row span) that touch or overlap."""
+    groups = defaultdict(list)
+    for r1, c1, r2, c2 in areas:
+        if along_rows:
+            groups[(c1, c2)].append((r1, r2))
+        else:
+            groups[(r1, r2)].append((c1, c2))
+    merged = set()
+    for (a, b), spans in groups.items():
+        spans.sort()
+        lo, hi = spans[0]
+        for start, stop in spans[1:]:
+            if start <= hi + 1:
+                hi = max(hi, stop)
+                continue
+            merged.add((lo, a, hi, b) if along_rows else (a, lo, b, hi))
+            lo, hi = start, stop
+        merged.add((lo, a, hi, b) if along_rows else (a, lo, b, hi))
+    return merged
+
+
+def merge_areas(areas: Iterable[Area]) -> List[Area]:
+    """
+    Rectangles covering exactly the cells of `areas`, adjacent and
+    overlapping ones joined; sorted by top-left cell.
+    """
+    merged = set(areas)
+    while True:
+        count = len(merged)
+        merged = _coalesce(_coalesce(merged, True), False)
+        if len(merged) == count:
+            return sorted(merged)
+
+
+def _overlapping(rules: List[Dict[str, Any]]) -> List[Set[int]]:
+    """For each rule, the indices of the other rules sharing a cell with it (row sweep)."""
+    neighbours = [set() for _ in rules]
+    events = sorted((area, i) for i, rule in enumerate(rules) for area in rule['areas'])
+    active = []   # (area, rule index) whose rows reach the current area
+    for area, i in events:
+        r1, c1, _, c2 = area
+        active = [(a, j) for a, j in active if a[2] >= r1]
+        for (_, d1, _, d2), j in active:
+            if j != i and d1 <= c2 and c1 <= d2:
+                neighbours[i].add(j)
+                neighbours[j].add(i)
+        active.append((area, i))
+    return neighbours
+
+
+def _priority(rule: Dict[str, Any]) -> int:
+    try:
+        return int(rule['attrs'].get('priority'))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _mergeable(rule: Dict[str, Any]) -> bool:
+    if rule['kind'] == 'dv':
+        return True
+    return rule['attrs'].get('type') in PER_CELL_CF_TYPES and 'pivot' not in rule['block'][1]
+
+
+class _RuleRewriter(XmlRewriter):
+    """Collects the sheet's top-level rules and writes them back merged."""
+
+    def __init__(self, out, stats: Dict[str, int]):
+        super().__init__(out)
+        self.stats = stats
+        self.cf_rules = []
+        self.dv_rules = []
+        # one collector for the whole sheet, as in sheet_scanner, so x14
+        # blocks linked to a top-level rule are not counted twice
+        self.rules = RuleCollector(self._add_rule)
+        self.in_block = False
+        self.top = False          # the open block is written back (not x14)
+        self.block_areas = None   # rules.areas when the open block started
+        self.extension = {'cf_rules': 0, 'cf_ranges': 0, 'dv': 0, 'dv_ranges': 0}
+        self.validations = None   # (name, attrs) of <dataValidations>
+
+    def _open_block(self, name, attrs, top: bool):
+        self.in_block = True
+        self.top = top
+        self.block_areas = dict(self.rules.areas)
+        self.rules.start(name, attrs)
+
+    def _add_rule(self, rule: Dict[str, Any]):
+        if self.top:
+            (self.cf_rules if rule['kind'] == 'cf' else self.dv_rules).append(rule)
+        else:
+            self.extension['cf_rules' if rule['kind'] == 'cf' else 'dv'] += 1
+
+    def start(self, name, attrs):
+        tag = local(name)
+        if self.in_block:
+            self.rules.start(name, attrs)
+        elif len(self.path) == 1:
+            if tag != 'conditionalFormatting':
+                self._write_conditional_formats()
+            if tag == 'conditionalFormatting':
+                self._open_block(name, attrs, True)
+                self.begin_capture()
+            elif tag == 'dataValidations':
+                self.validations = (name, attrs)
+                self.begin_capture()
+        elif tag in RULE_BLOCKS:
+            # a top-level validation, or an x14 block (kept as is, counted)
+            self._open_block(name, attrs, self.validations is not None)
+        return attrs
+
+    def text(self, data):
+        if self.in_block:
+            self.rules.characters(data)
+        return data
+
+    def end(self, name):
+        if self.in_block:
+            self.rules.end(name)
+        elif len(self.path) == 1:
+            self._write_conditional_formats()  # they were the last part of the sheet
+            for field, count in self.extension.items():
+                self.stats[field + '_before'] += count
+                self.stats[field + '_after'] += count
+
+    def closed(self, name):
+        # self.path still ends with the element that was just closed
+        if self.in_block and not self.rules.depth:
+            self.in_block = False
+            if not self.top:
+                for kind in ('cf', 'dv'):
+                    self.extension[kind + '_ranges'] += self.rules.areas[kind] - self.block_areas[kind]
+            elif len(self.path) == 2:
+                self.end_capture()  # written back later, merged
+        elif self.validations is not None and len(self.path) == 2:
+            self.end_capture()
+            self._write_validations()
+
+    # ---- output ------------------------------------------------------
+    @staticmethod
+    def _groups(rules: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        groups = {}
+        for i, rule in enumerate(rules):
+            key = rule_key(rule) if _mergeable(rule) else None
+            groups.setdefault(key if key is not None else ('single', i), []).append(rule)
+        return list(groups.values())
+
+    @staticmethod
+    def _priority_groups(rules: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """
+        _groups() for conditional formats, each split so that merging does
+        not lift a rule past another one on its cells. Every group is in
+        priority order (its first rule has the best priority).
+        """
+        neighbours = _overlapping(rules)
+        index = {id(rule): i for i, rule in enumerate(rules)}
+        split = []
+        for group in _RuleRewriter._groups(rules):
+            group = sorted(group, key=_priority)
+            members = {index[id(rule)] for rule in group}
+            parts = []
+            for rule in group:
+                # the unrelated rules on its cells ranked above it: it can
+                # only join a part starting below the last of them
+                own = _priority(rule)
+                barrier = max((_priority(rules[j]) for j in neighbours[index[id(rule)]] - members
+                               if _priority(rules[j]) < own), default=None)
+                for part in parts:
+                    if barrier is None or _priority(part[0]) > barrier:
+                        part.append(rule)
+                        break
+                else:
+                    parts.append([rule])
+            split.extend(parts)
+        return split
+
+    def _merged(self, group: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], List[Area]]]:
+        """[(rule, areas)] to write for one group: one merged rule if possible."""
+        first = group[0]
+        if len(group) > 1:
+            areas = merge_areas(a for rule in group for a in rule['areas'])
+            try:
+                events = self._rebased(first, areas[0][:2])
+            except ValueError:
+                pass  # a reference would leave the sheet: keep the rules apart
+            else:
+                return [(dict(first, events=events), areas)]
+        return [(rule, rule['areas']) for rule in group]
+
+    @staticmethod
+    def _rebased(rule: Dict[str, Any], anchor: Tuple[int, int]) -> List[Tuple]:
+        row, col = rule['areas'][0][:2]
+        events = []
+        tag = None
+        for event in rule['events']:
+            if event[0] == 's':
+                tag = local(event[1])
+            elif event[0] == 'e':
+                tag = None
+            elif tag in FORMULA_TAGS:
+                event = ('t', absolute_formula(relative_formula(event[1], row, col), *anchor))
+            events.append(event)
+        return events
+
+    def _write_rule(self, name: str, attrs: Dict[str, str], events: List[Tuple]):
+        self.write_start(name, attrs)
+        for event in events:
+            if event[0] == 's':
+                self.write_start(event[1], event[2])
+            elif event[0] == 't':
+                self.write(escape_text(event[1]))
+            else:
+                self.write_end(event[1])
+        self.write_end(name)
+
+    def _write_conditional_formats(self):
+        if not self.cf_rules:
+            return
+        rules, self.cf_rules = self.cf_rules, []
+        self.stats['cf_rules_before'] += len(rules)
+        self.stats['cf_ranges_before'] += self.rules.areas['cf'] - self.extension['cf_ranges']
+        for group in self._priority_groups(rules):
+            # the first rule of a group has its best priority
+            for rule, areas in self._merged(group):
+                block_name, block_attrs = rule['block']
+                self.write_start(block_name, dict(block_attrs, sqref=format_sqref(areas)))
+                self._write_rule(rule['name'], rule['attrs'], rule['events'])
+                self.write_end(block_name)
+                self.stats['cf_rules_after'] += 1
+                self.stats['cf_ranges_after'] += len(areas)
+
+    def _write_validations(self):
+        name, attrs = self.validations
+        rules, self.dv_rules, self.validations = self.dv_rules, [], None
+        written = [merged for group in self._groups(rules) for merged in self._merged(group)]
+        self.stats['dv_before'] += len(rules)
+        self.stats['dv_ranges_before'] += sum(len(r['areas']) for r in rules)
+        self.stats['dv_after'] += len(written)
+        self.stats['dv_ranges_after'] += sum(len(areas) for _, areas in written)
+        attrs = dict(attrs)
+        if 'count' in attrs:
+            attrs['count'] = str(len(written))
+        self.write_start(name, attrs)
+        for rule, areas in written:
+            self._write_rule(rule['name'], dict(rule['attrs'], sqref=format_sqref(areas)), rule['events'])
+        self.write_end(name)
+
+
+def consolidate_rules(input_file: str, output_file: str = None) -> Dict[str, Any]:
+    """
+    Write a copy of `input_file` with duplicate conditional formatting and
+    data validation rules merged. `output_file` may equal `input_file`.
+
+    Returns {'output', 'sheets': {name: {'cf_rules_before', 'cf_rules_after',
+             'cf_ranges_before', 'cf_ranges_after', 'dv_before', 'dv_after',
+             'dv_ranges_before', 'dv_ranges_after'}}, 'bytes_before', 'bytes_after'}
+    """
+    if output_file is None:
+        output_file = input_file.replace(".xlsx", "_RULES_CONSOLIDATED.xlsx")
+
+    with zipfile.ZipFile(input_file, 'r') as z:
+        names = set(z.namelist())
+        sheets = [s for s in workbook_sheets(z) if s['type'] == 'worksheet' and s['part'] in names]
+
+    report = {'output': output_file, 'sheets': {}}
+    rewriters = {}
+    for sheet in sheets:
+        stats = dict.fromkeys(('cf_rules_before', 'cf_rules_after', 'cf_ranges_before', 'cf_ranges_after',
+                               'dv_before', 'dv_after', 'dv_ranges_before', 'dv_ranges_after'), 0)
+        report['sheets'][sheet['name']] = stats
+        rewriters[sheet['part']] = lambda src, dst, stats=stats: _RuleRewriter(dst, stats).rewrite(src)
+
+    report.update(rewrite_package(input_file, output_file, rewriters))
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Merge conditional formats / data validations that differ only by range")
+    parser.add_argument("input_file", help="Path to the Excel file")
+    parser.add_argument("-o", "--output", help="Optional output file path")
+    args = parser.parse_args()
+
+    print(json.dumps(consolidate_rules(args.input_file, args.output), indent=2))
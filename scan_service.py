@@ -0,0 +1,333 @@
+"""scan_service.py
+Long-running local scan service: a warm process pool behind a small JSON
+HTTP endpoint on localhost (or a Unix socket), so scans skip the import
+cost of starting `main.py` for every file.
+
+    python scan_service.py --port 8765 --workers 4
+    curl -X POST localhost:8765/jobs -d '{"kind": "analyze", "path": "D:/book.xlsx"}'
+    curl localhost:8765/jobs/1
+
+Endpoints (JSON in, JSON out):
+    POST   /jobs        {kind, path, options} -> 202 {job}; 503 when the queue is full
+    GET    /jobs        all known jobs, without results
+    GET    /jobs/<id>   one job; 'result' once it is done
+    DELETE /jobs/<id>   cancel a job that has not started yet
+    GET    /health      workers, queued / running counts
+
+Jobs wait in a bounded asyncio queue; when it is full new submissions are
+refused with 503 + Retry-After instead of piling up in memory. One
+dispatcher task per worker moves jobs from the queue into the pool, whose
+processes import openpyxl and the job modules once at start.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE_SIZE = 64
+# finished jobs kept for GET /jobs/<id>; the oldest are forgotten first
+DEFAULT_KEEP = 1000
+MAX_BODY = 1 << 20
+RETRY_AFTER = 1
+
+
+class JobKind(NamedTuple):
+    module: str
+    function: str
+    options: Tuple[str, ...]   # keyword arguments a client may pass
+
+
+JOB_KINDS: Dict[str, JobKind] = {
+    'check': JobKind('basic_corruption_checker', 'check_excel_integrity', ('level',)),
+    'analyze': JobKind('analyzer', 'analyze_xlsx',
+                       ('engine', 'cache_path', 'formula_graph', 'time_budget', 'cell_budget',
+                        'index_path', 'column_profile')),
+    'cleanup': JobKind('cleanup_styles', 'cleanup_excel_file', ('output_file',)),
+    'cleanup-styles': JobKind('cleanup_styles', 'cleanup_styles_file', ('output_file',)),
+    'consolidate-styles': JobKind('style_consolidation', 'consolidate_styles', ('output_file',)),
+    'consolidate-rules': JobKind('rule_consolidation', 'consolidate_rules', ('output_file',)),
+    'trim-used-range': JobKind('used_range', 'trim_used_range', ('output_file',)),
+    'compact-strings': JobKind('shared_strings', 'compact_shared_strings', ('output_file',)),
+    'strip-pivot-records': JobKind('pivot_caches', 'strip_pivot_records', ('output_file',)),
+    'repack': JobKind('repack', 'repack_package', ('output_file', 'level', 'workers', 'dedupe_media')),
+}
+FINISHED = ('done', 'error', 'cancelled')
+
+
+# ---- worker processes ------------------------------------------------
+def _warm_worker():
+    """Pool initializer: pay the imports once per process, not per job."""
+    import openpyxl  # noqa: F401  (the cleanups load workbooks with it)
+    for kind in JOB_KINDS.values():
+        importlib.import_module(kind.module)
+
+
+def _ready() -> int:
+    return os.getpid()
+
+
+def run_job(kind: str, path: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Executed in a worker process; cleanups that return a path give {'output': path}."""
+    spec = JOB_KINDS[kind]
+    outcome = getattr(importlib.import_module(spec.module), spec.function)(path, **options)
+    return outcome if isinstance(outcome, dict) else {'output': outcome}
+
+
+# ---- service ---------------------------------------------------------
+class HttpError(Exception):
+    def __init__(self, status: int, message: str, headers: Dict[str, str] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+_REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+            405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+            500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class ScanService:
+    """
+    Job table, bounded queue and process pool. start() binds the socket
+    and the dispatchers; the HTTP side only touches the job table and the
+    queue, so it stays responsive while every worker is busy.
+    """
+
+    def __init__(self, workers: int = None, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 keep: int = DEFAULT_KEEP):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.queue_size = queue_size
+        self.keep = keep
+        self.jobs: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self.queue: Optional[asyncio.Queue] = None
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.server = None
+        self._dispatchers = []
+        self._next_id = 1
+
+    # -- lifecycle -----------------------------------------------------
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix_path: str = None):
+        self.queue = asyncio.Queue(self.queue_size)
+        self.pool = self._new_pool()
+        await self._warm_up(self.pool)
+        if unix_path:
+            self.server = await asyncio.start_unix_server(self._handle, path=unix_path)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port)
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def address(self) -> str:
+        sock = self.server.sockets[0].getsockname()
+        return sock if isinstance(sock, str) else f'http://{sock[0]}:{sock[1]}'
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # forked workers would inherit the listening and client sockets and
+        # keep connections open after the service closes them
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else None)
+        return ProcessPoolExecutor(self.workers, mp_context=context, initializer=_warm_worker)
+
+    async def _warm_up(self, pool: ProcessPoolExecutor):
+        """Start every worker now rather than on the first jobs."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(pool, _ready) for _ in range(self.workers)))
+
+    # -- jobs ----------------------------------------------------------
+    def submit(self, kind: str, path: str, options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Validate and queue a job; HttpError(503) when the queue is full."""
+        spec = JOB_KINDS.get(kind)
+        if spec is None:
+            raise HttpError(400, f'Unknown job kind {kind!r}, expected one of {sorted(JOB_KINDS)}')
+        if not isinstance(path, str) or not os.path.isfile(path):
+            raise HttpError(400, f'File not found: {path!r}')
+        options = options or {}
+        if not isinstance(options, dict):
+            raise HttpError(400, 'options must be an object')
+        unknown = sorted(set(options) - set(spec.options))
+        if unknown:
+            raise HttpError(400, f'Unsupported options for {kind}: {unknown}')
+        if self.queue.full():
+            raise HttpError(503, f'Queue full ({self.queue_size} jobs waiting)',
+                            {'Retry-After': str(RETRY_AFTER)})
+
+        job = {'id': str(self._next_id), 'kind': kind, 'path': os.path.abspath(path),
+               'options': options, 'status': 'queued', 'submitted': time.time(),
+               'started': None, 'finished': None}
+        self._next_id += 1
+        self.jobs[job['id']] = job
+        self.queue.put_nowait(job['id'])
+        return job
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        job = self._job(job_id)
+        if job['status'] != 'queued':
+            raise HttpError(409, f"Job {job_id} is {job['status']}")
+        self._finish(job, 'cancelled')
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {'queued': 0, 'running': 0}
+        for job in self.jobs.values():
+            if job['status'] in counts:
+                counts[job['status']] += 1
+        return {'workers': self.workers, 'queue_size': self.queue_size, **counts}
+
+    def _job(self, job_id: str) -> Dict[str, Any]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HttpError(404, f'No job {job_id}')
+        return job
+
+    def _finish(self, job: Dict[str, Any], status: str, **fields):
+        job.update(fields, status=status, finished=time.time())
+        finished = [j for j in self.jobs.values() if j['status'] in FINISHED]
+        for old in finished[:max(len(finished) - self.keep, 0)]:
+            del self.jobs[old['id']]
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id = await self.queue.get()
+            job = self.jobs.get(job_id)
+            if job is None or job['status'] != 'queued':
+                continue  # cancelled while waiting
+            job.update(status='running', started=time.time())
+            pool = self.pool
+            try:
+                result = await loop.run_in_executor(pool, run_job, job['kind'], job['path'], job['options'])
+            except BrokenProcessPool:
+                # a worker died (crash, out of memory): fail the job, start a fresh pool
+                if self.pool is pool:
+                    self.pool = self._new_pool()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                self._finish(job, 'error', error='worker process died')
+            except Exception as e:
+                self._finish(job, 'error', error=str(e))
+            else:
+                status = 'error' if isinstance(result, dict) and 'error' in result else 'done'
+                self._finish(job, status, result=result)
+
+    # -- HTTP ----------------------------------------------------------
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        headers = {}
+        try:
+            method, target, body = await self._read_request(reader)
+            status, payload = self._route(method, target, body)
+        except HttpError as e:
+            status, payload, headers = e.status, {'error': str(e)}, e.headers
+        except Exception as e:
+            status, payload = 500, {'error': str(e)}
+        data = json.dumps(payload, default=str).encode('utf-8')
+        head = [f'HTTP/1.1 {status} {_REASONS.get(status, "")}',
+                'Content-Type: application/json',
+                f'Content-Length: {len(data)}',
+                'Connection: close']
+        head += [f'{name}: {value}' for name, value in headers.items()]
+        try:
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, Any]:
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            length = 0
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+        except ValueError:
+            raise HttpError(400, 'Malformed request')
+        if len(request_line) < 2:
+            raise HttpError(400, 'Malformed request line')
+        if length > MAX_BODY:
+            raise HttpError(413, f'Request body over {MAX_BODY} bytes')
+        body = None
+        if length:
+            try:
+                body = json.loads(await reader.readexactly(length))
+            except (ValueError, asyncio.IncompleteReadError):
+                raise HttpError(400, 'Request body is not JSON')
+        return request_line[0].upper(), request_line[1], body
+
+    def _route(self, method: str, target: str, body: Any) -> Tuple[int, Any]:
+        parts = [p for p in target.split('?', 1)[0].split('/') if p]
+        if parts == ['health'] and method == 'GET':
+            return 200, self.stats()
+        if parts == ['jobs']:
+            if method == 'GET':
+                return 200, [{k: v for k, v in job.items() if k != 'result'} for job in self.jobs.values()]
+            if method == 'POST':
+                if not isinstance(body, dict):
+                    raise HttpError(400, 'Expected a JSON object {kind, path, options}')
+                return 202, self.submit(body.get('kind'), body.get('path'), body.get('options'))
+            raise HttpError(405, f'{method} not allowed on /jobs')
+        if len(parts) == 2 and parts[0] == 'jobs':
+            if method == 'GET':
+                return 200, self._job(parts[1])
+            if method == 'DELETE':
+                return 200, self.cancel(parts[1])
+            raise HttpError(405, f'{method} not allowed on /jobs/<id>')
+        raise HttpError(404, f'No route {target}')
+
+
+async def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix_path: str = None,
+                workers: int = None, queue_size: int = DEFAULT_QUEUE_SIZE):
+    """Run the service until cancelled (Ctrl+C)."""
+    service = ScanService(workers, queue_size)
+    server = await service.start(host, port, unix_path)
+    print(f"Scan service listening on {service.address()} "
+          f"({service.workers} workers, queue {queue_size})", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description='Local scan service with a warm worker pool')
+    p.add_argument('--host', default=DEFAULT_HOST, help='Interface to bind (default: localhost only)')
+    p.add_argument('--port', type=int, default=DEFAULT_PORT, help='TCP port (0 picks a free one)')
+    p.add_argument('--unix', help='Listen on this Unix socket path instead of TCP')
+    p.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    p.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                   help='Jobs that may wait; further submissions get 503')
+    args = p.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.queue_size))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
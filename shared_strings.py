@@ -0,0 +1,413 @@
+"""shared_strings.py
+Shared strings table (xl/sharedStrings.xml) analysis and compaction.
+
+Exports often carry an sst that dwarfs the sheets: entries no cell points
+at any more, the same text stored many times, rich-text runs repeating
+the same font markup. The table is streamed through expat once; each <si>
+is reduced to a 128-bit digest of its markup and a few counters, so only
+the digests are kept (in DigestTable's flat arrays), never the strings.
+
+Which entries are used comes from the sheet scanner: every t="s" cell
+sets a bit in a per-sheet bitmap (sheet_scanner.pack_bitmap).
+
+compact_shared_strings() drops unreferenced entries, merges identical
+ones and remaps the <v> indices of the string cells; the sst and the
+worksheet parts are rewritten as streams, everything else is copied.
+"""
+import hashlib
+import heapq
+import zipfile
+from array import array
+from typing import Any, Callable, Dict, IO, Optional, Tuple
+from xml.parsers import expat
+
+from sheet_scanner import bit_is_set, merge_bitmaps, scan_worksheet
+from xlsx_package import SHARED_STRINGS_REL, rewrite_package, workbook_related_part, workbook_sheets
+from xml_rewrite import XmlRewriter, local
+
+DEFAULT_SST_PART = 'xl/sharedStrings.xml'
+CHUNK_SIZE = 1 << 16
+TOP_STRINGS = 10
+PREVIEW_CHARS = 60
+
+
+def sst_part(z: zipfile.ZipFile) -> Optional[str]:
+    """Zip member of the shared strings table, or None when there is none."""
+    part = workbook_related_part(z, SHARED_STRINGS_REL, DEFAULT_SST_PART)
+    return part if part in z.NameToInfo else None
+
+
+class DigestTable:
+    """
+    Open-addressing hash map from 128-bit digests to ints, stored in three
+    flat arrays (24 bytes a slot, at most half full): a few dozen bytes per
+    distinct string instead of the string itself or a dict of Python ints.
+    """
+
+    def __init__(self, expected: int = 0):
+        size = 16
+        while size < 2 * expected:
+            size <<= 1
+        self._alloc(size)
+        self.count = 0
+
+    def _alloc(self, size: int):
+        self.mask = size - 1
+        self.lo = array('Q', bytes(8 * size))
+        self.hi = array('Q', bytes(8 * size))
+        self.values = array('q', bytes(8 * size))
+
+    def setdefault(self, digest: bytes, value: int) -> int:
+        """The value stored for `digest`; stores `value` first if absent."""
+        lo = int.from_bytes(digest[:8], 'little') or 1  # 0 marks an empty slot
+        hi = int.from_bytes(digest[8:16], 'little')
+        slot = self._find(lo, hi)
+        if self.lo[slot]:
+            return self.values[slot]
+        self.lo[slot] = lo
+        self.hi[slot] = hi
+        self.values[slot] = value
+        self.count += 1
+        if 2 * self.count > self.mask + 1:
+            self._grow()
+        return value
+
+    def _find(self, lo: int, hi: int) -> int:
+        keys_lo, keys_hi, mask = self.lo, self.hi, self.mask
+        slot = lo & mask
+        while keys_lo[slot] and (keys_lo[slot] != lo or keys_hi[slot] != hi):
+            slot = (slot + 1) & mask
+        return slot
+
+    def _grow(self):
+        old = (self.lo, self.hi, self.values)
+        self._alloc(2 * (self.mask + 1))
+        for lo, hi, value in zip(*old):
+            if lo:
+                slot = self._find(lo, hi)
+                self.lo[slot] = lo
+                self.hi[slot] = hi
+                self.values[slot] = value
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class SstScanner:
+    """
+    SAX handler over the sst. After each </si> it calls on_entry(self)
+    with these attributes describing that entry:
+      index, digest (16 bytes), nbytes (markup size), text, runs (<r>),
+      phonetic (<rPh>)
+    """
+
+    def __init__(self, on_entry: Callable[['SstScanner'], None]):
+        self.on_entry = on_entry
+        self.count = None         # <sst count>: cells referencing the table
+        self.unique_count = None  # <sst uniqueCount>
+        self.entries = 0
+        self.index = -1
+        self.digest = b''
+        self.nbytes = 0
+        self.text = ''
+        self.runs = 0
+        self.phonetic = 0
+        self._parser = None
+        self._in_si = False
+        self._in_text = 0
+        self._in_phonetic = 0
+        self._start_byte = 0
+        self._pieces = []
+        self._text = []
+
+    def start(self, name: str, attrs: Dict[str, str]):
+        tag = local(name)
+        if self._in_si:
+            self._pieces.append('\x02' + tag + repr(sorted(attrs.items())))
+            if tag == 't':
+                self._in_text += 1
+            elif tag == 'r':
+                self.runs += 1
+            elif tag == 'rPh':
+                self.phonetic += 1
+                self._in_phonetic += 1
+        elif tag == 'si':
+            self._in_si = True
+            self._start_byte = self._parser.CurrentByteIndex
+            self._pieces = []
+            self._text = []
+            self.runs = 0
+            self.phonetic = 0
+        elif tag == 'sst':
+            self.count = _int_attr(attrs, 'count')
+            self.unique_count = _int_attr(attrs, 'uniqueCount')
+
+    def end(self, name: str):
+        if not self._in_si:
+            return
+        tag = local(name)
+        if tag != 'si':
+            self._pieces.append('\x03' + tag)
+            if tag == 't':
+                self._in_text -= 1
+            elif tag == 'rPh':
+                self._in_phonetic -= 1
+            return
+        self._in_si = False
+        self.index = self.entries
+        self.entries += 1
+        self.nbytes = self._parser.CurrentByteIndex - self._start_byte + len(name) + 3
+        self.text = ''.join(self._text)
+        self.digest = hashlib.blake2b(''.join(self._pieces).encode('utf-8'), digest_size=16).digest()
+        self.on_entry(self)
+
+    def characters(self, data: str):
+        if self._in_text:
+            # raw: expat may split one text node, and the \x02/\x03 markers
+            # cannot occur in XML text
+            self._pieces.append(data)
+            if not self._in_phonetic:
+                self._text.append(data)
+
+    def parse(self, source: IO[bytes]):
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.characters
+        self._parser = parser
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.Parse(chunk, False)
+        parser.Parse(b'', True)
+        self._parser = None
+
+
+def _int_attr(attrs: Dict[str, str], name: str) -> Optional[int]:
+    try:
+        return int(attrs[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def string_references(z: zipfile.ZipFile, sheet_parts) -> Tuple[bytes, int]:
+    """(bitmap of referenced sst indices, number of t="s" cells) over `sheet_parts`."""
+    packed = []
+    string_cells = 0
+    for part in sheet_parts:
+        with z.open(part) as f:
+            counters = scan_worksheet(f)[1]
+        packed.append(counters['strings'])
+        string_cells += counters['string_cells']
+    return merge_bitmaps(packed), string_cells
+
+
+def analyze_shared_strings(z: zipfile.ZipFile, referenced: Optional[bytes] = None,
+                           string_cells: int = None, top: int = TOP_STRINGS) -> Optional[Dict[str, Any]]:
+    """
+    Summarise the shared strings table, or None when the package has none.
+
+    `referenced` is the merged bitmap of indices used by t="s" cells
+    (sheet_scanner.merge_bitmaps); without it the unreferenced counts are
+    left out. `string_cells` is the number of such cells, i.e. what the
+    declared `count` should be.
+    """
+    part = sst_part(z)
+    if part is None:
+        return None
+    info = z.getinfo(part)
+
+    stats = {'text_bytes': 0, 'markup_bytes': 0, 'rich_text_entries': 0, 'rich_text_runs': 0,
+             'phonetic_entries': 0, 'duplicate_entries': 0, 'duplicate_bytes': 0,
+             'referenced_entries': 0, 'unreferenced_entries': 0, 'unreferenced_bytes': 0}
+    largest = []
+    seen = DigestTable()
+
+    def on_entry(e: SstScanner):
+        stats['text_bytes'] += len(e.text.encode('utf-8'))
+        stats['markup_bytes'] += e.nbytes
+        if e.runs:
+            stats['rich_text_entries'] += 1
+            stats['rich_text_runs'] += e.runs
+        if e.phonetic:
+            stats['phonetic_entries'] += 1
+        if seen.setdefault(e.digest, e.index) != e.index:
+            stats['duplicate_entries'] += 1
+            stats['duplicate_bytes'] += e.nbytes
+        if referenced is not None:
+            if bit_is_set(referenced, e.index):
+                stats['referenced_entries'] += 1
+            else:
+                stats['unreferenced_entries'] += 1
+                stats['unreferenced_bytes'] += e.nbytes
+        entry = (e.nbytes, -e.index)
+        if len(largest) < top:
+            heapq.heappush(largest, entry + (e.runs, e.text[:PREVIEW_CHARS]))
+        elif entry > largest[0][:2]:
+            heapq.heapreplace(largest, entry + (e.runs, e.text[:PREVIEW_CHARS]))
+
+    scanner = SstScanner(on_entry)
+    with z.open(part) as f:
+        scanner.parse(f)
+
+    result = {
+        'part': part,
+        'bytes': info.file_size,
+        'compressed_bytes': info.compress_size,
+        'count': scanner.count,
+        'unique_count': scanner.unique_count,
+        'entries': scanner.entries,
+        'distinct_entries': len(seen),
+    }
+    result.update(stats)
+    if referenced is None:
+        for key in ('referenced_entries', 'unreferenced_entries', 'unreferenced_bytes'):
+            del result[key]
+    else:
+        beyond = int.from_bytes(referenced, 'little') >> scanner.entries
+        result['dangling_indices'] = bin(beyond).count('1')
+    if string_cells is not None:
+        result['string_cells'] = string_cells
+    result['largest'] = [{'index': -neg_index, 'bytes': nbytes, 'runs': runs, 'preview': preview}
+                         for nbytes, neg_index, runs, preview in sorted(largest, reverse=True)]
+    return result
+
+
+class _SstRewriter(XmlRewriter):
+    def __init__(self, out: IO[bytes], keep: bytearray, kept: int, string_cells: int):
+        super().__init__(out)
+        self.keep = keep
+        self.kept = kept
+        self.string_cells = string_cells
+        self.index = 0
+
+    def start(self, name, attrs):
+        tag = local(name)
+        if tag == 'sst':
+            attrs['count'] = str(self.string_cells)
+            attrs['uniqueCount'] = str(self.kept)
+        elif tag == 'si' and self.path == ['sst']:
+            i = self.index
+            self.index += 1
+            if not self.keep[i]:
+                return None
+        return attrs
+
+
+class _SheetStringRewriter(XmlRewriter):
+    def __init__(self, out: IO[bytes], remap: array, kept: int):
+        super().__init__(out)
+        self.remap = remap
+        self.kept = kept
+        self.string_cell = False
+        self.value = None  # text of the <v> being remapped
+
+    def start(self, name, attrs):
+        tag = local(name)
+        if tag == 'c':
+            self.string_cell = attrs.get('t') == 's'
+        elif tag == 'v' and self.string_cell:
+            self.value = []
+        return attrs
+
+    def text(self, data):
+        if self.value is None:
+            return data
+        self.value.append(data)
+        return None
+
+    def end(self, name):
+        if self.value is None or local(name) != 'v':
+            return
+        text = ''.join(self.value)
+        self.value = None
+        try:
+            i = int(text)
+        except ValueError:
+            self.write(text)
+            return
+        if 0 <= i < len(self.remap):
+            text = str(self.remap[i])
+        elif i >= len(self.remap):
+            # already pointed past the table: keep it pointing past the new one
+            text = str(self.kept + i - len(self.remap))
+        self.write(text)
+
+
+def compact_shared_strings(input_file: str, output_file: str = None) -> Dict[str, Any]:
+    """
+    Write a copy of `input_file` whose sst only holds referenced entries,
+    each distinct entry once. `output_file` may equal `input_file`.
+
+    Returns {'output', 'part', 'entries_before', 'entries_after',
+             'unreferenced_removed', 'duplicates_merged', 'bytes_before', 'bytes_after'}
+    """
+    if output_file is None:
+        output_file = input_file.replace(".xlsx", "_STRINGS_COMPACTED.xlsx")
+
+    remap = array('q')       # old index -> new index (-1: dropped)
+    keep = bytearray()       # 1 for the entries written to the new sst
+    counts = {'kept': 0, 'unreferenced': 0, 'duplicates': 0}
+    seen = DigestTable()
+    string_cells = 0
+
+    with zipfile.ZipFile(input_file, 'r') as z:
+        names = set(z.namelist())
+        part = sst_part(z)
+        sheet_parts = [s['part'] for s in workbook_sheets(z)
+                       if s['type'] == 'worksheet' and s['part'] in names]
+
+        def on_entry(e: SstScanner):
+            if not bit_is_set(referenced, e.index):
+                counts['unreferenced'] += 1
+                remap.append(-1)
+                keep.append(0)
+                return
+            new = seen.setdefault(e.digest, counts['kept'])
+            remap.append(new)
+            if new == counts['kept']:
+                counts['kept'] += 1
+                keep.append(1)
+            else:
+                counts['duplicates'] += 1
+                keep.append(0)
+
+        if part is not None:
+            referenced, string_cells = string_references(z, sheet_parts)
+            with z.open(part) as f:
+                SstScanner(on_entry).parse(f)
+
+    report = {'output': output_file, 'part': part, 'entries_before': len(remap),
+              'entries_after': counts['kept'], 'unreferenced_removed': counts['unreferenced'],
+              'duplicates_merged': counts['duplicates']}
+    rewriters = {}
+    if part is not None:
+        kept = counts['kept']
+        rewriters[part] = lambda src, dst: _SstRewriter(dst, keep, kept, string_cells).rewrite(src)
+        for sheet_part in sheet_parts:
+            rewriters[sheet_part] = lambda src, dst: _SheetStringRewriter(dst, remap, kept).rewrite(src)
+
+    report.update(rewrite_package(input_file, output_file, rewriters))
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Analyze or compact the shared strings table")
+    parser.add_argument("input_file", help="Path to the Excel file")
+    parser.add_argument("--compact", action="store_true",
+                        help="Write a copy without unreferenced / duplicate strings")
+    parser.add_argument("-o", "--output", help="Optional output file path (with --compact)")
+    args = parser.parse_args()
+
+    if args.compact:
+        print(json.dumps(compact_shared_strings(args.input_file, args.output), indent=2))
+    else:
+        with zipfile.ZipFile(args.input_file, 'r') as z:
+            names = set(z.namelist())
+            parts = [s['part'] for s in workbook_sheets(z) if s['type'] == 'worksheet' and s['part'] in names]
+            print(json.dumps(analyze_shared_strings(z, *string_references(z, parts)), indent=2))
@@ -0,0 +1,623 @@
+"""sheet_scanner.py
+Streaming scan of a single worksheet part (xl/worksheets/sheetN.xml).
+
+The sheet XML is pushed through expat in fixed-size chunks and counted in
+the SAX callbacks; no element tree is built, so memory stays flat no matter
+how many cells the sheet holds.
+"""
+import base64
+import re
+import zipfile
+from typing import Any, Callable, Dict, IO, Iterable, List, Optional, Tuple
+from xml.parsers import expat
+
+from xml_rewrite import local
+
+VOLATILE_FUNCS = {'NOW', 'TODAY', 'INDIRECT', 'OFFSET', 'RAND', 'RANDBETWEEN'}
+VOLATILE_REGEX = re.compile(r"\b(" + "|".join(VOLATILE_FUNCS) + r")\b", re.IGNORECASE)
+CELL_REF_REGEX = re.compile(r"\$?([A-Za-z]{1,3})\$?(\d+)")
+
+TRUE_VALUES = ('1', 'true')
+CHUNK_SIZE = 1 << 16
+MAX_ROW = 1048576
+MAX_COLUMN = 16384
+
+# Bump whenever the shape of the scan results changes (invalidates part_cache entries).
+SCANNER_VERSION = '6'
+
+# conditional formatting / data validation blocks -> rule kind
+RULE_BLOCKS = {'conditionalFormatting': 'cf', 'dataValidation': 'dv'}
+# elements whose text is a formula (relative to the block's first cell)
+FORMULA_TAGS = ('formula', 'formula1', 'formula2', 'f')
+# attributes / elements that do not make two rules different: their order and ids
+RULE_IGNORED_ATTRS = ('priority', 'sqref', 'id', 'uid')
+RULE_ID_TAG = 'id'
+
+# string literals and quoted sheet names are skipped; cell, column and
+# row references are picked out for rebasing
+_FORMULA_TOKEN = re.compile(
+    r'"(?:[^"]|"")*"'
+    r"|'(?:[^']|'')*'!"
+    r'|(?<![\w.$])(\$?)([A-Za-z]{1,3})(\$?)(\d+)(?![\w(!])'
+    r'|(?<![\w.$])(\$?)([A-Za-z]{1,3}):(\$?)([A-Za-z]{1,3})(?![\w(!])'
+    r'|(?<![\w.$:])(\$?)(\d+):(\$?)(\d+)(?![\w(.:!])'
+)
+_REF_PLACEHOLDER = re.compile('\x1f([^\x1f]*)\x1f')
+_REF_PIECE = re.compile(r'(?:R(\d+|\[-?\d+\]))?(?:C(\d+|\[-?\d+\]))?')
+
+
+def column_index(letters: str) -> int:
+    """'A' -> 1, 'Z' -> 26, 'AA' -> 27"""
+    n = 0
+    for ch in letters.upper():
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+def column_letter(index: int) -> str:
+    """1 -> 'A', 26 -> 'Z', 27 -> 'AA'"""
+    letters = ''
+    while index > 0:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def split_ref(ref: str) -> Tuple[int, int]:
+    """'C12' -> (12, 3). Returns (0, 0) for anything unparsable."""
+    m = CELL_REF_REGEX.match(ref)
+    if not m:
+        return 0, 0
+    return int(m.group(2)), column_index(m.group(1))
+
+
+def parse_sqref(sqref: str) -> List[Tuple[int, int, int, int]]:
+    """'A1:B3 D5' -> [(1, 1, 3, 2), (5, 4, 5, 4)] as (row1, col1, row2, col2)."""
+    areas = []
+    for token in sqref.split():
+        first, _, last = token.partition(':')
+        r1, c1 = split_ref(first)
+        r2, c2 = split_ref(last) if last else (r1, c1)
+        if r1 and c1 and r2 and c2:
+            areas.append((min(r1, r2), min(c1, c2), max(r1, r2), max(c1, c2)))
+    return areas
+
+
+def format_sqref(areas: Iterable[Tuple[int, int, int, int]]) -> str:
+    parts = []
+    for r1, c1, r2, c2 in areas:
+        first = f'{column_letter(c1)}{r1}'
+        parts.append(first if (r1, c1) == (r2, c2) else f'{first}:{column_letter(c2)}{r2}')
+    return ' '.join(parts)
+
+
+def _rebase(absolute: str, value: str, anchor: int, letter: str, limit: int) -> Optional[str]:
+    number = column_index(value) if letter == 'C' else int(value)
+    if not 1 <= number <= limit:
+        return None
+    return f'{letter}{number}' if absolute else f'{letter}[{number - anchor}]'
+
+
+def relative_formula(text: str, row: int, col: int) -> str:
+    """
+    Formula with its A1 references rewritten relative to (row, col), in
+    R1C1 notation between \\x1f marks: 'A2>$B$1' at B2 -> '\\x1fR[0]C[-1]\\x1f>\\x1fR1C2\\x1f'.
+    Two rules copied to different places have the same relative formula.
+    """
+    def token(m):
+        if m.group(2):
+            c = _rebase(m.group(1), m.group(2), col, 'C', MAX_COLUMN)
+            r = _rebase(m.group(3), m.group(4), row, 'R', MAX_ROW)
+            pieces = [r + c] if c and r else None
+        elif m.group(6):
+            pieces = [_rebase(m.group(5), m.group(6), col, 'C', MAX_COLUMN),
+                      _rebase(m.group(7), m.group(8), col, 'C', MAX_COLUMN)]
+        elif m.group(10):
+            pieces = [_rebase(m.group(9), m.group(10), row, 'R', MAX_ROW),
+                      _rebase(m.group(11), m.group(12), row, 'R', MAX_ROW)]
+        else:
+            return m.group(0)  # string literal / quoted sheet name
+        if not pieces or None in pieces:
+            return m.group(0)  # looks like a reference but is out of range
+        return '\x1f' + ':'.join(pieces) + '\x1f'
+    return _FORMULA_TOKEN.sub(token, text)
+
+
+def absolute_formula(template: str, row: int, col: int) -> str:
+    """Inverse of relative_formula() for a new anchor; ValueError if a reference leaves the sheet."""
+    def piece(text: str) -> str:
+        m = _REF_PIECE.fullmatch(text)
+        out = ''
+        for value, anchor, limit, column in ((m.group(2), col, MAX_COLUMN, True),
+                                             (m.group(1), row, MAX_ROW, False)):
+            if value is None:
+                continue
+            if value.startswith('['):
+                number, prefix = anchor + int(value[1:-1]), ''
+            else:
+                number, prefix = int(value), '$'
+            if not 1 <= number <= limit:
+                raise ValueError(f'Reference outside the sheet at {column_letter(col)}{row}')
+            out += prefix + (column_letter(number) if column else str(number))
+        return out
+
+    return _REF_PLACEHOLDER.sub(lambda m: ':'.join(piece(p) for p in m.group(1).split(':')), template)
+
+
+def _attr_key(attrs: Dict[str, str]) -> Tuple:
+    return tuple(sorted((k, v) for k, v in attrs.items() if local(k) not in RULE_IGNORED_ATTRS))
+
+
+def rule_key(rule: Dict[str, Any]) -> Optional[Tuple]:
+    """
+    What a RuleCollector rule does, independent of where it applies and of
+    its priority: rules with equal keys differ only by range. None when the
+    rule has no range to compare formulas against.
+    """
+    if not rule['areas']:
+        return None
+    row, col = rule['areas'][0][:2]
+    key = [rule['kind'], local(rule['name']), _attr_key(rule['attrs'])]
+    if rule['kind'] == 'cf':
+        key.append(_attr_key(rule['block'][1]))
+    tag = None
+    for event in rule['events']:
+        if event[0] == 's':
+            tag = local(event[1])
+            key.append((tag, _attr_key(event[2])))
+        elif event[0] == 't':
+            text = event[1].strip()
+            if tag in FORMULA_TAGS:
+                key.append(relative_formula(text, row, col))
+            elif tag != RULE_ID_TAG:
+                key.append(text)
+        else:
+            tag = None
+            key.append('/')
+    return tuple(key)
+
+
+class RuleCollector:
+    """
+    Gathers conditional formatting and data validation rules from SAX
+    events, for top-level blocks as well as x14 extension blocks (whose
+    range is an <xm:sqref> child). An extension rule that only adds to a
+    top-level rule (linked through <x14:id>) is not reported again. Each
+    rule is handed to `on_rule` once its block is complete, as a dict:
+      kind          'cf' or 'dv'
+      block         (name, attrs) of the <conditionalFormatting> / <dataValidation>
+      name, attrs   the rule element: <cfRule>, or the <dataValidation> itself
+      events        its content: ('s', name, attrs), ('t', text), ('e', name)
+      areas         parse_sqref() of the block's range
+    Call start() for an element in RULE_BLOCKS or while `depth` is set.
+    """
+
+    def __init__(self, on_rule: Callable[[Dict[str, Any]], None]):
+        self.on_rule = on_rule
+        self.depth = 0
+        self.blocks = {'cf': 0, 'dv': 0}
+        self.areas = {'cf': 0, 'dv': 0}
+        self._block = None
+        self._rules = []
+        self._rule = None
+        self._rule_depth = 0
+        self._sqref = []
+        self._in_sqref = False
+        self._linked_ids = set()
+
+    def start(self, name: str, attrs: Dict[str, str]):
+        self.depth += 1
+        tag = local(name)
+        if self.depth == 1:
+            self._block = (RULE_BLOCKS[tag], name, attrs)
+            self._rules = []
+            self._sqref = []
+            if tag == 'dataValidation':
+                self._open_rule(name, attrs)
+        elif tag == 'sqref':
+            self._in_sqref = True
+        elif self._rule is not None:
+            self._rule['events'].append(('s', name, attrs))
+        elif tag == 'cfRule':
+            self._open_rule(name, attrs)
+
+    def _open_rule(self, name: str, attrs: Dict[str, str]):
+        kind, block_name, block_attrs = self._block
+        self._rule = {'kind': kind, 'block': (block_name, block_attrs), 'name': name,
+                      'attrs': attrs, 'events': [], 'areas': None}
+        self._rule_depth = self.depth
+
+    def end(self, name: str):
+        if self._in_sqref:
+            self._in_sqref = False
+        elif self._rule is not None:
+            events = self._rule['events']
+            if local(name) == RULE_ID_TAG and events and events[-1][0] == 't':
+                self._linked_ids.add(events[-1][1].strip())
+            if self.depth == self._rule_depth:
+                self._rules.append(self._rule)
+                self._rule = None
+            else:
+                self._rule['events'].append(('e', name))
+        if self.depth == 1:
+            self._close_block()
+        self.depth -= 1
+
+    def characters(self, data: str):
+        if self._in_sqref:
+            self._sqref.append(data)
+        elif self._rule is not None:
+            events = self._rule['events']
+            if events and events[-1][0] == 't':
+                events[-1] = ('t', events[-1][1] + data)
+            else:
+                events.append(('t', data))
+
+    def _close_block(self):
+        kind, _, attrs = self._block
+        areas = parse_sqref(attrs.get('sqref') or ''.join(self._sqref))
+        if 'sqref' not in attrs:
+            self._rules = [r for r in self._rules if r['attrs'].get('id') not in self._linked_ids]
+            if not self._rules:
+                self._block = None
+                return
+        self.blocks[kind] += 1
+        self.areas[kind] += len(areas)
+        for rule in self._rules:
+            rule['areas'] = areas
+            self.on_rule(rule)
+        self._block = None
+        self._rules = []
+
+
+def pack_bitmap(bitmap: bytearray) -> str:
+    """Bitmap -> base64 text (survives JSON and the part cache)."""
+    return base64.b64encode(bytes(bitmap).rstrip(b'\0')).decode('ascii')
+
+
+def merge_bitmaps(packed: Iterable[str]) -> bytes:
+    """OR together pack_bitmap() results; bit i is byte i >> 3, bit i & 7."""
+    merged = 0
+    for text in packed:
+        merged |= int.from_bytes(base64.b64decode(text), 'little')
+    return merged.to_bytes((merged.bit_length() + 7) // 8, 'little')
+
+
+def bit_is_set(bitmap: bytes, i: int) -> bool:
+    byte = i >> 3
+    return byte < len(bitmap) and bool(bitmap[byte] >> (i & 7) & 1)
+
+
+def new_sheet_info() -> Dict[str, Any]:
+    return {
+        'max_row': 0,
+        'max_column': 0,
+        'formulas': 0,
+        'volatile_formulas': 0,
+        'merged_cells': 0,
+        'hidden_rows': 0,
+        'hidden_columns': 0,
+        'unique_styles': 0,
+        'dimension': '',
+        'data_max_row': 0,
+        'data_max_column': 0,
+        'wasted_rows': 0,
+        'wasted_columns': 0,
+        'conditional_formats': 0,
+        'cf_rules': 0,
+        'cf_ranges': 0,
+        'cf_duplicate_rules': 0,
+        'data_validations': 0,
+        'dv_ranges': 0,
+        'dv_duplicate_rules': 0,
+    }
+
+
+class WorksheetScanner:
+    """
+    SAX-style handler collecting the per-sheet counters.
+    Tags are matched on their local name so prefixed (x:c) and
+    strict-namespace sheets are handled the same way. A `profiler`
+    (column_profile.ColumnProfiler) is handed every cell in the same pass;
+    its profile is reported as info['columns'].
+    """
+
+    def __init__(self, profiler=None):
+        self.info = new_sheet_info()
+        self.cells = 0
+        self.style_ids = set()
+        # xf index -> number of cells/rows/cols referencing it
+        self.style_refs = {}
+        self.shared_volatile = {}
+        # bit i set: some t="s" cell points at shared string i
+        self.string_refs = bytearray()
+        self.string_cells = 0
+        # conditional formatting / data validation rules
+        self.rules = RuleCollector(self._add_rule)
+        self._rule_keys = set()
+
+        self.row_idx = 0
+        self.col_idx = 0
+        self.max_row = 0
+        self.max_col = 0
+        # extent of cells holding a value / formula / inline string
+        self.data_max_row = 0
+        self.data_max_col = 0
+        self.merge_max_row = 0
+        self.merge_max_col = 0
+        # what the file claims: <dimension>, row spans, formatted rows / cols
+        self.dim_row = 0
+        self.dim_col = 0
+        self.declared_row = 0
+        self.declared_col = 0
+
+        self._in_formula = False
+        self._string_cell = False
+        self._in_string_value = False
+        self._formula_attrs = None
+        self._text = []
+
+        self.profiler = profiler
+        self._in_cell = False     # profiling: inside a <c>
+        self._in_value = False    # profiling: inside its <v> / <t>
+        self._value = []
+        self._cell_type = None
+        self._cell_formula = 0
+
+    def _extend(self, row: int, col: int):
+        if row > self.max_row:
+            self.max_row = row
+        if col > self.max_col:
+            self.max_col = col
+
+    def start(self, name: str, attrs: Dict[str, str]):
+        if ':' in name:
+            name = name.rpartition(':')[2]
+
+        if self.rules.depth:
+            self.rules.start(name, attrs)
+        elif name == 'c':
+            self.cells += 1
+            ref = attrs.get('r')
+            if ref:
+                self.row_idx, self.col_idx = split_ref(ref)
+            else:
+                self.col_idx += 1
+            self._extend(self.row_idx, self.col_idx)
+            self._string_cell = attrs.get('t') == 's'
+            s = attrs.get('s')
+            if s:
+                self.style_refs[s] = self.style_refs.get(s, 0) + 1
+                if s != '0':
+                    self.style_ids.add(s)
+            if self.profiler is not None:
+                self._in_cell = True
+                self._cell_type = attrs.get('t', 'n')
+                self._cell_formula = 0
+                self._value = []
+        elif name == 'v':
+            self._mark_data()
+            if self._string_cell:
+                self._in_string_value = True
+                self._text = []
+            self._in_value = self._in_cell
+        elif name == 'is':
+            self._mark_data()
+        elif name == 't':
+            self._in_value = self._in_cell
+        elif name == 'f':
+            self._mark_data()
+            self._in_formula = True
+            self._formula_attrs = attrs
+            self._text = []
+            self._cell_formula = 1
+        elif name == 'row':
+            r = attrs.get('r')
+            self.row_idx = int(r) if r else self.row_idx + 1
+            self.col_idx = 0
+            if self.row_idx > self.declared_row:
+                self.declared_row = self.row_idx
+            spans = attrs.get('spans')
+            if spans:
+                try:
+                    last = int(spans.rpartition(':')[2])
+                except ValueError:
+                    last = 0
+                if last > self.declared_col:
+                    self.declared_col = last
+            if attrs.get('hidden') in TRUE_VALUES:
+                self.info['hidden_rows'] += 1
+            s = attrs.get('s')
+            if s and attrs.get('customFormat') in TRUE_VALUES:
+                self.style_refs[s] = self.style_refs.get(s, 0) + 1
+        elif name == 'col':
+            s = attrs.get('style')
+            lo = int(attrs.get('min', 1))
+            hi = int(attrs.get('max', lo))
+            if s:
+                self.style_refs[s] = self.style_refs.get(s, 0) + 1
+                if hi > self.declared_col:
+                    self.declared_col = hi
+            if attrs.get('hidden') in TRUE_VALUES:
+                self.info['hidden_columns'] += hi - lo + 1
+        elif name == 'mergeCell':
+            self.info['merged_cells'] += 1
+            # merged areas count towards the extent, as in openpyxl
+            r, c = split_ref(attrs.get('ref', '').rpartition(':')[2])
+            self._extend(r, c)
+            self.merge_max_row = max(self.merge_max_row, r)
+            self.merge_max_col = max(self.merge_max_col, c)
+        elif name == 'dimension':
+            ref = attrs.get('ref', '')
+            self.info['dimension'] = ref
+            self.dim_row, self.dim_col = split_ref(ref.rpartition(':')[2])
+        elif name in RULE_BLOCKS:
+            self.rules.start(name, attrs)
+
+    def _add_rule(self, rule: Dict[str, Any]):
+        kind = rule['kind']
+        if kind == 'cf':
+            self.info['cf_rules'] += 1
+        key = rule_key(rule)
+        if key is None:
+            return
+        if key in self._rule_keys:
+            self.info[f'{kind}_duplicate_rules'] += 1
+        else:
+            self._rule_keys.add(key)
+
+    def _mark_data(self):
+        if self.row_idx > self.data_max_row:
+            self.data_max_row = self.row_idx
+        if self.col_idx > self.data_max_col:
+            self.data_max_col = self.col_idx
+
+    def _add_string_ref(self, text: str):
+        try:
+            i = int(text)
+        except ValueError:
+            return
+        if i < 0:
+            return
+        self.string_cells += 1
+        byte = i >> 3
+        if byte >= len(self.string_refs):
+            self.string_refs.extend(bytes(max(byte + 1, 2 * len(self.string_refs)) - len(self.string_refs)))
+        self.string_refs[byte] |= 1 << (i & 7)
+
+    def end(self, name: str):
+        if not (self._in_formula or self._in_string_value or self.rules.depth or self._in_cell):
+            return
+        if ':' in name:
+            name = name.rpartition(':')[2]
+        if self.rules.depth:
+            self.rules.end(name)
+            return
+        if self._in_cell:
+            if name == 'v' or name == 't':
+                self._in_value = False
+            elif name == 'c':
+                self._in_cell = False
+                self.profiler.add_cell(self.col_idx, self._cell_type, self._cell_formula, ''.join(self._value))
+                return
+        if self._in_string_value:
+            if name == 'v':
+                self._in_string_value = False
+                self._add_string_ref(''.join(self._text))
+            return
+        if name != 'f':
+            return
+
+        self._in_formula = False
+        self.info['formulas'] += 1
+        attrs = self._formula_attrs
+        text = ''.join(self._text)
+        si = attrs.get('si')
+        if text:
+            volatile = VOLATILE_REGEX.search(text) is not None
+            if si is not None and attrs.get('t') == 'shared':
+                self.shared_volatile[si] = volatile
+        else:
+            # shared formula child: inherits the master's functions
+            volatile = self.shared_volatile.get(si, False)
+        if volatile:
+            self.info['volatile_formulas'] += 1
+
+    def characters(self, data: str):
+        if self._in_value:
+            self._value.append(data)
+        if self._in_formula or self._in_string_value:
+            self._text.append(data)
+        elif self.rules.depth:
+            self.rules.characters(data)
+
+    def parser(self):
+        """A fresh expat parser feeding this scanner."""
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.characters
+        return parser
+
+    def parse(self, source: IO[bytes], on_chunk=None):
+        """on_chunk(scanner) is called after every chunk and may raise to abort."""
+        parser = self.parser()
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.Parse(chunk, False)
+            if on_chunk is not None:
+                on_chunk(self)
+        parser.Parse(b'', True)
+
+    def keep_extent(self) -> Tuple[int, int]:
+        """
+        (rows, cols) holding data or merged ranges: what used_range keeps;
+        rows / columns beyond it are reported as wasted.
+        """
+        return (max(self.data_max_row, self.merge_max_row),
+                max(self.data_max_col, self.merge_max_col))
+
+    def results(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        info = dict(self.info)
+        # openpyxl reports 1x1 for an empty sheet; keep the same numbers.
+        info['max_row'] = self.max_row or 1
+        info['max_column'] = self.max_col or 1
+        info['unique_styles'] = len(self.style_ids)
+        info['data_max_row'] = self.data_max_row
+        info['data_max_column'] = self.data_max_col
+        # phantom rows / columns: formatted or declared, but holding no data
+        # and not covered by a merged range
+        keep_row, keep_col = self.keep_extent()
+        info['wasted_rows'] = max(self.max_row, self.dim_row, self.declared_row) - keep_row
+        info['wasted_columns'] = max(self.max_col, self.dim_col, self.declared_col) - keep_col
+        info['conditional_formats'] = self.rules.blocks['cf']
+        info['cf_ranges'] = self.rules.areas['cf']
+        info['data_validations'] = self.rules.blocks['dv']
+        info['dv_ranges'] = self.rules.areas['dv']
+        if self.profiler is not None:
+            info['columns'] = self.profiler.results()
+        return info, {'cells': self.cells, 'styles': dict(self.style_refs),
+                      'strings': pack_bitmap(self.string_refs), 'string_cells': self.string_cells}
+
+
+def scan_worksheet(source: IO[bytes], on_chunk=None, profiler=None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Scan one worksheet XML stream.
+
+    Returns (info, counters):
+      info     - the per-sheet dict reported under result['sheets']
+      counters - partial totals the caller merges into the workbook result
+                 ('cells': number of <c> elements seen,
+                  'styles': {xf index: references from cells/rows/cols},
+                  'strings': pack_bitmap() of the shared string indices
+                             used by t="s" cells,
+                  'string_cells': number of such cells)
+    on_chunk, if given, is called with the scanner after each chunk.
+    A column_profile.ColumnProfiler adds info['columns'].
+    """
+    scanner = WorksheetScanner(profiler)
+    scanner.parse(source, on_chunk)
+    return scanner.results()
+
+
+def scan_sheet_part(path: str, part: str, on_chunk=None,
+                    string_table=None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Open `path` and scan the worksheet stored at zip member `part`.
+    string_table (column_profile.shared_string_table()) profiles its columns.
+    """
+    with zipfile.ZipFile(path, 'r') as z:
+        with z.open(part) as f:
+            return scan_worksheet(f, on_chunk, column_profiler(string_table))
+
+
+def column_profiler(string_table):
+    """A column_profile.ColumnProfiler over `string_table`, or None without one."""
+    if string_table is None:
+        return None
+    # NumPy is only imported when columns are profiled
+    from column_profile import ColumnProfiler
+    return ColumnProfiler(*string_table)
@@ -0,0 +1,127 @@
+"""style_consolidation.py
+Style cleanup that keeps formatting intact.
+
+Rather than resetting every cell to "Normal" through openpyxl, this merges
+duplicate-equivalent cell formats (cellXfs), drops the ones no cell, row
+or column references, and remaps the `s=` / `style=` indices in the sheet
+XML. Only xl/styles.xml and the worksheet parts are rewritten, both as
+streams; every other part is copied unchanged.
+"""
+import zipfile
+from collections import Counter
+from typing import Any, Dict, IO, List, Set, Tuple
+
+from sheet_scanner import scan_worksheet
+from styles_analysis import read_stylesheet
+from xlsx_package import rewrite_package, workbook_sheets
+from xml_rewrite import XmlRewriter, local
+
+
+def build_xf_mapping(xf_map: List[int], referenced: Counter) -> Tuple[Set[int], Dict[str, str]]:
+    """
+    Returns (kept, remap): the old cellXfs indices that survive and the
+    old -> new index mapping (as attribute strings) for every used index.
+    xf 0 is always kept so unstyled cells keep their default format.
+    """
+    used = {0}
+    for idx in referenced:
+        try:
+            i = int(idx)
+        except ValueError:
+            continue
+        if 0 <= i < len(xf_map):
+            used.add(i)
+
+    kept = {xf_map[i] for i in used}
+    position = {old: new for new, old in enumerate(sorted(kept))}
+    remap = {str(i): str(position[xf_map[i]]) for i in used}
+    return kept, remap
+
+
+class _StylesRewriter(XmlRewriter):
+    def __init__(self, out: IO[bytes], kept: Set[int]):
+        super().__init__(out)
+        self.kept = kept
+        self.index = 0
+
+    def start(self, name, attrs):
+        tag = local(name)
+        if tag == 'cellXfs':
+            attrs['count'] = str(len(self.kept))
+        elif tag == 'xf' and self.path and self.path[-1] == 'cellXfs':
+            i = self.index
+            self.index += 1
+            if i not in self.kept:
+                return None
+        return attrs
+
+
+class _SheetStyleRewriter(XmlRewriter):
+    def __init__(self, out: IO[bytes], remap: Dict[str, str]):
+        super().__init__(out)
+        self.remap = remap
+
+    def start(self, name, attrs):
+        tag = local(name)
+        if tag == 'c' or tag == 'row':
+            s = attrs.get('s')
+            if s is not None:
+                attrs['s'] = self.remap.get(s, '0')
+        elif tag == 'col':
+            s = attrs.get('style')
+            if s is not None:
+                attrs['style'] = self.remap.get(s, '0')
+        return attrs
+
+
+def consolidate_styles(input_file: str, output_file: str = None) -> Dict[str, Any]:
+    """
+    Write a copy of `input_file` with merged / pruned cell formats.
+    Returns a report dict including the output path.
+    """
+    if output_file is None:
+        output_file = input_file.replace(".xlsx", "_STYLES_CONSOLIDATED.xlsx")
+
+    with zipfile.ZipFile(input_file, 'r') as z:
+        names = set(z.namelist())
+        styles_part, stylesheet = read_stylesheet(z)
+        sheet_parts = [s['part'] for s in workbook_sheets(z)
+                       if s['type'] == 'worksheet' and s['part'] in names]
+
+        referenced = Counter()
+        for part in sheet_parts:
+            with z.open(part) as f:
+                referenced.update(scan_worksheet(f)[1]['styles'])
+
+    kept, remap = build_xf_mapping(stylesheet.xf_map, referenced)
+    n_before = len(stylesheet.cell_xfs)
+    duplicates = len({int(i) for i in remap}) - len(kept)
+    del stylesheet
+
+    rewriters = {styles_part: lambda src, dst: _StylesRewriter(dst, kept).rewrite(src)}
+    for part in sheet_parts:
+        rewriters[part] = lambda src, dst: _SheetStyleRewriter(dst, remap).rewrite(src)
+
+    sizes = rewrite_package(input_file, output_file, rewriters)
+
+    report = {
+        'output': output_file,
+        'cell_xfs_before': n_before,
+        'cell_xfs_after': len(kept),
+        'merged_duplicates': duplicates,
+        'dropped_unused': n_before - len(kept) - duplicates,
+    }
+    report.update(sizes)
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Merge duplicate and drop unused cell formats")
+    parser.add_argument("input_file", help="Path to the Excel file")
+    parser.add_argument("-o", "--output", help="Optional output file path")
+    args = parser.parse_args()
+
+    print(json.dumps(consolidate_styles(args.input_file, args.output), indent=2))
@@ -0,0 +1,154 @@
+"""styles_analysis.py
+Style bloat analysis against xl/styles.xml.
+
+Instead of comparing openpyxl style objects cell by cell, the stylesheet
+is read once and every cell format (cellXfs entry) is reduced to a
+canonical key. Together with the histogram of `s=` indices collected by
+the sheet scanner this tells which formats are never used and which are
+duplicates of an earlier, equivalent one.
+"""
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from xlsx_package import STYLES_REL, local_name, workbook_related_part
+
+DEFAULT_STYLES_PART = 'xl/styles.xml'
+TOP_XFS = 20
+
+# attributes of an <xf> that point into another stylesheet collection
+XF_REFERENCES = {'fontId': 'fonts', 'fillId': 'fills', 'borderId': 'borders', 'numFmtId': 'numFmts'}
+
+
+def canonical(elem: ET.Element) -> Tuple:
+    """Order-independent, hashable representation of an element subtree."""
+    attrs = tuple(sorted((local_name(k), v) for k, v in elem.attrib.items()))
+    text = (elem.text or '').strip()
+    return (local_name(elem.tag), attrs, text, tuple(canonical(child) for child in elem))
+
+
+def first_equivalents(keys: List[Any]) -> List[int]:
+    """For each position, the index of the first entry with the same key."""
+    first = {}
+    return [first.setdefault(key, i) for i, key in enumerate(keys)]
+
+
+def collection(root: ET.Element, name: str) -> List[ET.Element]:
+    for child in root:
+        if local_name(child.tag) == name:
+            return list(child)
+    return []
+
+
+class StyleSheet:
+    """
+    Parsed stylesheet with canonical equivalence maps.
+
+    font_map / fill_map / border_map / numfmt_map map each id to the first
+    equivalent id; xf_map / style_xf_map do the same for cellXfs and
+    cellStyleXfs once their font/fill/border/numFmt references have been
+    canonicalised.
+    """
+
+    def __init__(self, data: bytes):
+        root = ET.fromstring(data)
+        self.root = root
+
+        self.num_fmts = collection(root, 'numFmts')
+        self.fonts = collection(root, 'fonts')
+        self.fills = collection(root, 'fills')
+        self.borders = collection(root, 'borders')
+        self.cell_style_xfs = collection(root, 'cellStyleXfs')
+        self.cell_xfs = collection(root, 'cellXfs')
+        self.cell_styles = collection(root, 'cellStyles')
+        self.dxfs = collection(root, 'dxfs')
+
+        self.font_map = first_equivalents([canonical(e) for e in self.fonts])
+        self.fill_map = first_equivalents([canonical(e) for e in self.fills])
+        self.border_map = first_equivalents([canonical(e) for e in self.borders])
+
+        # custom number formats are keyed by their id; equal format codes are equivalent
+        codes = {}
+        self.numfmt_map = {}
+        for fmt in self.num_fmts:
+            fmt_id = fmt.get('numFmtId')
+            self.numfmt_map[fmt_id] = codes.setdefault(fmt.get('formatCode'), fmt_id)
+
+        self.style_xf_map = first_equivalents([self.xf_key(xf) for xf in self.cell_style_xfs])
+        self.xf_map = first_equivalents([self.xf_key(xf, self.style_xf_map) for xf in self.cell_xfs])
+
+    def _ref(self, attr: str, value: str) -> str:
+        if attr == 'numFmtId':
+            return self.numfmt_map.get(value, value)
+        id_map = {'fontId': self.font_map, 'fillId': self.fill_map, 'borderId': self.border_map}[attr]
+        try:
+            return str(id_map[int(value)])
+        except (ValueError, IndexError):
+            return value
+
+    def xf_key(self, xf: ET.Element, style_xf_map: List[int] = None) -> Tuple:
+        attrs = []
+        for k, v in xf.attrib.items():
+            k = local_name(k)
+            if k in XF_REFERENCES:
+                v = self._ref(k, v)
+            elif k == 'xfId' and style_xf_map is not None:
+                try:
+                    v = str(style_xf_map[int(v)])
+                except (ValueError, IndexError):
+                    pass
+            attrs.append((k, v))
+        return tuple(sorted(attrs)), tuple(canonical(child) for child in xf)
+
+
+def read_stylesheet(z: zipfile.ZipFile) -> Tuple[str, StyleSheet]:
+    part = workbook_related_part(z, STYLES_REL, DEFAULT_STYLES_PART)
+    return part, StyleSheet(z.read(part))
+
+
+def analyze_styles(z: zipfile.ZipFile, referenced: Counter) -> Dict[str, Any]:
+    """
+    Summarise stylesheet bloat.
+
+    `referenced` is the merged histogram of xf indices used by cells, rows
+    and columns across all sheets ({'3': 120, ...}); xf 0 is the default
+    format and always counts as used.
+    """
+    part, sheet = read_stylesheet(z)
+
+    used = {0}
+    for idx in referenced:
+        try:
+            used.add(int(idx))
+        except ValueError:
+            continue
+    n_xfs = len(sheet.cell_xfs)
+
+    used_style_xfs = {0}
+    for xf in sheet.cell_xfs:
+        used_style_xfs.add(int(xf.get('xfId', 0)))
+    for style in sheet.cell_styles:
+        used_style_xfs.add(int(style.get('xfId', 0)))
+
+    top = sorted(referenced.items(), key=lambda kv: (-kv[1], int(kv[0])))[:TOP_XFS]
+
+    return {
+        'part': part,
+        'num_fmts': len(sheet.num_fmts),
+        'fonts': len(sheet.fonts),
+        'fills': len(sheet.fills),
+        'borders': len(sheet.borders),
+        'cell_style_xfs': len(sheet.cell_style_xfs),
+        'cell_xfs': n_xfs,
+        'cell_styles': len(sheet.cell_styles),
+        'dxfs': len(sheet.dxfs),
+        'referenced_xfs': len(used & set(range(n_xfs))),
+        'unused_xfs': sum(1 for i in range(n_xfs) if i not in used),
+        'duplicate_xfs': sum(1 for i, first in enumerate(sheet.xf_map) if first != i),
+        'duplicate_fonts': sum(1 for i, first in enumerate(sheet.font_map) if first != i),
+        'duplicate_fills': sum(1 for i, first in enumerate(sheet.fill_map) if first != i),
+        'duplicate_borders': sum(1 for i, first in enumerate(sheet.border_map) if first != i),
+        'unused_cell_style_xfs': sum(1 for i in range(len(sheet.cell_style_xfs)) if i not in used_style_xfs),
+        'top_xfs': [[int(idx), count] for idx, count in top],
+    }
@@ -0,0 +1,180 @@
+"""used_range.py
+Trim phantom used ranges: formatting that stretches far past the last
+cell holding data (often to row 1,048,576 or column XFD) and makes Excel
+load, save and scroll through a million empty rows.
+
+Each worksheet is scanned once to find the extent of the cells holding a
+value, formula or inline string (merged ranges are kept whole), then
+rewritten as a stream:
+  - <row> elements below that extent are dropped; hidden or
+    custom-height ones are listed in the report
+  - empty styled <c> elements right of it are dropped, row spans clipped
+  - styled <col> ranges are clipped to it; past it they only survive
+    (without the style) when they set a width, hidden or outline level
+  - <dimension> is set to the trimmed range
+Everything else in the package is copied unchanged.
+"""
+import zipfile
+from typing import Any, Dict, IO, Tuple
+
+from sheet_scanner import TRUE_VALUES, WorksheetScanner, column_letter, split_ref
+from xlsx_package import rewrite_package, workbook_sheets
+from xml_rewrite import XmlRewriter, local
+
+# <col> settings that still matter on columns without data
+LAYOUT_COL_ATTRS = ('customWidth', 'hidden', 'outlineLevel', 'collapsed')
+
+
+def keep_extent(source: IO[bytes]) -> Tuple[int, int]:
+    """(rows, cols) that must survive trimming: data cells plus merged ranges."""
+    scanner = WorksheetScanner()
+    scanner.parse(source)
+    return scanner.keep_extent()
+
+
+def _add_to_ranges(ranges, row: int):
+    # ['5', '9:12'] style list of row numbers, consecutive ones merged
+    if ranges:
+        first, _, last = ranges[-1].partition(':')
+        if int(last or first) == row - 1:
+            ranges[-1] = f'{first}:{row}'
+            return
+    ranges.append(str(row))
+
+
+class _TrimRewriter(XmlRewriter):
+    def __init__(self, out: IO[bytes], max_row: int, max_col: int, stats: Dict[str, int]):
+        super().__init__(out)
+        self.max_row = max_row
+        self.max_col = max_col
+        self.stats = stats
+        self.row_idx = 0
+        self.col_idx = 0
+        self.cols_kept = 0
+
+    def start(self, name, attrs):
+        tag = local(name)
+        if tag == 'row':
+            r = attrs.get('r')
+            self.row_idx = int(r) if r else self.row_idx + 1
+            self.col_idx = 0
+            if self.row_idx > self.max_row:
+                self.stats['rows_removed'] += 1
+                if attrs.get('hidden') in TRUE_VALUES:
+                    _add_to_ranges(self.stats['hidden_rows_removed'], self.row_idx)
+                elif attrs.get('customHeight') in TRUE_VALUES:
+                    _add_to_ranges(self.stats['custom_height_rows_removed'], self.row_idx)
+                return None
+            spans = attrs.get('spans')
+            if spans:
+                first, _, last = spans.partition(':')
+                if last.isdigit() and int(last) > self.max_col:
+                    if first.isdigit() and int(first) <= self.max_col:
+                        attrs['spans'] = f'{first}:{self.max_col}'
+                    else:
+                        del attrs['spans']
+        elif tag == 'c':
+            ref = attrs.get('r')
+            if ref:
+                self.col_idx = split_ref(ref)[1]
+            else:
+                self.col_idx += 1
+            if self.col_idx > self.max_col:
+                # nothing right of the extent holds data
+                self.stats['cells_removed'] += 1
+                return None
+        elif tag == 'cols':
+            # <cols> must not end up empty: buffer it until we know
+            self.begin_capture()
+            self.cols_kept = 0
+        elif tag == 'col':
+            return self._col(name, attrs)
+        elif tag == 'dimension':
+            attrs['ref'] = self.dimension()
+        return attrs
+
+    def _col(self, name, attrs):
+        lo = int(attrs.get('min', 1))
+        hi = int(attrs.get('max', lo))
+        if hi <= self.max_col or 'style' not in attrs:
+            self.cols_kept += 1
+            return attrs
+
+        self.stats['col_ranges_trimmed'] += 1
+        if lo <= self.max_col:
+            inside = dict(attrs)
+            inside['max'] = str(self.max_col)
+            self.write_element(name, inside)
+            self.cols_kept += 1
+            lo = self.max_col + 1
+        if any(k in attrs for k in LAYOUT_COL_ATTRS):
+            outside = {k: v for k, v in attrs.items() if k != 'style'}
+            outside['min'] = str(lo)
+            self.write_element(name, outside)
+            self.cols_kept += 1
+        return None
+
+    def closed(self, name):
+        if local(name) == 'cols':
+            markup = self.end_capture()
+            if self.cols_kept:
+                self.write(markup)
+
+    def dimension(self) -> str:
+        if not self.max_row or not self.max_col:
+            return 'A1'
+        last = f'{column_letter(self.max_col)}{self.max_row}'
+        return 'A1' if last == 'A1' else f'A1:{last}'
+
+
+def trim_used_range(input_file: str, output_file: str = None) -> Dict[str, Any]:
+    """
+    Write a copy of `input_file` with every worksheet trimmed to its data
+    extent. `output_file` may equal `input_file`.
+
+    Returns {'output', 'sheets': {name: {'dimension', 'rows_removed',
+             'cells_removed', 'col_ranges_trimmed', 'hidden_rows_removed',
+             'custom_height_rows_removed'}}, 'bytes_before', 'bytes_after'};
+    the last two list the dropped rows that were hidden / had a custom
+    height, as '7' or '12:40' ranges.
+    """
+    if output_file is None:
+        output_file = input_file.replace(".xlsx", "_TRIMMED.xlsx")
+
+    extents = {}
+    with zipfile.ZipFile(input_file, 'r') as z:
+        names = set(z.namelist())
+        sheets = [s for s in workbook_sheets(z) if s['type'] == 'worksheet' and s['part'] in names]
+        for sheet in sheets:
+            with z.open(sheet['part']) as f:
+                extents[sheet['part']] = keep_extent(f)
+
+    report = {'output': output_file, 'sheets': {}}
+    rewriters = {}
+    for sheet in sheets:
+        max_row, max_col = extents[sheet['part']]
+        stats = {'dimension': '', 'rows_removed': 0, 'cells_removed': 0, 'col_ranges_trimmed': 0,
+                 'hidden_rows_removed': [], 'custom_height_rows_removed': []}
+        report['sheets'][sheet['name']] = stats
+
+        def rewrite(src, dst, max_row=max_row, max_col=max_col, stats=stats):
+            rewriter = _TrimRewriter(dst, max_row, max_col, stats)
+            stats['dimension'] = rewriter.dimension()
+            rewriter.rewrite(src)
+
+        rewriters[sheet['part']] = rewrite
+
+    report.update(rewrite_package(input_file, output_file, rewriters))
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Trim formatting beyond each sheet's data extent")
+    parser.add_argument("input_file", help="Path to the Excel file")
+    parser.add_argument("-o", "--output", help="Optional output file path")
+    args = parser.parse_args()
+
+    print(json.dumps(trim_used_range(args.input_file, args.output), indent=2))
@@ -0,0 +1,238 @@
+"""xlsx_package.py
+Helpers for reading the OPC package structure of an XLSX file
+(relationships, workbook sheet list) straight from the zip container,
+and for streaming zip-to-zip rewrites of selected parts.
+"""
+import os
+import posixpath
+import shutil
+import struct
+import tempfile
+import xml.etree.ElementTree as ET
+import zipfile
+from typing import Callable, Dict, IO, Iterable, List, Set, Tuple
+
+from xml_rewrite import XmlRewriter, local
+
+REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+OFFICE_DOCUMENT_REL = '/officeDocument'
+WORKSHEET_REL = '/worksheet'
+STYLES_REL = '/styles'
+SHARED_STRINGS_REL = '/sharedStrings'
+DEFAULT_WORKBOOK_PART = 'xl/workbook.xml'
+CONTENT_TYPES_PART = '[Content_Types].xml'
+ZIP64_LIMIT = 0xFFFFFFFF
+COPY_BUFFER = 1 << 20
+
+
+def local_name(tag: str) -> str:
+    """Strip the '{namespace}' prefix ElementTree puts on tags and attributes."""
+    return tag.rpartition('}')[2]
+
+
+def rels_part_for(part: str) -> str:
+    """xl/worksheets/sheet1.xml -> xl/worksheets/_rels/sheet1.xml.rels"""
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, '_rels', name + '.rels')
+
+
+def resolve_target(source_part: str, target: str) -> str:
+    """Resolve a relationship Target against the part that owns the .rels file."""
+    if target.startswith('/'):
+        return target.lstrip('/')
+    folder = posixpath.dirname(source_part)
+    return posixpath.normpath(posixpath.join(folder, target))
+
+
+def read_relationships(z: zipfile.ZipFile, part: str,
+                       internal_only: bool = False) -> Dict[str, Tuple[str, str]]:
+    """
+    Returns {rId: (type, resolved_target)} for the relationships of `part`.
+    External targets (TargetMode="External") are returned unresolved, or
+    left out with internal_only=True.
+    Missing .rels parts yield an empty dict.
+    """
+    rels_name = rels_part_for(part) if part else '_rels/.rels'
+    try:
+        data = z.read(rels_name)
+    except KeyError:
+        return {}
+
+    rels = {}
+    for rel in ET.fromstring(data):
+        if local_name(rel.tag) != 'Relationship':
+            continue
+        target = rel.get('Target', '')
+        if rel.get('TargetMode') == 'External':
+            if internal_only:
+                continue
+        else:
+            target = resolve_target(part, target)
+        rels[rel.get('Id')] = (rel.get('Type', ''), target)
+    return rels
+
+
+def find_workbook_part(z: zipfile.ZipFile) -> str:
+    """Locate the main workbook part through the package-level relationships."""
+    for rel_type, target in read_relationships(z, '').values():
+        if rel_type.endswith(OFFICE_DOCUMENT_REL):
+            return target
+    return DEFAULT_WORKBOOK_PART
+
+
+def workbook_related_part(z: zipfile.ZipFile, rel_suffix: str, default: str = '') -> str:
+    """
+    First part the workbook points at with a relationship type ending in
+    `rel_suffix` (e.g. STYLES_REL), or `default` when there is none.
+    """
+    for rel_type, target in read_relationships(z, find_workbook_part(z)).values():
+        if rel_type.endswith(rel_suffix):
+            return target
+    return default
+
+
+def workbook_sheets(z: zipfile.ZipFile) -> List[Dict[str, str]]:
+    """
+    Lists every <sheet> declared in the workbook, in tab order.
+    Each entry has 'name', 'state', 'type' (relationship type suffix,
+    e.g. 'worksheet' or 'chartsheet') and 'part' (zip member name).
+    """
+    workbook_part = find_workbook_part(z)
+    rels = read_relationships(z, workbook_part)
+    root = ET.fromstring(z.read(workbook_part))
+
+    sheets = []
+    for elem in root.iter():
+        if local_name(elem.tag) != 'sheet':
+            continue
+        rid = next((v for k, v in elem.attrib.items() if local_name(k) == 'id'), None)
+        rel_type, part = rels.get(rid, ('', ''))
+        sheets.append({
+            'name': elem.get('name', ''),
+            'state': elem.get('state', 'visible'),
+            'type': rel_type.rpartition('/')[2],
+            'part': part,
+        })
+    return sheets
+
+
+def rewrite_package(src_path: str, dst_path: str,
+                    rewriters: Dict[str, Callable[[IO[bytes], IO[bytes]], None]],
+                    drop: Iterable[str] = ()) -> Dict[str, int]:
+    """
+    Copy the package at `src_path` to `dst_path` member by member.
+
+    Members named in `rewriters` are streamed through their function
+    (fn(src_stream, dst_stream)); members in `drop` are left out; every
+    other member is copied unchanged (its compressed bytes, without
+    inflating and deflating again), keeping its name, order, timestamp
+    and compression type. Nothing is held in memory beyond the copy buffer.
+    When `dst_path` is `src_path` the file is replaced atomically.
+
+    Returns {'bytes_before': ..., 'bytes_after': ...} (file sizes on disk).
+    """
+    bytes_before = os.path.getsize(src_path)
+    if os.path.abspath(src_path) == os.path.abspath(dst_path):
+        fd, tmp = tempfile.mkstemp(suffix='.xlsx', dir=os.path.dirname(os.path.abspath(dst_path)))
+        os.close(fd)
+        try:
+            _copy_package(src_path, tmp, rewriters, set(drop))
+            os.replace(tmp, dst_path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    else:
+        _copy_package(src_path, dst_path, rewriters, set(drop))
+
+    return {'bytes_before': bytes_before, 'bytes_after': os.path.getsize(dst_path)}
+
+
+def _copy_package(src_path: str, dst_path: str, rewriters, drop: Set[str]):
+    with zipfile.ZipFile(src_path, 'r') as zin, open(src_path, 'rb') as raw, \
+            zipfile.ZipFile(dst_path, 'w', zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            if info.filename in drop:
+                continue
+            rewriter = rewriters.get(info.filename)
+            if rewriter is None and not info.flag_bits & 0x1:
+                _copy_raw(raw, zout, info)
+                continue
+            out_info = zipfile.ZipInfo(info.filename, info.date_time)
+            out_info.compress_type = info.compress_type
+            out_info.external_attr = info.external_attr
+            big = info.file_size > (1 << 30)
+            with zin.open(info) as src, zout.open(out_info, 'w', force_zip64=big) as dst:
+                if rewriter is None:
+                    shutil.copyfileobj(src, dst, COPY_BUFFER)
+                else:
+                    rewriter(src, dst)
+
+
+def _copy_raw(raw: IO[bytes], zout: zipfile.ZipFile, info: zipfile.ZipInfo):
+    """Append `info` to `zout` with its compressed data copied as stored."""
+    raw.seek(info.header_offset)
+    header = raw.read(30)
+    if header[:4] != b'PK\x03\x04':
+        raise zipfile.BadZipFile(f'Bad local header for {info.filename}')
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    raw.seek(name_length + extra_length, os.SEEK_CUR)
+
+    out_info = zipfile.ZipInfo(info.filename, info.date_time)
+    out_info.compress_type = info.compress_type
+    out_info.external_attr = info.external_attr
+    out_info.CRC = info.CRC
+    out_info.compress_size = info.compress_size
+    out_info.file_size = info.file_size
+    out_info.header_offset = zout.fp.tell()
+    zip64 = info.file_size > ZIP64_LIMIT or info.compress_size > ZIP64_LIMIT
+    zout.fp.write(out_info.FileHeader(zip64))
+    remaining = info.compress_size
+    while remaining:
+        chunk = raw.read(min(COPY_BUFFER, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f'Truncated data for {info.filename}')
+        zout.fp.write(chunk)
+        remaining -= len(chunk)
+    zout.filelist.append(out_info)
+    zout.NameToInfo[out_info.filename] = out_info
+    zout.start_dir = zout.fp.tell()
+
+
+class _ContentTypesRewriter(XmlRewriter):
+    def __init__(self, out: IO[bytes], removed: Set[str]):
+        super().__init__(out)
+        self.removed = {'/' + name for name in removed}
+
+    def start(self, name, attrs):
+        if local(name) == 'Override' and attrs.get('PartName') in self.removed:
+            return None
+        return attrs
+
+
+class _RelationshipsRewriter(XmlRewriter):
+    def __init__(self, out: IO[bytes], drop_ids: Set[str]):
+        super().__init__(out)
+        self.drop_ids = drop_ids
+
+    def start(self, name, attrs):
+        if local(name) == 'Relationship' and attrs.get('Id') in self.drop_ids:
+            return None
+        return attrs
+
+
+def content_types_rewriter(removed: Iterable[str]) -> Callable[[IO[bytes], IO[bytes]], None]:
+    """Rewriter for [Content_Types].xml dropping the Overrides of removed parts."""
+    removed = set(removed)
+    return lambda src, dst: _ContentTypesRewriter(dst, removed).rewrite(src)
+
+
+def relationships_rewriter(drop_ids: Iterable[str]) -> Callable[[IO[bytes], IO[bytes]], None]:
+    """Rewriter for a .rels part dropping the given relationship Ids."""
+    drop_ids = set(drop_ids)
+    return lambda src, dst: _RelationshipsRewriter(dst, drop_ids).rewrite(src)
+
+
+def source_part_of(rels_name: str) -> str:
+    """xl/worksheets/_rels/sheet1.xml.rels -> xl/worksheets/sheet1.xml ('' for _rels/.rels)"""
+    folder, name = posixpath.split(rels_name)
+    return posixpath.join(posixpath.dirname(folder), name[:-len('.rels')]).lstrip('/')
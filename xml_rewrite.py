@@ -0,0 +1,194 @@
+"""xml_rewrite.py
+Streaming XML pass-through used by the package-level cleanups.
+
+XmlRewriter feeds a part through expat and writes every event straight
+back out, so only the element being looked at is ever held in memory.
+Subclasses override the hooks to change attributes or drop subtrees:
+
+    class Remap(XmlRewriter):
+        def start(self, name, attrs):
+            if name == 'c' and 's' in attrs:
+                attrs['s'] = mapping[attrs['s']]
+            return attrs
+
+Names are passed exactly as written in the document (no namespace
+processing), so prefixes and xmlns declarations survive untouched.
+"""
+from typing import Dict, IO, Optional
+from xml.parsers import expat
+
+CHUNK_SIZE = 1 << 16
+
+_TEXT_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '\r': '&#13;'})
+_ATTR_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;',
+                               '\r': '&#13;', '\n': '&#10;', '\t': '&#9;'})
+
+
+def escape_text(data: str) -> str:
+    return data.translate(_TEXT_ESCAPES)
+
+
+def escape_attr(data: str) -> str:
+    return data.translate(_ATTR_ESCAPES)
+
+
+def local(name: str) -> str:
+    """'x:c' -> 'c'"""
+    return name.rpartition(':')[2]
+
+
+class XmlRewriter:
+    """
+    Hooks (all optional):
+      start(name, attrs)  -> attrs to write, or None to drop the element
+                             together with everything inside it
+      end(name)           -> called for every element that was kept,
+                             before its end tag is written
+      closed(name)        -> called right after the end tag was written
+      text(data)          -> replacement character data (None drops it)
+
+    begin_capture()/end_capture() divert the output into a string so a
+    subclass can decide afterwards whether to keep a (small) subtree.
+
+    self.path holds the local names of the enclosing kept elements
+    (the current element is included in end()/closed(), not in start()).
+    """
+
+    def __init__(self, out: IO[bytes]):
+        self.out = out
+        self._buf = []
+        self._size = 0
+        self._pending_close = False
+        self._skip_depth = 0
+        self._captures = []
+        self.path = []  # local names of the open (kept) elements
+
+    # ---- hooks -------------------------------------------------------
+    def start(self, name: str, attrs: Dict[str, str]) -> Optional[Dict[str, str]]:
+        return attrs
+
+    def end(self, name: str):
+        pass
+
+    def closed(self, name: str):
+        pass
+
+    def text(self, data: str) -> Optional[str]:
+        return data
+
+    # ---- output ------------------------------------------------------
+    def _target(self) -> list:
+        return self._captures[-1] if self._captures else self._buf
+
+    def write(self, s: str):
+        target = self._target()
+        if self._pending_close:
+            self._pending_close = False
+            target.append('>')
+        target.append(s)
+        if self._captures:
+            return
+        self._size += len(s)
+        if self._size >= CHUNK_SIZE:
+            self.flush()
+
+    def begin_capture(self):
+        if self._pending_close:
+            self._pending_close = False
+            self._target().append('>')
+        self._captures.append([])
+
+    def end_capture(self) -> str:
+        if self._pending_close:
+            self._pending_close = False
+            self._target().append('>')
+        return ''.join(self._captures.pop())
+
+    def flush(self):
+        # a pending open tag is written without its '>'; the next event
+        # still decides between '>' and '/>'
+        self.out.write(''.join(self._buf).encode('utf-8'))
+        self._buf = []
+        self._size = 0
+
+    def write_start(self, name: str, attrs: Dict[str, str]):
+        parts = ['<', name]
+        for k, v in attrs.items():
+            parts.append(f' {k}="{escape_attr(v)}"')
+        self.write(''.join(parts))
+        self._pending_close = True
+
+    def write_end(self, name: str):
+        if self._pending_close:
+            self._pending_close = False
+            self._target().append('/>')
+        else:
+            self.write(f'</{name}>')
+
+    def write_element(self, name: str, attrs: Dict[str, str], text: str = ''):
+        """Emit a complete element (used by subclasses to inject content)."""
+        self.write_start(name, attrs)
+        if text:
+            self.write(escape_text(text))
+        self.write_end(name)
+
+    # ---- expat callbacks --------------------------------------------
+    def _on_decl(self, version, encoding, standalone):
+        decl = f'<?xml version="{version or "1.0"}" encoding="UTF-8"'
+        if standalone == 1:
+            decl += ' standalone="yes"'
+        elif standalone == 0:
+            decl += ' standalone="no"'
+        self.write(decl + '?>\r\n')
+
+    def _on_start(self, name, attrs):
+        if self._skip_depth:
+            self._skip_depth += 1
+            return
+        kept = self.start(name, attrs)
+        if kept is None:
+            self._skip_depth = 1
+            return
+        self.path.append(local(name))
+        self.write_start(name, kept)
+
+    def _on_end(self, name):
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+        self.end(name)
+        self.write_end(name)
+        self.closed(name)
+        self.path.pop()
+
+    def _on_text(self, data):
+        if self._skip_depth:
+            return
+        data = self.text(data)
+        if data:
+            self.write(escape_text(data))
+
+    def _on_comment(self, data):
+        if not self._skip_depth:
+            self.write(f'<!--{data}-->')
+
+    def _on_pi(self, target, data):
+        if not self._skip_depth:
+            self.write(f'<?{target} {data}?>')
+
+    def rewrite(self, source: IO[bytes]):
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.XmlDeclHandler = self._on_decl
+        parser.StartElementHandler = self._on_start
+        parser.EndElementHandler = self._on_end
+        parser.CharacterDataHandler = self._on_text
+        parser.CommentHandler = self._on_comment
+        parser.ProcessingInstructionHandler = self._on_pi
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.Parse(chunk, False)
+        parser.Parse(b'', True)
+        self.flush()